@@ -0,0 +1,127 @@
+'''
+Пропускная способность начислений при параллельной нагрузке: прежний upsert
+горячей строки user_balance (ON CONFLICT DO UPDATE на каждое начисление) против
+append_entries в balance_journal. Начисления идут из --workers потоков на --users
+пользователей, так что на одну строку баланса приходится много одновременных записей.
+
+Запуск против тестовой базы (использует служебные user_id и удаляет свои строки):
+    DATABASE_URL=postgres://... python bench_accruals.py --accruals 20000 --workers 32 --users 10
+'''
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import Any, Callable, Dict, List
+
+BENCH_SOURCE = 'bench'
+# Диапазон user_id, в котором нет настоящих пользователей
+BENCH_USER_BASE = 2_000_000_000
+
+UPSERT_SQL = '''
+    INSERT INTO t_p1573360_game_store_platform.user_balance (user_id, cashback_balance)
+    VALUES (%s, %s)
+    ON CONFLICT (user_id) DO UPDATE
+    SET cashback_balance = t_p1573360_game_store_platform.user_balance.cashback_balance + EXCLUDED.cashback_balance,
+        updated_at = CURRENT_TIMESTAMP
+'''
+
+
+def run_path(db: Any, accrue: Callable[[Any, int], None], user_ids: List[int],
+             accruals: int, workers: int) -> Dict[str, Any]:
+    def one(n: int) -> float:
+        conn = db.getconn(autocommit=True)
+        try:
+            with conn.cursor() as cur:
+                started = time.perf_counter()
+                accrue(cur, user_ids[n % len(user_ids)])
+                return (time.perf_counter() - started) * 1000
+        finally:
+            db.putconn(conn)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        latencies = sorted(pool.map(one, range(accruals)))
+    elapsed = time.perf_counter() - started
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'accruals_per_s': round(accruals / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies), 2),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 2),
+        'max_ms': round(latencies[-1], 2)
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--accruals', type=int, default=20000)
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--users', type=int, default=10)
+    args = parser.parse_args()
+
+    # Пул должен вмещать все потоки, иначе замер включал бы ожидание соединения
+    os.environ['DB_POOL_MAX_SIZE'] = str(args.workers)
+    os.environ.setdefault('DB_POOL_WAIT_TIMEOUT', '30')
+    import db
+    from ledger import append_entries
+
+    user_ids = [BENCH_USER_BASE + i for i in range(args.users)]
+    amount = Decimal('1.00')
+
+    def upsert(cur: Any, user_id: int) -> None:
+        cur.execute(UPSERT_SQL, (user_id, amount))
+
+    def append(cur: Any, user_id: int) -> None:
+        append_entries(cur, [(user_id, amount, 0, BENCH_SOURCE, None)])
+
+    try:
+        before = run_path(db, upsert, user_ids, args.accruals, args.workers)
+        after = run_path(db, append, user_ids, args.accruals, args.workers)
+
+        conn = db.getconn(autocommit=True)
+        try:
+            with conn.cursor() as cur:
+                cur.execute('''
+                    SELECT COALESCE(SUM(cashback_balance), 0) FROM t_p1573360_game_store_platform.user_balance
+                    WHERE user_id = ANY(%s)
+                ''', (user_ids,))
+                upsert_total = cur.fetchone()[0]
+                cur.execute('''
+                    SELECT COALESCE(SUM(cashback_delta), 0) FROM t_p1573360_game_store_platform.balance_journal
+                    WHERE user_id = ANY(%s) AND source = %s
+                ''', (user_ids, BENCH_SOURCE))
+                journal_total = cur.fetchone()[0]
+        finally:
+            db.putconn(conn)
+    finally:
+        conn = db.getconn(autocommit=True)
+        try:
+            with conn.cursor() as cur:
+                cur.execute('DELETE FROM t_p1573360_game_store_platform.balance_journal WHERE user_id = ANY(%s)',
+                            (user_ids,))
+                cur.execute('DELETE FROM t_p1573360_game_store_platform.user_balance WHERE user_id = ANY(%s)',
+                            (user_ids,))
+        finally:
+            db.putconn(conn)
+
+    expected = amount * args.accruals
+    print(json.dumps({
+        'accruals': args.accruals,
+        'workers': args.workers,
+        'users': args.users,
+        'upsert_user_balance': before,
+        'append_journal': after,
+        'speedup': round(after['accruals_per_s'] / before['accruals_per_s'], 2)
+    }, indent=2))
+
+    ok = upsert_total == expected and journal_total == expected
+    print('OK' if ok else f'FAIL: expected {expected}, upsert {upsert_total}, journal {journal_total}')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,13 +1,83 @@
+import hmac
 import json
 import os
-import psycopg2
-from typing import Dict, Any
+import time
+import db
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Dict, Any, List, Optional, Tuple
+from ledger import append_entries, bulk_accrue, compact, get_balance
+
+COMPACT_MAX_ENTRIES = int(os.environ.get('CASHBACK_COMPACT_MAX_ENTRIES', 500000))
+BULK_BATCH_SIZE = int(os.environ.get('CASHBACK_BULK_BATCH_SIZE', 10000))
+MAX_BULK_ROWS = 200000
+MAX_REPORTED_ERRORS = 20
+SERVICE_TOKEN = os.environ.get('SERVICE_TOKEN', '')
+
+# Границы колонок balance_journal: всё, что не влезет в COPY, отсекается до первой порции
+MAX_REFERENCE_LENGTH = 100
+MAX_AMOUNT = Decimal('99999999.99')
+MAX_INT = 2 ** 31 - 1
+
+
+def is_service_call(event: Dict[str, Any]) -> bool:
+    '''
+    Служебный вызов (свёртка журнала, пакетное начисление): X-Service-Token совпадает с SERVICE_TOKEN.
+    Без настроенного токена служебные действия закрыты.
+    '''
+    headers = event.get('headers') or {}
+    token = headers.get('X-Service-Token') or headers.get('x-service-token') or ''
+    return bool(SERVICE_TOKEN) and hmac.compare_digest(token, SERVICE_TOKEN)
+
+
+def parse_accruals(body: str, content_type: str) -> Tuple[List[Tuple[int, Decimal, int, Optional[str]]], List[str]]:
+    '''
+    Разбирает начисления {user_id, amount, bonus?, order_id?}: JSON-массив, {"entries": [...]}
+    или NDJSON (Content-Type application/x-ndjson, по объекту на строку).
+    Возвращает строки для bulk_accrue и ошибки валидации с номерами записей.
+    '''
+    if 'ndjson' in content_type:
+        items = [(n, line) for n, line in enumerate(body.splitlines(), 1) if line.strip()]
+        decoded = []
+        for n, line in items:
+            try:
+                decoded.append((n, json.loads(line)))
+            except ValueError:
+                decoded.append((n, None))
+    else:
+        data = json.loads(body or '[]')
+        entries = data.get('entries', []) if isinstance(data, dict) else data
+        decoded = list(enumerate(entries, 1))
+
+    rows = []
+    errors = []
+    for n, item in decoded:
+        try:
+            user_id = int(item['user_id'])
+            amount = Decimal(str(item.get('amount', 0))).quantize(Decimal('0.01'), ROUND_HALF_UP)
+            bonus = int(item.get('bonus', 0))
+            reference = item.get('order_id')
+            reference = str(reference) if reference is not None else None
+            if not 0 < user_id <= MAX_INT or not amount.is_finite() or (amount == 0 and bonus == 0):
+                raise ValueError
+            if abs(amount) > MAX_AMOUNT or abs(bonus) > MAX_INT:
+                raise ValueError
+            if reference is not None and len(reference) > MAX_REFERENCE_LENGTH:
+                errors.append(f'entry {n}: order_id longer than {MAX_REFERENCE_LENGTH} characters')
+                continue
+            rows.append((user_id, amount, bonus, reference))
+        except (TypeError, KeyError, ValueError, InvalidOperation, AttributeError):
+            errors.append(f'entry {n}: expected {{user_id, amount, bonus?, order_id?}}')
+    return rows, errors
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Управление кешбэком и бонусными баллами пользователя
-    Args: event с httpMethod (GET/POST), headers (X-User-Id), body
-    Returns: HTTP response с балансом кешбэка и бонусов
+    Args: event с httpMethod (GET/POST), headers (X-User-Id), body;
+          POST с action=compact в query и X-Service-Token - свёртка журнала начислений в снапшоты,
+          POST с action=bulk_accrue в query и X-Service-Token - пакетное начисление по заказам
+          (JSON-массив или NDJSON)
+    Returns: HTTP response с балансом кешбэка и бонусов (снапшот + хвост журнала)
     '''
     method: str = event.get('httpMethod', 'GET')
     
@@ -23,6 +93,93 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': ''
         }
     
+    params = event.get('queryStringParameters') or {}
+    
+    if method == 'POST' and params.get('action') == 'compact':
+        # Свёртка берёт SHARE ROW EXCLUSIVE на журнал и на это время останавливает начисления
+        if not is_service_call(event):
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Forbidden'})
+            }
+        
+        conn = db.getconn()
+        try:
+            result = compact(conn, COMPACT_MAX_ENTRIES)
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'isBase64Encoded': False,
+                'body': json.dumps(result)
+            }
+        except Exception as e:
+            return {
+                'statusCode': 500,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': str(e)})
+            }
+        finally:
+            db.putconn(conn)
+    
+    if method == 'POST' and params.get('action') == 'bulk_accrue':
+        if not is_service_call(event):
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Forbidden'})
+            }
+        
+        started = time.perf_counter()
+        headers = event.get('headers') or {}
+        content_type = headers.get('content-type') or headers.get('Content-Type') or ''
+        try:
+            rows, errors = parse_accruals(event.get('body') or '', content_type)
+        except ValueError:
+            rows, errors = [], ['body must be a JSON array, {"entries": [...]} or NDJSON']
+        
+        if errors or not rows or len(rows) > MAX_BULK_ROWS:
+            if not errors:
+                errors = [f'expected 1 to {MAX_BULK_ROWS} entries']
+            return {
+                'statusCode': 400,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': json.dumps({'error': 'Invalid entries', 'details': errors[:MAX_REPORTED_ERRORS]})
+            }
+        
+        conn = db.getconn()
+        try:
+            batches = bulk_accrue(conn, rows, BULK_BATCH_SIZE)
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'isBase64Encoded': False,
+                'body': json.dumps({
+                    'rows': len(rows),
+                    'inserted': sum(batch['inserted'] for batch in batches),
+                    'duplicates': sum(batch['duplicates'] for batch in batches),
+                    'batches': batches,
+                    'total_ms': round((time.perf_counter() - started) * 1000, 1)
+                })
+            }
+        except Exception as e:
+            return {
+                'statusCode': 500,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': str(e)})
+            }
+        finally:
+            db.putconn(conn)
+    
     headers = event.get('headers', {})
     user_id = headers.get('x-user-id') or headers.get('X-User-Id')
     
@@ -33,34 +190,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'X-User-Id header required'})
         }
     
-    dsn = os.environ.get('DATABASE_URL', '')
-    conn = psycopg2.connect(dsn)
-    conn.autocommit = True
+    conn = db.getconn(autocommit=True)
     cursor = conn.cursor()
     
     try:
         if method == 'GET':
-            cursor.execute('''
-                INSERT INTO t_p1573360_game_store_platform.user_balance (user_id)
-                VALUES (%s)
-                ON CONFLICT (user_id) DO NOTHING
-            ''', (user_id,))
-            
-            cursor.execute('''
-                SELECT cashback_balance, bonus_points, updated_at
-                FROM t_p1573360_game_store_platform.user_balance
-                WHERE user_id = %s
-            ''', (user_id,))
-            
-            row = cursor.fetchone()
-            result = {
-                'cashback_balance': float(row[0]) if row and row[0] else 0,
-                'bonus_points': row[1] if row else 0,
-                'updated_at': row[2].isoformat() if row and row[2] else None
-            }
+            result = get_balance(cursor, int(user_id))
             
             cursor.close()
-            conn.close()
+            db.putconn(conn)
             
             return {
                 'statusCode': 200,
@@ -76,27 +214,16 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             body_data = json.loads(event.get('body', '{}'))
             action = body_data.get('action')
             amount = body_data.get('amount', 0)
+            reference = body_data.get('reference')
             
             if action == 'add_cashback':
-                cursor.execute('''
-                    INSERT INTO t_p1573360_game_store_platform.user_balance (user_id, cashback_balance)
-                    VALUES (%s, %s)
-                    ON CONFLICT (user_id) DO UPDATE
-                    SET cashback_balance = t_p1573360_game_store_platform.user_balance.cashback_balance + EXCLUDED.cashback_balance,
-                        updated_at = CURRENT_TIMESTAMP
-                ''', (user_id, amount))
+                append_entries(cursor, [(int(user_id), amount, 0, 'add_cashback', reference)])
             
             elif action == 'add_bonus':
-                cursor.execute('''
-                    INSERT INTO t_p1573360_game_store_platform.user_balance (user_id, bonus_points)
-                    VALUES (%s, %s)
-                    ON CONFLICT (user_id) DO UPDATE
-                    SET bonus_points = t_p1573360_game_store_platform.user_balance.bonus_points + EXCLUDED.bonus_points,
-                        updated_at = CURRENT_TIMESTAMP
-                ''', (user_id, int(amount)))
+                append_entries(cursor, [(int(user_id), 0, int(amount), 'add_bonus', reference)])
             
             cursor.close()
-            conn.close()
+            db.putconn(conn)
             
             return {
                 'statusCode': 200,
@@ -109,7 +236,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
         
         cursor.close()
-        conn.close()
+        db.putconn(conn)
         return {
             'statusCode': 405,
             'headers': {'Access-Control-Allow-Origin': '*'},
@@ -120,7 +247,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if cursor:
             cursor.close()
         if conn:
-            conn.close()
+            db.putconn(conn)
         return {
             'statusCode': 500,
             'headers': {'Access-Control-Allow-Origin': '*'},
@@ -0,0 +1,160 @@
+'''
+Журнал кешбэка и бонусов: начисления только добавляются в balance_journal,
+user_balance хранит снапшот, в который свёрнуты записи журнала с id <= journal_id.
+Баланс = снапшот + хвост журнала после journal_id; хвост сворачивает compact().
+Пакетные начисления (bulk_accrue) идут через COPY во временную таблицу и один INSERT ... SELECT.
+'''
+
+import csv
+import io
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from psycopg2.extras import execute_values
+
+SCHEMA = 't_p1573360_game_store_platform'
+
+Entry = Tuple[int, float, int, str, Optional[str]]
+
+APPEND_SQL = f'''
+    INSERT INTO {SCHEMA}.balance_journal (user_id, cashback_delta, bonus_delta, source, reference)
+    VALUES %s
+'''
+
+BALANCE_SQL = f'''
+    SELECT COALESCE(b.cashback_balance, 0) + COALESCE(t.cashback, 0),
+           COALESCE(b.bonus_points, 0) + COALESCE(t.bonus, 0),
+           GREATEST(b.updated_at, t.last_at)
+    FROM (SELECT %(user_id)s::int AS user_id) u
+    LEFT JOIN {SCHEMA}.user_balance b ON b.user_id = u.user_id
+    LEFT JOIN LATERAL (
+        SELECT SUM(j.cashback_delta) AS cashback, SUM(j.bonus_delta) AS bonus, MAX(j.created_at) AS last_at
+        FROM {SCHEMA}.balance_journal j
+        WHERE j.user_id = u.user_id AND j.id > COALESCE(b.journal_id, 0)
+    ) t ON TRUE
+'''
+
+FOLD_SQL = f'''
+    INSERT INTO {SCHEMA}.user_balance (user_id, cashback_balance, bonus_points, journal_id, updated_at)
+    SELECT user_id, SUM(cashback_delta), SUM(bonus_delta), MAX(id), MAX(created_at)
+    FROM {SCHEMA}.balance_journal
+    WHERE id > %(from_id)s AND id <= %(to_id)s
+    GROUP BY user_id
+    ON CONFLICT (user_id) DO UPDATE
+    SET cashback_balance = user_balance.cashback_balance + EXCLUDED.cashback_balance,
+        bonus_points = user_balance.bonus_points + EXCLUDED.bonus_points,
+        journal_id = EXCLUDED.journal_id,
+        updated_at = EXCLUDED.updated_at
+    WHERE user_balance.journal_id < EXCLUDED.journal_id
+'''
+
+BULK_SOURCE = 'settlement'
+
+CREATE_STAGING_SQL = '''
+    CREATE TEMP TABLE IF NOT EXISTS cashback_staging (
+        user_id INTEGER NOT NULL,
+        cashback_delta DECIMAL(10,2) NOT NULL,
+        bonus_delta INTEGER NOT NULL,
+        reference VARCHAR(100)
+    ) ON COMMIT DELETE ROWS
+'''
+
+MERGE_STAGING_SQL = f'''
+    INSERT INTO {SCHEMA}.balance_journal (user_id, cashback_delta, bonus_delta, source, reference)
+    SELECT user_id, cashback_delta, bonus_delta, '{BULK_SOURCE}', reference
+    FROM cashback_staging
+    ON CONFLICT (reference) WHERE source = '{BULK_SOURCE}' AND reference IS NOT NULL DO NOTHING
+'''
+
+
+def append_entries(cur: Any, entries: List[Entry], page_size: int = 1000) -> None:
+    '''
+    Пакетная вставка записей (user_id, cashback_delta, bonus_delta, source, reference).
+    Горячей строки нет: параллельные начисления одному пользователю не ждут друг друга.
+    '''
+    execute_values(cur, APPEND_SQL, entries, page_size=page_size)
+
+
+def bulk_accrue(conn: Any, rows: List[Tuple[int, Any, int, Optional[str]]],
+                batch_size: int) -> List[Dict[str, Any]]:
+    '''
+    Начисляет (user_id, cashback, bonus, reference) порциями по batch_size:
+    COPY во временную таблицу, затем один INSERT ... SELECT в журнал, коммит на порцию.
+    Повтор заказа с тем же reference пропускается (уникальный индекс по settlement-записям),
+    поэтому прерванный расчёт можно безопасно отправить заново. Возвращает тайминги порций.
+    '''
+    batches = []
+    with conn.cursor() as cur:
+        cur.execute(CREATE_STAGING_SQL)
+        for offset in range(0, len(rows), batch_size):
+            batch = rows[offset:offset + batch_size]
+            started = time.perf_counter()
+
+            buffer = io.StringIO()
+            csv.writer(buffer, lineterminator='\n').writerows(
+                (user_id, cashback, bonus, reference if reference is not None else '')
+                for user_id, cashback, bonus, reference in batch
+            )
+            buffer.seek(0)
+            cur.copy_expert(
+                'COPY cashback_staging (user_id, cashback_delta, bonus_delta, reference) FROM STDIN WITH (FORMAT csv)',
+                buffer
+            )
+            copied = time.perf_counter()
+
+            cur.execute(MERGE_STAGING_SQL)
+            inserted = cur.rowcount
+            conn.commit()
+            finished = time.perf_counter()
+
+            batches.append({
+                'rows': len(batch),
+                'inserted': inserted,
+                'duplicates': len(batch) - inserted,
+                'copy_ms': round((copied - started) * 1000, 1),
+                'merge_ms': round((finished - copied) * 1000, 1)
+            })
+    return batches
+
+
+def get_balance(cur: Any, user_id: int) -> Dict[str, Any]:
+    cur.execute(BALANCE_SQL, {'user_id': user_id})
+    cashback, bonus, updated_at = cur.fetchone()
+    return {
+        'cashback_balance': float(cashback),
+        'bonus_points': int(bonus),
+        'updated_at': updated_at.isoformat() if updated_at else None
+    }
+
+
+def compact(conn: Any, max_entries: int) -> Dict[str, Any]:
+    '''
+    Сворачивает до max_entries записей хвоста в снапшоты. Граница берётся под
+    кратковременной SHARE ROW EXCLUSIVE блокировкой журнала: она дожидается
+    незакоммиченных вставок, поэтому все id <= границы уже видны и ни одна
+    запись не проскочит мимо снапшота из-за порядка коммитов.
+    '''
+    with conn.cursor() as cur:
+        cur.execute(f'''
+            SELECT folded_until FROM {SCHEMA}.balance_journal_state WHERE id = 1 FOR UPDATE
+        ''')
+        from_id = cur.fetchone()[0]
+        cur.execute(f'LOCK TABLE {SCHEMA}.balance_journal IN SHARE ROW EXCLUSIVE MODE')
+        cur.execute(f'SELECT COALESCE(MAX(id), 0) FROM {SCHEMA}.balance_journal')
+        to_id = min(cur.fetchone()[0], from_id + max_entries)
+        conn.commit()
+
+        cur.execute(f'''
+            SELECT folded_until FROM {SCHEMA}.balance_journal_state WHERE id = 1 FOR UPDATE
+        ''')
+        from_id = cur.fetchone()[0]
+        users = 0
+        if to_id > from_id:
+            cur.execute(FOLD_SQL, {'from_id': from_id, 'to_id': to_id})
+            users = cur.rowcount
+            cur.execute(
+                f'UPDATE {SCHEMA}.balance_journal_state SET folded_until = %s WHERE id = 1',
+                (to_id,)
+            )
+        conn.commit()
+
+    return {'folded_from': from_id, 'folded_to': max(to_id, from_id), 'users': users}
@@ -0,0 +1,159 @@
+'''
+Архив чатов: сообщения закрытых и давно неактивных сессий переносятся из горячей
+chat_messages в chat_archive - один gzip-сжатый JSON-массив на сессию.
+Строка сессии остаётся в chat_sessions (archived_through), чтения склеивают архив
+и горячий хвост. Сессия, в которую написали после архивации, снова попадает
+в кандидаты, и новые сообщения дописываются в тот же архив.
+'''
+
+import gzip
+import json
+import time
+from typing import Any, Dict, List
+from psycopg2 import Binary
+from psycopg2.extras import RealDictCursor, execute_values
+
+CANDIDATES_SQL = '''
+    SELECT id FROM chat_sessions
+    WHERE updated_at < CURRENT_TIMESTAMP - %(closed_days)s * INTERVAL '1 day'
+      AND (status = 'closed' OR updated_at < CURRENT_TIMESTAMP - %(idle_days)s * INTERVAL '1 day')
+      AND (archived_through IS NULL OR updated_at > archived_through)
+    ORDER BY updated_at
+    LIMIT %(limit)s
+    FOR UPDATE SKIP LOCKED
+'''
+
+UPSERT_ARCHIVE_SQL = '''
+    INSERT INTO chat_archive (session_id, message_count, last_message_id, payload)
+    VALUES %s
+    ON CONFLICT (session_id) DO UPDATE
+    SET message_count = EXCLUDED.message_count,
+        last_message_id = EXCLUDED.last_message_id,
+        payload = EXCLUDED.payload,
+        archived_at = CURRENT_TIMESTAMP
+'''
+
+# Удаляются только заархивированные id: сообщение из ещё не закоммиченной
+# send_message останется в горячей таблице и уйдёт в архив следующим прогоном
+DELETE_ARCHIVED_SQL = '''
+    DELETE FROM chat_messages m
+    USING unnest(%s::int[], %s::int[]) AS a(session_id, last_id)
+    WHERE m.session_id = a.session_id AND m.id <= a.last_id
+'''
+
+TABLE_SIZES_SQL = '''
+    SELECT pg_total_relation_size('chat_messages') AS chat_messages,
+           pg_total_relation_size('chat_archive') AS chat_archive
+'''
+
+
+def pack(messages: List[Dict[str, Any]]) -> bytes:
+    return gzip.compress(json.dumps(messages, default=str, ensure_ascii=False, separators=(',', ':')).encode())
+
+
+def unpack(payload: Any) -> List[Dict[str, Any]]:
+    return json.loads(gzip.decompress(bytes(payload)))
+
+
+def archived_messages(cur: Any, session_id: int, since_id: int = 0) -> List[Dict[str, Any]]:
+    '''
+    Сообщения сессии из архива с id > since_id. Для горячих сессий это один
+    промах по первичному ключу; payload читается, только если в архиве есть что отдать.
+    '''
+    cur.execute(
+        "SELECT payload FROM chat_archive WHERE session_id = %s AND last_message_id > %s",
+        (session_id, since_id)
+    )
+    row = cur.fetchone()
+    if not row:
+        return []
+    return [m for m in unpack(row['payload']) if m['id'] > since_id]
+
+
+def archive_batch(cur: Any, session_ids: List[int]) -> Dict[str, int]:
+    cur.execute(
+        "SELECT session_id, payload FROM chat_archive WHERE session_id = ANY(%s)",
+        (session_ids,)
+    )
+    sessions: Dict[int, List[Dict[str, Any]]] = {
+        row['session_id']: unpack(row['payload']) for row in cur.fetchall()
+    }
+    repacked = sum(len(messages) for messages in sessions.values())
+
+    cur.execute(
+        "SELECT * FROM chat_messages WHERE session_id = ANY(%s) ORDER BY session_id, id",
+        (session_ids,)
+    )
+    moved = 0
+    for message in cur.fetchall():
+        sessions.setdefault(message['session_id'], []).append(dict(message))
+        moved += 1
+
+    if sessions:
+        execute_values(cur, UPSERT_ARCHIVE_SQL, [
+            (session_id, len(messages), messages[-1]['id'], Binary(pack(messages)))
+            for session_id, messages in sessions.items()
+        ], page_size=100)
+        last_ids = {session_id: messages[-1]['id'] for session_id, messages in sessions.items()}
+        cur.execute(DELETE_ARCHIVED_SQL, (list(last_ids), list(last_ids.values())))
+        # Архивная переписка не должна висеть непрочитанной во входящих оператора
+        cur.execute('''
+            UPDATE chat_sessions s
+            SET last_read_message_id = GREATEST(s.last_read_message_id, a.last_id)
+            FROM unnest(%s::int[], %s::int[]) AS a(session_id, last_id)
+            WHERE s.id = a.session_id
+        ''', (list(last_ids), list(last_ids.values())))
+
+    # Отметка - updated_at самой сессии, а не время прогона: send_message, ждавшая
+    # блокировку, выставит NOW() своей транзакции, и сессия снова станет кандидатом
+    cur.execute(
+        "UPDATE chat_sessions SET archived_through = updated_at WHERE id = ANY(%s)",
+        (session_ids,)
+    )
+    return {'sessions': len(session_ids), 'messages': moved, 'repacked': repacked}
+
+
+def archive_sessions(conn: Any, closed_days: float, idle_days: float,
+                     batch_size: int, time_budget: float) -> Dict[str, Any]:
+    '''
+    Архивирует закрытые сессии старше closed_days и любые сессии без активности
+    дольше idle_days порциями по batch_size, каждая порция - своя транзакция.
+    Строки сессий берутся FOR UPDATE SKIP LOCKED: параллельный прогон возьмёт другие,
+    а send_message в архивируемую сессию дождётся коммита порции.
+    '''
+    started = time.monotonic()
+    totals = {'sessions': 0, 'messages': 0, 'repacked': 0, 'batches': 0}
+    done = False
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(TABLE_SIZES_SQL)
+        sizes_before = dict(cur.fetchone())
+        conn.commit()
+
+        while time.monotonic() - started < time_budget:
+            cur.execute(CANDIDATES_SQL, {
+                'closed_days': closed_days,
+                'idle_days': idle_days,
+                'limit': batch_size
+            })
+            session_ids = [row['id'] for row in cur.fetchall()]
+            if not session_ids:
+                conn.commit()
+                done = True
+                break
+            batch = archive_batch(cur, session_ids)
+            conn.commit()
+            totals['batches'] += 1
+            for key, value in batch.items():
+                totals[key] += value
+
+        cur.execute(TABLE_SIZES_SQL)
+        sizes_after = dict(cur.fetchone())
+        conn.commit()
+
+    return {
+        **totals,
+        'done': done,
+        'elapsed_ms': round((time.monotonic() - started) * 1000, 1),
+        'table_bytes_before': sizes_before,
+        'table_bytes_after': sizes_after
+    }
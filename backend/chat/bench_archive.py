@@ -0,0 +1,135 @@
+'''
+Бенчмарк архивации чатов: латентность чтения истории и страницы входящих
+с unread_count до и после переноса старых сессий в chat_archive, плюс размеры таблиц.
+Заполняет чаты синтетическими сессиями (большая часть - закрытые и старые),
+меряет запросы, гоняет archive_sessions() до конца и меряет их снова.
+
+Только для одноразовой базы: chat_sessions, chat_messages и chat_archive очищаются.
+    BENCH_DATABASE_URL=postgres://... python bench_archive.py --truncate --sessions 50000 --messages 40
+'''
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+import archive
+from index import fetch_inbox_page, fetch_messages_since
+
+TABLES = ('chat_sessions', 'chat_messages', 'chat_archive')
+
+
+def table_sizes(cur: Any) -> Dict[str, int]:
+    sizes = {}
+    for table in TABLES:
+        cur.execute('SELECT pg_total_relation_size(%s) AS size', (table,))
+        sizes[table] = cur.fetchone()['size']
+    return sizes
+
+
+def latency(run: Callable[[Any], Any], args: List[Any], repeats: int) -> Dict[str, float]:
+    timings = []
+    for n in range(repeats):
+        started = time.perf_counter()
+        run(args[n % len(args)])
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        'median_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(timings[int(len(timings) * 0.95) - 1], 2)
+    }
+
+
+def measure(cur: Any, active_ids: List[int], old_ids: List[int], repeats: int) -> Dict[str, Any]:
+    return {
+        'table_bytes': table_sizes(cur),
+        'history_active_ms': latency(lambda sid: fetch_messages_since(cur, sid, 0), active_ids, repeats),
+        'history_archived_ms': latency(lambda sid: fetch_messages_since(cur, sid, 0), old_ids, repeats),
+        'inbox_active_unread_ms': latency(lambda _: fetch_inbox_page(cur, 'active', 50, None), [None], repeats),
+        'inbox_all_unread_ms': latency(lambda _: fetch_inbox_page(cur, None, 50, None), [None], repeats)
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', type=int, default=50_000)
+    parser.add_argument('--messages', type=int, default=40, help='сообщений на сессию')
+    parser.add_argument('--active-share', type=float, default=0.1)
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--truncate', action='store_true', help='подтверждение очистки таблиц')
+    args = parser.parse_args()
+
+    dsn = os.environ.get('BENCH_DATABASE_URL')
+    if not dsn or not args.truncate:
+        print('Нужны BENCH_DATABASE_URL одноразовой базы и флаг --truncate', file=sys.stderr)
+        return 2
+
+    conn = psycopg2.connect(dsn)
+    result: Dict[str, Any] = {'sessions': args.sessions, 'messages_per_session': args.messages}
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute('TRUNCATE chat_archive, chat_messages, chat_sessions RESTART IDENTITY')
+        active = int(args.sessions * args.active_share)
+        # Первые active сессий - активные за последние сутки, остальные закрыты 2-365 дней назад
+        cur.execute('''
+            INSERT INTO chat_sessions (user_email, status, created_at, updated_at)
+            SELECT 'bench' || n || '@example.com',
+                   CASE WHEN n <= %(active)s THEN 'active' ELSE 'closed' END,
+                   ts - INTERVAL '1 hour', ts
+            FROM generate_series(1, %(sessions)s) n,
+                 LATERAL (SELECT CURRENT_TIMESTAMP - CASE WHEN n <= %(active)s
+                     THEN random() * INTERVAL '1 day'
+                     ELSE INTERVAL '2 days' + random() * INTERVAL '363 days' END AS ts) t
+        ''', {'active': active, 'sessions': args.sessions})
+        cur.execute('''
+            INSERT INTO chat_messages (session_id, sender, message_text, created_at)
+            SELECT s.id, CASE WHEN m % 2 = 0 THEN 'operator' ELSE 'user' END,
+                   repeat('сообщение ', 5 + (m % 20)),
+                   s.created_at + m * INTERVAL '1 minute'
+            FROM chat_sessions s, generate_series(1, %s) m
+            ORDER BY s.id, m
+        ''', (args.messages,))
+        cur.execute('''
+            UPDATE chat_sessions s
+            SET last_read_message_id = m.last_id
+            FROM (SELECT session_id, MAX(id) - 1 AS last_id FROM chat_messages GROUP BY session_id) m
+            WHERE m.session_id = s.id
+        ''')
+        conn.commit()
+        conn.autocommit = True
+        for table in TABLES:
+            cur.execute(f'VACUUM ANALYZE {table}')
+
+        active_ids = list(range(1, active + 1))[:args.repeats]
+        old_ids = list(range(active + 1, args.sessions + 1))[:args.repeats]
+        result['before'] = measure(cur, active_ids, old_ids, args.repeats)
+
+        conn.autocommit = False
+        started = time.perf_counter()
+        runs = 0
+        while True:
+            runs += 1
+            run = archive.archive_sessions(conn, 1, 30, 200, 60)
+            if run['done']:
+                break
+        result['archive'] = {'calls': runs, 'total_s': round(time.perf_counter() - started, 1)}
+
+        # VACUUM FULL возвращает место удалённых строк, иначе размер файла не изменится
+        conn.autocommit = True
+        for table in TABLES:
+            cur.execute(f'VACUUM FULL ANALYZE {table}')
+
+        result['after'] = measure(cur, active_ids, old_ids, args.repeats)
+    conn.close()
+
+    print(json.dumps(result, indent=2, default=str))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
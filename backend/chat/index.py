@@ -1,14 +1,161 @@
+import base64
+import hmac
 import json
 import os
+import select
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, Any
-import psycopg2
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 from psycopg2.extras import RealDictCursor
+import archive
+import db
+
+LONG_POLL_MAX_WAIT = float(os.environ.get('CHAT_LONG_POLL_MAX_WAIT', 25))
+SINCE_BATCH_LIMIT = 500
+DEFAULT_INBOX_PAGE_SIZE = 50
+MAX_INBOX_PAGE_SIZE = 200
+LEGACY_SESSIONS_LIMIT = int(os.environ.get('CHAT_LEGACY_SESSIONS_LIMIT', MAX_INBOX_PAGE_SIZE))
+ARCHIVE_CLOSED_DAYS = float(os.environ.get('CHAT_ARCHIVE_CLOSED_DAYS', 1))
+ARCHIVE_IDLE_DAYS = float(os.environ.get('CHAT_ARCHIVE_IDLE_DAYS', 30))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('CHAT_ARCHIVE_BATCH_SIZE', 200))
+ARCHIVE_TIME_BUDGET = float(os.environ.get('CHAT_ARCHIVE_TIME_BUDGET', 20))
+SERVICE_TOKEN = os.environ.get('SERVICE_TOKEN', '')
+
+
+def is_service_call(event: Dict[str, Any]) -> bool:
+    '''
+    Служебный вызов (планировщик архивации): X-Service-Token совпадает с SERVICE_TOKEN.
+    Без настроенного токена служебные действия закрыты.
+    '''
+    headers = event.get('headers') or {}
+    token = headers.get('X-Service-Token') or headers.get('x-service-token') or ''
+    return bool(SERVICE_TOKEN) and hmac.compare_digest(token, SERVICE_TOKEN)
+
+
+def session_channel(session_id: int) -> str:
+    return f'chat_session_{session_id}'
+
+
+@contextmanager
+def history_snapshot(cur: Any) -> Iterator[None]:
+    '''
+    Архив и горячая таблица читаются в одном снимке REPEATABLE READ: порция архивации,
+    закоммиченная между двумя SELECT, иначе унесла бы сообщения из обоих результатов.
+    Соединение должно быть в autocommit - транзакция открывается здесь явно.
+    '''
+    cur.execute('BEGIN ISOLATION LEVEL REPEATABLE READ READ ONLY')
+    try:
+        yield
+    finally:
+        cur.execute('COMMIT')
+
+
+def fetch_messages_since(cur: Any, session_id: int, since_id: int) -> List[Dict[str, Any]]:
+    '''
+    Первые SINCE_BATCH_LIMIT сообщений с id > since_id из архива и горячей таблицы.
+    '''
+    with history_snapshot(cur):
+        archived = archive.archived_messages(cur, session_id, since_id)
+        cur.execute(
+            "SELECT * FROM chat_messages WHERE session_id = %s AND id > %s ORDER BY id ASC LIMIT %s",
+            (session_id, since_id, SINCE_BATCH_LIMIT)
+        )
+        hot = cur.fetchall()
+    if not archived:
+        return hot
+    return sorted(archived + [dict(m) for m in hot], key=lambda m: m['id'])[:SINCE_BATCH_LIMIT]
+
+
+def wait_for_messages(conn: Any, cur: Any, session_id: int, since_id: int,
+                      wait: float) -> List[Dict[str, Any]]:
+    '''
+    Long-poll: подписка LISTEN оформляется до первого чтения, поэтому сообщение,
+    отправленное между чтением и ожиданием, не теряется. Соединение должно быть
+    в autocommit - уведомления доставляются только вне транзакции.
+    '''
+    channel = session_channel(session_id)
+    cur.execute(f'LISTEN {channel}')
+    try:
+        messages = fetch_messages_since(cur, session_id, since_id)
+        deadline = time.monotonic() + wait
+        while not messages:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or select.select([conn], [], [], remaining) == ([], [], []):
+                break
+            conn.poll()
+            if conn.notifies:
+                del conn.notifies[:]
+                messages = fetch_messages_since(cur, session_id, since_id)
+        return messages
+    finally:
+        cur.execute(f'UNLISTEN {channel}')
+        del conn.notifies[:]
+
+
+def encode_cursor(updated_at: datetime, session_id: int) -> str:
+    raw = f'{updated_at.isoformat()}|{session_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    updated_at, session_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(updated_at), int(session_id)
+
+
+def fetch_inbox_page(cur: Any, status: Optional[str], limit: int,
+                     after: Optional[Tuple[datetime, int]]) -> Dict[str, Any]:
+    '''
+    Keyset-страница сессий по (updated_at DESC, id DESC), с фильтром по статусу -
+    по индексу (status, updated_at DESC, id DESC). Непрочитанные (сообщения клиента
+    после last_read_message_id) считаются одним сгруппированным запросом на страницу.
+    '''
+    conditions: List[str] = []
+    args: List[Any] = []
+    if status:
+        conditions.append('status = %s')
+        args.append(status)
+    if after is not None:
+        conditions.append('(updated_at, id) < (%s, %s)')
+        args.extend(after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    cur.execute(f"""
+        SELECT * FROM chat_sessions
+        {where}
+        ORDER BY updated_at DESC, id DESC
+        LIMIT %s
+    """, args + [limit + 1])
+    sessions = [dict(s) for s in cur.fetchall()]
+    
+    next_cursor = None
+    if len(sessions) > limit:
+        sessions = sessions[:limit]
+        next_cursor = encode_cursor(sessions[-1]['updated_at'], sessions[-1]['id'])
+    
+    unread: Dict[int, int] = {}
+    if sessions:
+        cur.execute("""
+            SELECT m.session_id, COUNT(*) AS unread
+            FROM unnest(%s::int[], %s::int[]) AS r(session_id, last_read_id)
+            JOIN chat_messages m ON m.session_id = r.session_id AND m.id > r.last_read_id
+            WHERE m.sender = 'user'
+            GROUP BY m.session_id
+        """, ([s['id'] for s in sessions], [s['last_read_message_id'] for s in sessions]))
+        unread = {row['session_id']: row['unread'] for row in cur.fetchall()}
+    for session in sessions:
+        session['unread_count'] = unread.get(session['id'], 0)
+    
+    return {'sessions': sessions, 'next_cursor': next_cursor}
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: API для управления чатами с клиентами
     Args: event - dict с httpMethod, body, queryStringParameters
+          (session_id, since_id - только новые сообщения, wait - long-poll в секундах;
+          без session_id: status, limit, cursor - страница сессий с unread_count,
+          без параметров - массив последних CHAT_LEGACY_SESSIONS_LIMIT сессий;
+          POST с action=archive в query и X-Service-Token - перенос старых сессий в chat_archive)
           context - object с request_id, function_name
     Returns: HTTP response dict
     '''
@@ -35,7 +182,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'DATABASE_URL not configured'})
         }
     
-    conn = psycopg2.connect(dsn)
+    conn = db.getconn()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
@@ -43,12 +190,51 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             params = event.get('queryStringParameters') or {}
             session_id = params.get('session_id')
             
+            if session_id and ('since_id' in params or 'wait' in params):
+                try:
+                    since_id = int(params.get('since_id') or 0)
+                    wait = min(max(float(params.get('wait') or 0), 0), LONG_POLL_MAX_WAIT)
+                    session_id = int(session_id)
+                except ValueError:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'session_id, since_id and wait must be numeric'})
+                    }
+                
+                conn.autocommit = True
+                if wait > 0:
+                    messages = wait_for_messages(conn, cur, session_id, since_id, wait)
+                else:
+                    messages = fetch_messages_since(cur, session_id, since_id)
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': json.dumps([dict(m) for m in messages], default=str)
+                }
+            
             if session_id:
-                cur.execute(
-                    "SELECT * FROM chat_messages WHERE session_id = %s ORDER BY created_at ASC",
-                    (int(session_id),)
-                )
-                messages = cur.fetchall()
+                try:
+                    session_id = int(session_id)
+                except ValueError:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'session_id must be numeric'})
+                    }
+                
+                conn.autocommit = True
+                with history_snapshot(cur):
+                    messages = archive.archived_messages(cur, session_id)
+                    cur.execute(
+                        "SELECT * FROM chat_messages WHERE session_id = %s ORDER BY created_at ASC",
+                        (session_id,)
+                    )
+                    messages += cur.fetchall()
                 
                 return {
                     'statusCode': 200,
@@ -56,9 +242,31 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False,
                     'body': json.dumps([dict(m) for m in messages], default=str)
                 }
+            elif params.get('status') or params.get('limit') or params.get('cursor'):
+                try:
+                    limit = min(max(int(params.get('limit', DEFAULT_INBOX_PAGE_SIZE)), 1), MAX_INBOX_PAGE_SIZE)
+                    after = decode_cursor(params['cursor']) if params.get('cursor') else None
+                except (ValueError, TypeError):
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'Invalid limit or cursor'})
+                    }
+                
+                page = fetch_inbox_page(cur, params.get('status'), limit, after)
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': json.dumps(page, default=str)
+                }
             else:
+                # Старые клиенты без пагинации получают тот же массив, но не больше страницы
                 cur.execute(
-                    "SELECT * FROM chat_sessions ORDER BY updated_at DESC"
+                    "SELECT * FROM chat_sessions ORDER BY updated_at DESC, id DESC LIMIT %s",
+                    (LEGACY_SESSIONS_LIMIT,)
                 )
                 sessions = cur.fetchall()
                 
@@ -70,6 +278,27 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 }
         
         elif method == 'POST':
+            params = event.get('queryStringParameters') or {}
+            if params.get('action') == 'archive':
+                if not is_service_call(event):
+                    return {
+                        'statusCode': 403,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'Forbidden'})
+                    }
+                
+                result = archive.archive_sessions(
+                    conn, ARCHIVE_CLOSED_DAYS, ARCHIVE_IDLE_DAYS, ARCHIVE_BATCH_SIZE, ARCHIVE_TIME_BUDGET
+                )
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': json.dumps(result)
+                }
+            
             body_data = json.loads(event.get('body', '{}'))
             action = body_data.get('action')
             
@@ -89,7 +318,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 }
             
             elif action == 'send_message':
-                session_id = body_data.get('session_id')
+                try:
+                    session_id = int(body_data['session_id'])
+                except (KeyError, TypeError, ValueError):
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'session_id must be numeric'})
+                    }
                 sender = body_data.get('sender', 'user')
                 message_text = body_data.get('message')
                 
@@ -100,8 +337,17 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 message_id = cur.fetchone()['id']
                 
                 cur.execute(
-                    "UPDATE chat_sessions SET updated_at = NOW() WHERE id = %s",
-                    (session_id,)
+                    """
+                    UPDATE chat_sessions
+                    SET updated_at = NOW(),
+                        last_read_message_id = CASE WHEN %s = 'user' THEN last_read_message_id ELSE %s END
+                    WHERE id = %s
+                    """,
+                    (sender, message_id, session_id)
+                )
+                cur.execute(
+                    "SELECT pg_notify(%s, %s)",
+                    (session_channel(session_id), str(message_id))
                 )
                 conn.commit()
                 
@@ -112,6 +358,34 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({'message_id': message_id, 'session_id': session_id})
                 }
         
+            elif action == 'mark_read':
+                message_id = body_data.get('message_id')
+                try:
+                    session_id = int(body_data['session_id'])
+                except (KeyError, TypeError, ValueError):
+                    session_id = None
+                
+                if session_id is None or not isinstance(message_id, int) or isinstance(message_id, bool):
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'session_id and message_id must be numeric'})
+                    }
+                
+                cur.execute(
+                    "UPDATE chat_sessions SET last_read_message_id = GREATEST(last_read_message_id, %s) WHERE id = %s",
+                    (message_id, session_id)
+                )
+                conn.commit()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'session_id': session_id, 'last_read_message_id': message_id})
+                }
+        
         return {
             'statusCode': 405,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -121,4 +395,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     finally:
         cur.close()
-        conn.close()
+        db.putconn(conn)
@@ -0,0 +1,166 @@
+'''
+Двухуровневый кеш обложек: LRU в памяти процесса + таблица game_cover_cache в Postgres.
+Ключ - нормализованное название игры. "Не найдено" тоже кешируется (payload = NULL),
+но с более коротким TTL. Устаревшие записи отдаются сразу и обновляются в фоне.
+'''
+
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, List, Optional, Set
+from psycopg2.extras import execute_values
+import db
+
+FRESH = 'fresh'
+STALE = 'stale'
+EXPIRED = 'expired'
+# game_cover_cache.title_key VARCHAR(255): длинные ключи - префикс + sha1 полного ключа
+MAX_KEY_LENGTH = 255
+
+
+def normalize_title(name: str) -> str:
+    name = re.sub(r"['’`™®©]", '', name.lower())
+    name = re.sub(r'[:\-–—_.,!?"()\[\]]+', ' ', name)
+    key = re.sub(r'\s+', ' ', name).strip()
+    if len(key) > MAX_KEY_LENGTH:
+        key = f'{key[:MAX_KEY_LENGTH - 41]}#{hashlib.sha1(key.encode()).hexdigest()}'
+    return key
+
+
+class CoverCache:
+    def __init__(self, lru_size: int, ttl: float, negative_ttl: float, stale_ttl: float):
+        self.lru_size = lru_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        self._lru: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._revalidating: Set[str] = set()
+        self.counters: Dict[str, int] = {
+            'lru_hits': 0,
+            'db_hits': 0,
+            'misses': 0,
+            'negative_hits': 0,
+            'stale_served': 0,
+            'revalidations': 0,
+            'fetch_errors': 0,
+            'db_read_errors': 0,
+            'db_write_errors': 0
+        }
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def state(self, entry: Dict[str, Any]) -> str:
+        age = time.time() - entry['fetched_at']
+        fresh_for = self.ttl if entry['payload'] is not None else self.negative_ttl
+        if age <= fresh_for:
+            return FRESH
+        if age <= fresh_for + self.stale_ttl:
+            return STALE
+        return EXPIRED
+
+    def _lru_put(self, key: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._lru[key] = entry
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def get_many(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        '''
+        Ищет ключи сначала в LRU, затем одним запросом в Postgres.
+        Возвращает найденные записи (в том числе устаревшие) с полем source.
+        '''
+        found: Dict[str, Dict[str, Any]] = {}
+        missing: List[str] = []
+        with self._lock:
+            for key in keys:
+                entry = self._lru.get(key)
+                if entry is None:
+                    missing.append(key)
+                else:
+                    self._lru.move_to_end(key)
+                    found[key] = {**entry, 'source': 'lru'}
+
+        if missing:
+            # Кеш в Postgres - ускоритель, а не источник: при его недоступности ключи
+            # считаются промахами и идут в RAWG
+            rows = []
+            conn = None
+            try:
+                conn = db.getconn(autocommit=True)
+                with conn.cursor() as cur:
+                    cur.execute('''
+                        SELECT title_key, payload, EXTRACT(EPOCH FROM fetched_at)
+                        FROM game_cover_cache
+                        WHERE title_key = ANY(%s)
+                    ''', (missing,))
+                    rows = cur.fetchall()
+            except Exception:
+                self.count('db_read_errors')
+            finally:
+                if conn is not None:
+                    db.putconn(conn)
+            for key, payload, fetched_at in rows:
+                entry = {'payload': payload, 'fetched_at': float(fetched_at)}
+                self._lru_put(key, entry)
+                found[key] = {**entry, 'source': 'db'}
+        return found
+
+    def put_many(self, entries: Dict[str, Optional[Dict[str, Any]]]) -> None:
+        if not entries:
+            return
+        now = time.time()
+        for key, payload in entries.items():
+            self._lru_put(key, {'payload': payload, 'fetched_at': now})
+        # Ошибка записи не отменяет ответ RAWG: запись останется только в LRU
+        conn = None
+        try:
+            conn = db.getconn(autocommit=True)
+            with conn.cursor() as cur:
+                execute_values(cur, '''
+                    INSERT INTO game_cover_cache (title_key, payload, fetched_at)
+                    VALUES %s
+                    ON CONFLICT (title_key) DO UPDATE
+                    SET payload = EXCLUDED.payload, fetched_at = EXCLUDED.fetched_at
+                ''', [
+                    (key, json.dumps(payload) if payload is not None else None, now)
+                    for key, payload in entries.items()
+                ], template="(%s, %s::jsonb, to_timestamp(%s) AT TIME ZONE 'UTC')", page_size=len(entries))
+        except Exception:
+            self.count('db_write_errors')
+        finally:
+            if conn is not None:
+                db.putconn(conn)
+
+    def revalidate(self, key: str, fetch: Callable[[], Optional[Dict[str, Any]]], executor: Executor) -> None:
+        '''
+        Обновляет запись в фоне через общий executor запросов к RAWG, так что обновления
+        не превышают его лимит параллельности; ключ, который уже обновляется, пропускается.
+        '''
+        with self._lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+
+        def run() -> None:
+            try:
+                self.put_many({key: fetch()})
+                self.count('revalidations')
+            except Exception:
+                self.count('fetch_errors')
+            finally:
+                with self._lock:
+                    self._revalidating.discard(key)
+
+        executor.submit(run)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.counters, 'lru_size': len(self._lru)}
@@ -2,13 +2,127 @@ import json
 import os
 import urllib.request
 import urllib.parse
-from typing import Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+import db
+from cover_cache import CoverCache, normalize_title, FRESH, STALE
+
+COVER_FETCH_CONCURRENCY = int(os.environ.get('COVER_FETCH_CONCURRENCY', 8))
+MAX_BATCH_TITLES = 100
+
+# Общий на процесс пул запросов к RAWG: и промахи, и фоновые обновления устаревших
+# записей идут через него, поэтому параллельных запросов не больше COVER_FETCH_CONCURRENCY
+fetch_pool = ThreadPoolExecutor(max_workers=COVER_FETCH_CONCURRENCY)
+
+cache = CoverCache(
+    lru_size=int(os.environ.get('COVER_LRU_SIZE', 2000)),
+    ttl=float(os.environ.get('COVER_TTL', 7 * 86400)),
+    negative_ttl=float(os.environ.get('COVER_NEGATIVE_TTL', 86400)),
+    stale_ttl=float(os.environ.get('COVER_STALE_TTL', 30 * 86400))
+)
+
+
+def fetch_cover(game_name: str, api_key: str) -> Optional[Dict[str, Any]]:
+    search_query = urllib.parse.quote(game_name)
+    url = f'https://api.rawg.io/api/games?key={api_key}&search={search_query}&page_size=1'
+    
+    req = urllib.request.Request(url)
+    with urllib.request.urlopen(req, timeout=10) as response:
+        data = json.loads(response.read().decode())
+    
+    if not data.get('results'):
+        return None
+    
+    game = data['results'][0]
+    return {
+        'id': game.get('id'),
+        'name': game.get('name'),
+        'cover_image': game.get('background_image'),
+        'rating': game.get('rating'),
+        'metacritic': game.get('metacritic'),
+        'released': game.get('released'),
+        'platforms': [p['platform']['name'] for p in game.get('platforms', [])[:3]]
+    }
+
+
+def cover_response(payload: Optional[Dict[str, Any]], cache_status: str) -> Dict[str, Any]:
+    if payload is None:
+        return {
+            'statusCode': 404,
+            'headers': {'Access-Control-Allow-Origin': '*', 'X-Cache': cache_status},
+            'body': json.dumps({'error': 'Game not found'})
+        }
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'X-Cache': cache_status
+        },
+        'isBase64Encoded': False,
+        'body': json.dumps(payload)
+    }
+
+
+def resolve_covers(game_names: List[str], api_key: str) -> Dict[str, Dict[str, Any]]:
+    '''
+    Разрешает обложки для списка названий: свежие и устаревшие записи берутся из кеша,
+    промахи запрашиваются в RAWG параллельно через fetch_pool (не больше COVER_FETCH_CONCURRENCY
+    запросов вместе с фоновыми обновлениями).
+    Для каждого названия возвращает payload и статус кеша HIT / STALE / MISS / ERROR.
+    '''
+    keys = {name: normalize_title(name) for name in game_names}
+    entries = cache.get_many(list(set(keys.values())))
+    resolved: Dict[str, Dict[str, Any]] = {}
+    to_fetch: Dict[str, str] = {}
+    
+    for name, key in keys.items():
+        if key in resolved or key in to_fetch:
+            continue
+        entry = entries.get(key)
+        state = cache.state(entry) if entry else None
+        
+        if state == FRESH:
+            cache.count('lru_hits' if entry['source'] == 'lru' else 'db_hits')
+            if entry['payload'] is None:
+                cache.count('negative_hits')
+            resolved[key] = {'payload': entry['payload'], 'cache': 'HIT'}
+        elif state == STALE and api_key:
+            cache.count('stale_served')
+            cache.revalidate(key, lambda name=name: fetch_cover(name, api_key), fetch_pool)
+            resolved[key] = {'payload': entry['payload'], 'cache': 'STALE'}
+        else:
+            cache.count('misses')
+            to_fetch[key] = name
+    
+    if to_fetch and not api_key:
+        for key in to_fetch:
+            resolved[key] = {'payload': None, 'cache': 'ERROR', 'error': 'RAWG_API_KEY not configured'}
+    elif to_fetch:
+        fetched: Dict[str, Optional[Dict[str, Any]]] = {}
+        futures = {key: fetch_pool.submit(fetch_cover, name, api_key) for key, name in to_fetch.items()}
+        for key, future in futures.items():
+            try:
+                fetched[key] = future.result()
+                resolved[key] = {'payload': fetched[key], 'cache': 'MISS'}
+            except Exception as e:
+                cache.count('fetch_errors')
+                entry = entries.get(key)
+                if entry:
+                    resolved[key] = {'payload': entry['payload'], 'cache': 'STALE'}
+                else:
+                    resolved[key] = {'payload': None, 'cache': 'ERROR', 'error': str(e)}
+        cache.put_many(fetched)
+    
+    return {name: resolved[key] for name, key in keys.items()}
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Получить обложку игры из RAWG API по названию
-    Args: event с httpMethod, queryStringParameters (game_name)
-    Returns: HTTP response с URL обложки
+    Args: event с httpMethod, queryStringParameters (game_name | action=stats),
+          body для POST (titles и/или game_ids) - пакетный поиск
+    Returns: HTTP response с URL обложки или словарём обложек
     '''
     method: str = event.get('httpMethod', 'GET')
     
@@ -17,13 +131,64 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
                 'Access-Control-Allow-Headers': 'Content-Type',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
         }
     
+    if method == 'POST':
+        body_data = json.loads(event.get('body') or '{}')
+        titles = [str(t).strip() for t in body_data.get('titles', []) if str(t).strip()]
+        try:
+            game_ids = [int(g) for g in body_data.get('game_ids') or []]
+        except (ValueError, TypeError):
+            return {
+                'statusCode': 400,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'game_ids must be a list of numeric ids'})
+            }
+        
+        if (not titles and not game_ids) or len(titles) + len(game_ids) > MAX_BATCH_TITLES:
+            return {
+                'statusCode': 400,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': f'titles or game_ids required (max {MAX_BATCH_TITLES})'})
+            }
+        
+        try:
+            titles_by_id: Dict[int, str] = {}
+            if game_ids:
+                conn = db.getconn(autocommit=True)
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute('SELECT id, title FROM games WHERE id = ANY(%s)', (game_ids,))
+                        titles_by_id = dict(cur.fetchall())
+                finally:
+                    db.putconn(conn)
+            
+            results = resolve_covers(titles + list(titles_by_id.values()), os.environ.get('RAWG_API_KEY', ''))
+            covers: Dict[str, Any] = {title: results[title]['payload'] for title in titles}
+            covers.update({str(game_id): results[title]['payload'] for game_id, title in titles_by_id.items()})
+            cache_status = [r['cache'] for r in results.values()]
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': json.dumps({
+                    'covers': covers,
+                    'cache': {status.lower(): cache_status.count(status) for status in ('HIT', 'STALE', 'MISS', 'ERROR')}
+                })
+            }
+        except Exception as e:
+            return {
+                'statusCode': 500,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': str(e)})
+            }
+    
     if method != 'GET':
         return {
             'statusCode': 405,
@@ -32,6 +197,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     params = event.get('queryStringParameters') or {}
+    
+    if params.get('action') == 'stats':
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps(cache.stats())
+        }
+    
     game_name: str = params.get('game_name', '').strip()
     
     if not game_name:
@@ -43,49 +217,17 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     api_key = os.environ.get('RAWG_API_KEY', '')
     
-    if not api_key:
-        return {
-            'statusCode': 500,
-            'headers': {'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'RAWG_API_KEY not configured'})
-        }
-    
-    search_query = urllib.parse.quote(game_name)
-    url = f'https://api.rawg.io/api/games?key={api_key}&search={search_query}&page_size=1'
-    
     try:
-        req = urllib.request.Request(url)
-        with urllib.request.urlopen(req, timeout=10) as response:
-            data = json.loads(response.read().decode())
-            
-            if not data.get('results'):
-                return {
-                    'statusCode': 404,
-                    'headers': {'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Game not found'})
-                }
-            
-            game = data['results'][0]
-            
-            result = {
-                'id': game.get('id'),
-                'name': game.get('name'),
-                'cover_image': game.get('background_image'),
-                'rating': game.get('rating'),
-                'metacritic': game.get('metacritic'),
-                'released': game.get('released'),
-                'platforms': [p['platform']['name'] for p in game.get('platforms', [])[:3]]
-            }
-            
+        result = resolve_covers([game_name], api_key)[game_name]
+        
+        if result['cache'] == 'ERROR':
             return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'isBase64Encoded': False,
-                'body': json.dumps(result)
+                'statusCode': 500,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': result['error']})
             }
+        
+        return cover_response(result['payload'], result['cache'])
     
     except Exception as e:
         return {
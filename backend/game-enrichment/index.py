@@ -6,11 +6,48 @@ Returns: HTTP response с обновлёнными данными игры
 
 import json
 import os
-from typing import Dict, Any
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import urllib.request
-import urllib.parse
+import time
+from typing import Dict, Any, List, Tuple
+from psycopg2.extras import RealDictCursor, execute_values
+import db
+from rawg import RawgAuthError, RawgClient
+
+ENRICH_JOB_NAME = 'rawg_enrich_all'
+ENRICH_CHUNK_SIZE = int(os.environ.get('ENRICH_CHUNK_SIZE', 20))
+ENRICH_TIME_BUDGET = float(os.environ.get('ENRICH_TIME_BUDGET', 25))
+ENRICH_MAX_ATTEMPTS = int(os.environ.get('ENRICH_MAX_ATTEMPTS', 5))
+
+
+def make_client() -> RawgClient:
+    return RawgClient(
+        os.environ.get('RAWG_API_KEY', ''),
+        concurrency=int(os.environ.get('RAWG_CONCURRENCY', 5)),
+        rate_per_second=float(os.environ.get('RAWG_RATE_LIMIT', 5))
+    )
+
+
+def enrich_chunk(client: RawgClient, games: List[Dict[str, Any]]) -> Tuple[List[Tuple], List[Tuple[int, str]]]:
+    '''
+    Запрашивает RAWG по всем играм чанка параллельно.
+    Возвращает строки для пакетного UPDATE и (game_id, ошибка) неудачных запросов.
+    RawgAuthError пробрасывается наверх.
+    '''
+    rows: List[Tuple] = []
+    failures: List[Tuple[int, str]] = []
+    for game, fetched in zip(games, client.search_many([g['title'] for g in games])):
+        if 'error' in fetched:
+            failures.append((game['id'], fetched['error'][:500]))
+            continue
+        rawg_game = fetched['result']
+        if not rawg_game:
+            continue
+        cover_url = rawg_game.get('background_image')
+        developers = ', '.join([d['name'] for d in rawg_game.get('developers', [])])
+        publishers = ', '.join([p['name'] for p in rawg_game.get('publishers', [])])
+        if cover_url and developers:
+            rows.append((game['id'], cover_url, rawg_game.get('rating'), developers, publishers))
+    return rows, failures
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -28,7 +65,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     api_key = os.environ.get('RAWG_API_KEY')
-    dsn = os.environ.get('DATABASE_URL')
     
     if not api_key:
         return {
@@ -37,7 +73,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'RAWG_API_KEY not configured'})
         }
     
-    conn = psycopg2.connect(dsn)
+    conn = db.getconn()
     
     try:
         params = event.get('queryStringParameters') or {}
@@ -63,97 +99,162 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'body': json.dumps({'error': 'Game not found'})
                     }
                 
-                search_query = urllib.parse.quote(game['title'])
-                url = f"https://api.rawg.io/api/games?key={api_key}&search={search_query}&page_size=1"
+                rawg_game = make_client().search_game(game['title'])
                 
-                with urllib.request.urlopen(url, timeout=10) as response:
-                    data = json.loads(response.read().decode())
+                if rawg_game:
+                    cover_url = rawg_game.get('background_image', game['image_url'])
+                    rating = rawg_game.get('rating', game['rating'])
+                    
+                    developers = ', '.join([d['name'] for d in rawg_game.get('developers', [])]) if rawg_game.get('developers') else game.get('developer', 'Unknown')
+                    publishers = ', '.join([p['name'] for p in rawg_game.get('publishers', [])]) if rawg_game.get('publishers') else game.get('publisher', 'Unknown')
+                    
+                    if not developers or developers.strip() == '':
+                        developers = game.get('developer', 'Unknown')
+                    if not publishers or publishers.strip() == '':
+                        publishers = game.get('publisher', 'Unknown')
+                    
+                    cur.execute("""
+                        UPDATE games 
+                        SET image_url = %s, 
+                            rating = %s,
+                            developer = %s,
+                            publisher = %s
+                        WHERE id = %s
+                        RETURNING *
+                    """, (cover_url, rating, developers, publishers, game_id))
+                    
+                    updated_game = cur.fetchone()
+                    conn.commit()
                     
-                    if data.get('results') and len(data['results']) > 0:
-                        rawg_game = data['results'][0]
-                        
-                        cover_url = rawg_game.get('background_image', game['image_url'])
-                        rating = rawg_game.get('rating', game['rating'])
-                        
-                        developers = ', '.join([d['name'] for d in rawg_game.get('developers', [])]) if rawg_game.get('developers') else game.get('developer', 'Unknown')
-                        publishers = ', '.join([p['name'] for p in rawg_game.get('publishers', [])]) if rawg_game.get('publishers') else game.get('publisher', 'Unknown')
-                        
-                        if not developers or developers.strip() == '':
-                            developers = game.get('developer', 'Unknown')
-                        if not publishers or publishers.strip() == '':
-                            publishers = game.get('publisher', 'Unknown')
-                        
+                    return {
+                        'statusCode': 200,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({
+                            'success': True,
+                            'game': dict(updated_game),
+                            'rawg_data': {
+                                'name': rawg_game.get('name'),
+                                'rating': rawg_game.get('rating'),
+                                'metacritic': rawg_game.get('metacritic')
+                            }
+                        })
+                    }
+                else:
+                    return {
+                        'statusCode': 404,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({
+                            'error': 'Game not found in RAWG',
+                            'game_title': game['title']
+                        })
+                    }
+        
+        elif action == 'enrich_all':
+            started = time.monotonic()
+            client = make_client()
+            
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                if params.get('reset'):
+                    cur.execute("DELETE FROM enrichment_checkpoints WHERE job_name = %s", (ENRICH_JOB_NAME,))
+                    cur.execute("DELETE FROM enrichment_failures WHERE job_name = %s", (ENRICH_JOB_NAME,))
+                
+                cur.execute("""
+                    INSERT INTO enrichment_checkpoints (job_name) VALUES (%s)
+                    ON CONFLICT (job_name) DO NOTHING
+                """, (ENRICH_JOB_NAME,))
+                cur.execute("""
+                    SELECT last_game_id, processed, enriched, failed, CURRENT_TIMESTAMP AS run_started
+                    FROM enrichment_checkpoints WHERE job_name = %s
+                """, (ENRICH_JOB_NAME,))
+                checkpoint = dict(cur.fetchone())
+                run_started = checkpoint.pop('run_started')
+                conn.commit()
+                
+                # Сначала проход по каталогу за last_game_id, затем повтор упавших игр:
+                # каждая - не чаще раза за запуск и не больше ENRICH_MAX_ATTEMPTS попыток
+                scanned = False
+                while time.monotonic() - started < ENRICH_TIME_BUDGET:
+                    if not scanned:
                         cur.execute("""
-                            UPDATE games 
-                            SET image_url = %s, 
-                                rating = %s,
-                                developer = %s,
-                                publisher = %s
-                            WHERE id = %s
-                            RETURNING *
-                        """, (cover_url, rating, developers, publishers, game_id))
-                        
-                        updated_game = cur.fetchone()
-                        conn.commit()
-                        
-                        return {
-                            'statusCode': 200,
-                            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                            'body': json.dumps({
-                                'success': True,
-                                'game': dict(updated_game),
-                                'rawg_data': {
-                                    'name': rawg_game.get('name'),
-                                    'rating': rawg_game.get('rating'),
-                                    'metacritic': rawg_game.get('metacritic')
-                                }
-                            })
-                        }
+                            SELECT id, title FROM games
+                            WHERE id > %s
+                            ORDER BY id
+                            LIMIT %s
+                        """, (checkpoint['last_game_id'], ENRICH_CHUNK_SIZE))
+                        games = cur.fetchall()
+                        if not games:
+                            scanned = True
+                            continue
                     else:
+                        cur.execute("""
+                            SELECT g.id, g.title
+                            FROM enrichment_failures f
+                            JOIN games g ON g.id = f.game_id
+                            WHERE f.job_name = %s AND f.attempts < %s AND f.updated_at < %s
+                            ORDER BY f.game_id
+                            LIMIT %s
+                        """, (ENRICH_JOB_NAME, ENRICH_MAX_ATTEMPTS, run_started, ENRICH_CHUNK_SIZE))
+                        games = cur.fetchall()
+                        if not games:
+                            break
+                    
+                    try:
+                        rows, failures = enrich_chunk(client, games)
+                    except RawgAuthError as e:
+                        conn.rollback()
                         return {
-                            'statusCode': 404,
+                            'statusCode': 502,
                             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                             'body': json.dumps({
-                                'error': 'Game not found in RAWG',
-                                'game_title': game['title']
+                                'error': str(e),
+                                'last_game_id': checkpoint['last_game_id']
                             })
                         }
-        
-        elif action == 'enrich_all':
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("SELECT id, title FROM games LIMIT 50")
-                games = cur.fetchall()
-                
-                enriched_count = 0
-                for game in games:
-                    try:
-                        search_query = urllib.parse.quote(game['title'])
-                        url = f"https://api.rawg.io/api/games?key={api_key}&search={search_query}&page_size=1"
-                        
-                        with urllib.request.urlopen(url, timeout=5) as response:
-                            data = json.loads(response.read().decode())
-                            
-                            if data.get('results') and len(data['results']) > 0:
-                                rawg_game = data['results'][0]
-                                
-                                cover_url = rawg_game.get('background_image')
-                                rating = rawg_game.get('rating')
-                                developers = ', '.join([d['name'] for d in rawg_game.get('developers', [])])
-                                publishers = ', '.join([p['name'] for p in rawg_game.get('publishers', [])])
-                                
-                                if cover_url and developers:
-                                    cur.execute("""
-                                        UPDATE games 
-                                        SET image_url = %s, 
-                                            rating = %s,
-                                            developer = %s,
-                                            publisher = %s
-                                        WHERE id = %s
-                                    """, (cover_url, rating, developers, publishers, game['id']))
-                                    enriched_count += 1
-                    except Exception:
-                        continue
+                    
+                    if rows:
+                        execute_values(cur, """
+                            UPDATE games g
+                            SET image_url = v.image_url,
+                                rating = v.rating,
+                                developer = v.developer,
+                                publisher = v.publisher
+                            FROM (VALUES %s) AS v(id, image_url, rating, developer, publisher)
+                            WHERE g.id = v.id
+                        """, rows, template='(%s::int, %s, %s::numeric, %s, %s)')
+                    
+                    failed_ids = {game_id for game_id, _ in failures}
+                    if failures:
+                        execute_values(cur, """
+                            INSERT INTO enrichment_failures (job_name, game_id, last_error)
+                            VALUES %s
+                            ON CONFLICT (job_name, game_id) DO UPDATE
+                            SET attempts = enrichment_failures.attempts + 1,
+                                last_error = EXCLUDED.last_error,
+                                updated_at = CURRENT_TIMESTAMP
+                        """, [(ENRICH_JOB_NAME, game_id, error) for game_id, error in failures])
+                    cur.execute("""
+                        DELETE FROM enrichment_failures WHERE job_name = %s AND game_id = ANY(%s)
+                    """, (ENRICH_JOB_NAME, [g['id'] for g in games if g['id'] not in failed_ids]))
+                    
+                    if not scanned:
+                        checkpoint['last_game_id'] = games[-1]['id']
+                        checkpoint['processed'] += len(games)
+                        checkpoint['failed'] += len(failures)
+                    checkpoint['enriched'] += len(rows)
+                    cur.execute("""
+                        UPDATE enrichment_checkpoints
+                        SET last_game_id = %s, processed = %s, enriched = %s, failed = %s,
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE job_name = %s
+                    """, (checkpoint['last_game_id'], checkpoint['processed'], checkpoint['enriched'],
+                          checkpoint['failed'], ENRICH_JOB_NAME))
+                    conn.commit()
                 
+                cur.execute("""
+                    SELECT COUNT(*) AS pending FROM enrichment_failures
+                    WHERE job_name = %s AND attempts < %s
+                """, (ENRICH_JOB_NAME, ENRICH_MAX_ATTEMPTS))
+                pending_retry = cur.fetchone()['pending']
                 conn.commit()
                 
                 return {
@@ -161,8 +262,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                     'body': json.dumps({
                         'success': True,
-                        'enriched_count': enriched_count,
-                        'total_games': len(games)
+                        'done': scanned and pending_retry == 0,
+                        'last_game_id': checkpoint['last_game_id'],
+                        'processed': checkpoint['processed'],
+                        'total_games': checkpoint['processed'],
+                        'enriched_count': checkpoint['enriched'],
+                        'failed_count': checkpoint['failed'],
+                        'pending_retry': pending_retry
                     })
                 }
         
@@ -180,4 +286,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     finally:
-        conn.close()
\ No newline at end of file
+        db.putconn(conn)
\ No newline at end of file
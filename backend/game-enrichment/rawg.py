@@ -0,0 +1,93 @@
+'''
+Клиент RAWG API для пакетного обогащения: ограничение частоты запросов,
+повторы с экспоненциальной задержкой и ограниченный пул потоков.
+Базовый URL берётся из RAWG_API_BASE, чтобы джоб можно было гонять против локальной заглушки.
+'''
+
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+RAWG_API_BASE = os.environ.get('RAWG_API_BASE', 'https://api.rawg.io/api')
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+AUTH_STATUSES = {401, 403}
+
+
+class RawgAuthError(Exception):
+    pass
+
+
+class RateLimiter:
+    def __init__(self, rate_per_second: float):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next_at = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_at)
+            self._next_at = start_at + self.interval
+        if start_at > now:
+            time.sleep(start_at - now)
+
+
+class RawgClient:
+    def __init__(self, api_key: str, concurrency: int = 5, rate_per_second: float = 5.0,
+                 max_retries: int = 3, backoff: float = 0.5, timeout: float = 10.0):
+        self.api_key = api_key
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate_per_second)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+    def search_game(self, title: str) -> Optional[Dict[str, Any]]:
+        '''
+        Первый результат поиска RAWG по названию или None, если ничего не найдено.
+        Сетевые ошибки и 429/5xx повторяются, остальные пробрасываются;
+        401/403 - RawgAuthError, повторять такой запрос бессмысленно.
+        '''
+        query = urllib.parse.urlencode({'key': self.api_key, 'search': title, 'page_size': 1})
+        url = f'{RAWG_API_BASE}/games?{query}'
+        attempt = 0
+        while True:
+            self.limiter.wait()
+            try:
+                with urllib.request.urlopen(url, timeout=self.timeout) as response:
+                    data = json.loads(response.read().decode())
+                results = data.get('results') or []
+                return results[0] if results else None
+            except urllib.error.HTTPError as e:
+                if e.code in AUTH_STATUSES:
+                    raise RawgAuthError(f'RAWG rejected the API key (HTTP {e.code})') from e
+                if e.code not in RETRYABLE_STATUSES or attempt >= self.max_retries:
+                    raise
+            except (urllib.error.URLError, TimeoutError):
+                if attempt >= self.max_retries:
+                    raise
+            time.sleep(self.backoff * (2 ** attempt))
+            attempt += 1
+
+    def search_many(self, titles: List[str]) -> List[Dict[str, Any]]:
+        '''
+        Параллельный поиск по списку названий. Для каждого названия возвращает
+        {'result': ...} или {'error': ...}, порядок совпадает со входным.
+        RawgAuthError пробрасывается: с неверным ключом упадёт весь каталог.
+        '''
+        def fetch(title: str) -> Dict[str, Any]:
+            try:
+                return {'result': self.search_game(title)}
+            except RawgAuthError:
+                raise
+            except Exception as e:
+                return {'error': str(e)}
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            return list(pool.map(fetch, titles))
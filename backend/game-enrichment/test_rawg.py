@@ -0,0 +1,106 @@
+'''
+Проверка RawgClient против локальной заглушки RAWG на http.server:
+повторы 429/5xx, немедленный отказ на 401, лимит частоты и порядок результатов.
+    python -m pytest backend/game-enrichment/test_rawg.py
+'''
+
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import rawg
+from rawg import RawgAuthError, RawgClient
+
+
+class StubRawg(BaseHTTPRequestHandler):
+    # Сценарий по названию игры: список статусов для последовательных запросов, дальше 200
+    scripts = {}
+    hits = {}
+    lock = threading.Lock()
+
+    def do_GET(self):
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        title = query['search'][0]
+        with self.lock:
+            n = self.hits.get(title, 0)
+            self.hits[title] = n + 1
+        script = self.scripts.get(title, [])
+        status = script[n] if n < len(script) else 200
+        if status != 200:
+            self.send_response(status)
+            self.end_headers()
+            return
+        results = [] if title == 'missing' else [{
+            'name': title,
+            'background_image': f'https://img/{title}.jpg',
+            'rating': 4.5,
+            'developers': [{'name': 'Dev'}],
+            'publishers': [{'name': 'Pub'}]
+        }]
+        body = json.dumps({'results': results}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    StubRawg.scripts = {}
+    StubRawg.hits = {}
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubRawg)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(rawg, 'RAWG_API_BASE', f'http://127.0.0.1:{server.server_port}')
+    yield StubRawg
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(**kwargs):
+    options = {'concurrency': 4, 'rate_per_second': 1000, 'max_retries': 3, 'backoff': 0.01}
+    options.update(kwargs)
+    return RawgClient('test-key', **options)
+
+
+def test_returns_first_result(stub):
+    assert make_client().search_game('Doom')['background_image'] == 'https://img/Doom.jpg'
+    assert make_client().search_game('missing') is None
+
+
+def test_retries_rate_limit_and_server_errors(stub):
+    stub.scripts['Quake'] = [429, 503, 500]
+    assert make_client().search_game('Quake')['name'] == 'Quake'
+    assert stub.hits['Quake'] == 4
+
+
+def test_gives_up_after_max_retries(stub):
+    stub.scripts['Heretic'] = [500] * 10
+    results = make_client(max_retries=2).search_many(['Heretic', 'Hexen'])
+    assert 'error' in results[0] and results[1]['result']['name'] == 'Hexen'
+    assert stub.hits['Heretic'] == 3
+
+
+def test_auth_error_is_not_retried_and_aborts_batch(stub):
+    stub.scripts['Blood'] = [401]
+    with pytest.raises(RawgAuthError):
+        make_client().search_many(['Blood', 'Duke'])
+    assert stub.hits['Blood'] == 1
+
+
+def test_results_keep_input_order(stub):
+    titles = [f'game-{i}' for i in range(20)]
+    results = make_client(concurrency=8).search_many(titles)
+    assert [r['result']['name'] for r in results] == titles
+
+
+def test_rate_limit_spaces_requests(stub):
+    started = time.monotonic()
+    make_client(concurrency=5, rate_per_second=20).search_many([f'g{i}' for i in range(10)])
+    assert time.monotonic() - started >= 9 / 20
@@ -1,6 +1,5 @@
 import json
-import os
-import psycopg2
+import db
 import secrets
 from typing import Dict, Any
 
@@ -34,9 +33,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'X-User-Id header required'})
         }
     
-    dsn = os.environ.get('DATABASE_URL', '')
-    conn = psycopg2.connect(dsn)
-    conn.autocommit = True
+    conn = db.getconn(autocommit=True)
     cursor = conn.cursor()
     
     try:
@@ -65,7 +62,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 })
             
             cursor.close()
-            conn.close()
+            db.putconn(conn)
             
             return {
                 'statusCode': 200,
@@ -85,7 +82,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             if not game_id or not recipient_email:
                 cursor.close()
-                conn.close()
+                db.putconn(conn)
                 return {
                     'statusCode': 400,
                     'headers': {'Access-Control-Allow-Origin': '*'},
@@ -103,7 +100,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             gift_id = cursor.fetchone()[0]
             cursor.close()
-            conn.close()
+            db.putconn(conn)
             
             return {
                 'statusCode': 200,
@@ -120,7 +117,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
         
         cursor.close()
-        conn.close()
+        db.putconn(conn)
         return {
             'statusCode': 405,
             'headers': {'Access-Control-Allow-Origin': '*'},
@@ -131,7 +128,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if cursor:
             cursor.close()
         if conn:
-            conn.close()
+            db.putconn(conn)
         return {
             'statusCode': 500,
             'headers': {'Access-Control-Allow-Origin': '*'},
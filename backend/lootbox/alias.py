@@ -0,0 +1,49 @@
+'''
+Таблицы Уолкера (alias method) для розыгрыша призов лутбокса за O(1).
+Таблица строится один раз за O(n) и кешируется между тёплыми вызовами.
+'''
+
+import random
+from typing import Any, Callable, Dict, List, Sequence
+
+
+class AliasTable:
+    def __init__(self, weights: Sequence[float]):
+        n = len(weights)
+        total = float(sum(weights))
+        if n == 0 or total <= 0:
+            raise ValueError('weights must be non-empty with a positive sum')
+
+        scaled = [w * n / total for w in weights]
+        self.n = n
+        self.prob: List[float] = [0.0] * n
+        self.alias: List[int] = list(range(n))
+
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+        for i in large + small:
+            self.prob[i] = 1.0
+
+    def sample(self, rng: Callable[[], float] = random.random) -> int:
+        i = int(rng() * self.n)
+        return i if rng() < self.prob[i] else self.alias[i]
+
+
+class LootboxSampler:
+    def __init__(self, items: List[Dict[str, Any]], items_version: int):
+        self.items = items
+        self.items_version = items_version
+        self.table = AliasTable([float(item['probability']) for item in items])
+
+    def draw(self, count: int = 1) -> List[Dict[str, Any]]:
+        return [self.items[self.table.sample()] for _ in range(count)]
@@ -0,0 +1,198 @@
+'''
+Пул соединений с Postgres, живущий между тёплыми вызовами функции.
+Каждая функция деплоится отдельно, поэтому модуль лежит рядом с index.py.
+
+Использование:
+    conn = db.getconn()            # вместо psycopg2.connect(dsn)
+    ...
+    db.putconn(conn)               # вместо conn.close()
+
+Настройки (переменные окружения):
+    DB_POOL_MAX_SIZE       - максимум соединений в пуле (по умолчанию 4)
+    DB_POOL_MAX_LIFETIME   - сек., после которых соединение пересоздаётся (300)
+    DB_POOL_MAX_IDLE       - сек. простоя, после которых перед выдачей делается SELECT 1 (30)
+    DB_POOL_WAIT_TIMEOUT   - сек. ожидания свободного соединения (5)
+'''
+
+import os
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+import psycopg2
+import psycopg2.extensions
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, dsn: str, max_size: int, max_lifetime: float,
+                 max_idle: float, wait_timeout: float):
+        self.dsn = dsn
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.wait_timeout = wait_timeout
+        self._idle: List[Tuple[Any, float, float]] = []
+        self._born: Dict[int, float] = {}
+        self._in_use: Dict[int, Any] = {}
+        self._reserved = 0
+        self._cond = threading.Condition()
+        self.metrics: Dict[str, float] = {
+            'checkouts': 0,
+            'created': 0,
+            'recycled': 0,
+            'health_check_failures': 0,
+            'timeouts': 0,
+            'wait_total_ms': 0.0,
+            'wait_max_ms': 0.0
+        }
+
+    def _size(self) -> int:
+        return len(self._idle) + len(self._in_use) + self._reserved
+
+    def _discard(self, conn: Any) -> None:
+        self._born.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _check(self, conn: Any, born_at: float, idle_since: float) -> Optional[str]:
+        '''
+        Проверка соединения перед выдачей, вызывается без блокировки пула.
+        Возвращает метрику причины отбраковки или None, если соединение годно.
+        '''
+        now = time.monotonic()
+        if conn.closed or now - born_at > self.max_lifetime:
+            return 'recycled'
+        if now - idle_since > self.max_idle:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+                conn.rollback()
+            except Exception:
+                return 'health_check_failures'
+        return None
+
+    def _release_slot(self, conn: Any = None, reason: Optional[str] = None) -> None:
+        '''
+        Возвращает зарезервированный слот после неудачного connect или отбраковки.
+        '''
+        with self._cond:
+            self._reserved -= 1
+            if reason:
+                self.metrics[reason] += 1
+            if conn is not None:
+                self._born.pop(id(conn), None)
+            self._cond.notify()
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def getconn(self, autocommit: bool = False) -> Any:
+        started = time.monotonic()
+        deadline = started + self.wait_timeout
+        conn = None
+        while conn is None:
+            # Под блокировкой только резервируется слот: connect и SELECT 1 идут без неё,
+            # чтобы сетевой ввод-вывод не останавливал остальные getconn/putconn
+            with self._cond:
+                while not self._idle and self._size() >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.metrics['timeouts'] += 1
+                        raise PoolTimeout(f'No free DB connection within {self.wait_timeout}s')
+                    self._cond.wait(remaining)
+                candidate = self._idle.pop() if self._idle else None
+                self._reserved += 1
+
+            if candidate is None:
+                try:
+                    conn = psycopg2.connect(self.dsn)
+                except Exception:
+                    self._release_slot()
+                    raise
+                with self._cond:
+                    self._born[id(conn)] = time.monotonic()
+                    self.metrics['created'] += 1
+            else:
+                conn, born_at, idle_since = candidate
+                reason = self._check(conn, born_at, idle_since)
+                if reason:
+                    self._release_slot(conn, reason)
+                    conn = None
+
+        with self._cond:
+            self._reserved -= 1
+            self._in_use[id(conn)] = conn
+            waited_ms = (time.monotonic() - started) * 1000
+            self.metrics['checkouts'] += 1
+            self.metrics['wait_total_ms'] += waited_ms
+            self.metrics['wait_max_ms'] = max(self.metrics['wait_max_ms'], waited_ms)
+        if conn.autocommit != autocommit:
+            conn.autocommit = autocommit
+        return conn
+
+    def putconn(self, conn: Any) -> None:
+        with self._cond:
+            if self._in_use.pop(id(conn), None) is None:
+                return
+            reusable = not conn.closed
+            if reusable:
+                try:
+                    status = conn.info.transaction_status
+                    if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                except Exception:
+                    reusable = False
+            if reusable:
+                self._idle.append((conn, self._born[id(conn)], time.monotonic()))
+            else:
+                self._discard(conn)
+            self._cond.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            checkouts = self.metrics['checkouts']
+            return {
+                **self.metrics,
+                'wait_avg_ms': self.metrics['wait_total_ms'] / checkouts if checkouts else 0.0,
+                'size': self._size(),
+                'idle': len(self._idle),
+                'in_use': len(self._in_use)
+            }
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    dsn=os.environ.get('DATABASE_URL', ''),
+                    max_size=int(os.environ.get('DB_POOL_MAX_SIZE', 4)),
+                    max_lifetime=float(os.environ.get('DB_POOL_MAX_LIFETIME', 300)),
+                    max_idle=float(os.environ.get('DB_POOL_MAX_IDLE', 30)),
+                    wait_timeout=float(os.environ.get('DB_POOL_WAIT_TIMEOUT', 5))
+                )
+    return _pool
+
+
+def getconn(autocommit: bool = False) -> Any:
+    return get_pool().getconn(autocommit=autocommit)
+
+
+def putconn(conn: Any) -> None:
+    get_pool().putconn(conn)
+
+
+def stats() -> Dict[str, Any]:
+    return get_pool().stats()
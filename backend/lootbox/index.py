@@ -5,12 +5,88 @@ Returns: HTTP response с лутбоксами или результатом о
 """
 
 import json
-import os
-import random
-from typing import Dict, Any
-from datetime import datetime, timedelta
-import psycopg2
+from typing import Dict, Any, List, Optional
 from psycopg2.extras import RealDictCursor
+import db
+from alias import LootboxSampler
+
+MAX_BATCH_OPEN = 100
+
+_samplers: Dict[int, LootboxSampler] = {}
+
+
+OPEN_LOOTBOX_SQL = """
+    WITH opened AS (
+        INSERT INTO user_lootbox_cooldowns (user_id, lootbox_id, last_opened_at, next_available_at)
+        SELECT %(user_id)s, l.id, NOW(), NOW() + %(count)s * l.cooldown_hours * INTERVAL '1 hour'
+        FROM lootboxes l
+        WHERE l.id = %(lootbox_id)s
+        ON CONFLICT (user_id, lootbox_id)
+        DO UPDATE SET last_opened_at = EXCLUDED.last_opened_at,
+                      next_available_at = EXCLUDED.next_available_at
+        WHERE user_lootbox_cooldowns.next_available_at IS NULL
+           OR user_lootbox_cooldowns.next_available_at <= NOW()
+        RETURNING next_available_at
+    ), history AS (
+        INSERT INTO user_lootbox_history
+        (user_id, lootbox_id, item_won_type, item_won_id, item_won_name, value_won)
+        SELECT %(user_id)s, %(lootbox_id)s, p.item_type, p.item_id, p.item_name, p.value
+        FROM opened,
+             unnest(%(types)s::varchar[], %(ids)s::int[], %(names)s::varchar[], %(values)s::int[])
+                 AS p(item_type, item_id, item_name, value)
+    ), balance AS (
+        INSERT INTO balance_journal (user_id, bonus_delta, source, reference)
+        SELECT %(user_id)s, %(bonus_points)s, 'lootbox', %(lootbox_id)s::text
+        FROM opened
+        WHERE %(bonus_points)s > 0
+    )
+    SELECT (SELECT next_available_at FROM opened) AS next_available_at,
+           (SELECT items_version FROM lootboxes WHERE id = %(lootbox_id)s) AS items_version
+"""
+
+
+def load_sampler(cur: Any, lootbox_id: int) -> Optional[LootboxSampler]:
+    '''
+    Перестраивает alias-таблицу лутбокса из БД и кладёт её в кеш процесса.
+    '''
+    cur.execute("""
+        SELECT l.items_version, i.item_type, i.item_id, i.item_name, i.probability, i.value
+        FROM lootboxes l
+        JOIN lootbox_items i ON i.lootbox_id = l.id AND i.probability > 0
+        WHERE l.id = %s
+        ORDER BY i.id
+    """, (lootbox_id,))
+    rows = cur.fetchall()
+    
+    if not rows:
+        _samplers.pop(lootbox_id, None)
+        return None
+    
+    items = [{k: row[k] for k in ('item_type', 'item_id', 'item_name', 'probability', 'value')} for row in rows]
+    sampler = LootboxSampler(items, rows[0]['items_version'])
+    _samplers[lootbox_id] = sampler
+    return sampler
+
+
+def open_lootbox(cur: Any, user_id: int, lootbox_id: int, won_items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    '''
+    Одним запросом атомарно проверяет и ставит перезарядку, пишет историю
+    и начисляет бонусы записью в журнал balance_journal. Пакетное открытие
+    N призов ставит перезарядку в N раз длиннее - один приз за период, как и раньше. При двойном клике второй запрос ждёт блокировку строки
+    перезарядки и видит уже обновлённое next_available_at.
+    '''
+    cur.execute(OPEN_LOOTBOX_SQL, {
+        'user_id': user_id,
+        'lootbox_id': lootbox_id,
+        'count': len(won_items),
+        'types': [item['item_type'] for item in won_items],
+        'ids': [item['item_id'] for item in won_items],
+        'names': [item['item_name'] for item in won_items],
+        'values': [item['value'] for item in won_items],
+        'bonus_points': sum(item['value'] or 0 for item in won_items if item['item_type'] == 'discount')
+    })
+    return cur.fetchone()
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -27,8 +103,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': ''
         }
     
-    dsn = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(dsn)
+    conn = db.getconn()
     
     try:
         user_id = int(event.get('headers', {}).get('X-User-Id', 1))
@@ -79,93 +154,83 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         elif method == 'POST':
             body_data = json.loads(event.get('body', '{}'))
             lootbox_id = body_data['lootbox_id']
+            count = int(body_data.get('count', 1))
+            
+            if count < 1 or count > MAX_BATCH_OPEN:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': f'count должен быть от 1 до {MAX_BATCH_OPEN}'})
+                }
             
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("""
-                    SELECT * FROM user_lootbox_cooldowns
-                    WHERE user_id = %s AND lootbox_id = %s
-                    AND next_available_at > NOW()
-                """, (user_id, lootbox_id))
-                cooldown = cur.fetchone()
-                
-                if cooldown:
+                sampler = _samplers.get(lootbox_id) or load_sampler(cur, lootbox_id)
+                
+                for _ in range(2):
+                    if not sampler:
+                        return {
+                            'statusCode': 404,
+                            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                            'body': json.dumps({'error': 'Лутбокс не найден'})
+                        }
+                    
+                    won_items = sampler.draw(count)
+                    result = open_lootbox(cur, user_id, lootbox_id, won_items)
+                    
+                    if result['items_version'] is None:
+                        conn.rollback()
+                        _samplers.pop(lootbox_id, None)
+                        return {
+                            'statusCode': 404,
+                            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                            'body': json.dumps({'error': 'Лутбокс не найден'})
+                        }
+                    
+                    if result['next_available_at'] is None:
+                        conn.rollback()
+                        if result['items_version'] != sampler.items_version:
+                            _samplers.pop(lootbox_id, None)
+                        cur.execute("""
+                            SELECT next_available_at FROM user_lootbox_cooldowns
+                            WHERE user_id = %s AND lootbox_id = %s
+                        """, (user_id, lootbox_id))
+                        cooldown = cur.fetchone()
+                        return {
+                            'statusCode': 400,
+                            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                            'body': json.dumps({
+                                'error': 'Лутбокс ещё на перезарядке',
+                                'next_available': cooldown['next_available_at'].isoformat() if cooldown else None
+                            })
+                        }
+                    
+                    if result['items_version'] != sampler.items_version:
+                        conn.rollback()
+                        sampler = load_sampler(cur, lootbox_id)
+                        continue
+                    
+                    conn.commit()
+                    
+                    prizes = [
+                        {'type': item['item_type'], 'name': item['item_name'], 'value': item['value']}
+                        for item in won_items
+                    ]
+                    
                     return {
-                        'statusCode': 400,
+                        'statusCode': 200,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                         'body': json.dumps({
-                            'error': 'Лутбокс ещё на перезарядке',
-                            'next_available': cooldown['next_available_at'].isoformat()
+                            'success': True,
+                            'won_item': prizes[0],
+                            'won_items': prizes,
+                            'next_available': result['next_available_at'].isoformat()
                         })
                     }
                 
-                cur.execute("""
-                    SELECT * FROM lootbox_items WHERE lootbox_id = %s
-                """, (lootbox_id,))
-                items = cur.fetchall()
-                
-                if not items:
-                    return {
-                        'statusCode': 404,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Лутбокс не найден'})
-                    }
-                
-                total_probability = sum(float(item['probability']) for item in items)
-                rand_value = random.uniform(0, total_probability)
-                cumulative = 0.0
-                won_item = None
-                
-                for item in items:
-                    cumulative += float(item['probability'])
-                    if rand_value <= cumulative:
-                        won_item = item
-                        break
-                
-                if not won_item:
-                    won_item = items[0]
-                
-                cur.execute("""
-                    INSERT INTO user_lootbox_history 
-                    (user_id, lootbox_id, item_won_type, item_won_id, item_won_name, value_won)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                    RETURNING id
-                """, (user_id, lootbox_id, won_item['item_type'], won_item['item_id'], 
-                      won_item['item_name'], won_item['value']))
-                
-                cur.execute("""
-                    SELECT cooldown_hours FROM lootboxes WHERE id = %s
-                """, (lootbox_id,))
-                cooldown_hours = cur.fetchone()['cooldown_hours']
-                next_available = datetime.now() + timedelta(hours=cooldown_hours)
-                
-                cur.execute("""
-                    INSERT INTO user_lootbox_cooldowns (user_id, lootbox_id, last_opened_at, next_available_at)
-                    VALUES (%s, %s, NOW(), %s)
-                    ON CONFLICT (user_id, lootbox_id) 
-                    DO UPDATE SET last_opened_at = NOW(), next_available_at = %s
-                """, (user_id, lootbox_id, next_available, next_available))
-                
-                if won_item['item_type'] == 'discount':
-                    cur.execute("""
-                        UPDATE user_balance
-                        SET bonus_points = bonus_points + %s
-                        WHERE user_id = %s
-                    """, (won_item['value'], user_id))
-                
-                conn.commit()
-                
                 return {
-                    'statusCode': 200,
+                    'statusCode': 409,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({
-                        'success': True,
-                        'won_item': {
-                            'type': won_item['item_type'],
-                            'name': won_item['item_name'],
-                            'value': won_item['value']
-                        },
-                        'next_available': next_available.isoformat()
-                    })
+                    'body': json.dumps({'error': 'Состав лутбокса изменился, попробуйте ещё раз'})
                 }
         
         return {
@@ -175,4 +240,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     finally:
-        conn.close()
+        db.putconn(conn)
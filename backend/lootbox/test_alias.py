@@ -0,0 +1,64 @@
+'''
+Статистическая проверка alias-таблицы: при фиксированном seed частоты выпадения
+совпадают с весами по критерию хи-квадрат.
+    python -m pytest backend/lootbox/test_alias.py
+'''
+
+import random
+from alias import AliasTable, LootboxSampler
+
+SAMPLES = 1_000_000
+# Критическое значение хи-квадрат для p=0.001 при 5 степенях свободы
+CHI2_CRITICAL_DF5 = 20.515
+# Самый редкий тир (1%) на миллионе розыгрышей: ~10 000 выпадений, стандартное
+# отклонение ~100, так что 5% - это ~5 сигм
+RARE_TIER_TOLERANCE = 0.05
+
+
+def chi_square(weights, counts):
+    total = sum(weights)
+    n = sum(counts)
+    return sum((c - n * w / total) ** 2 / (n * w / total) for w, c in zip(weights, counts))
+
+
+def test_frequencies_match_weights():
+    weights = [50, 25, 12.5, 7.5, 4, 1]
+    table = AliasTable(weights)
+    rng = random.Random(20240101).random
+    counts = [0] * len(weights)
+    for _ in range(SAMPLES):
+        counts[table.sample(rng)] += 1
+    assert chi_square(weights, counts) < CHI2_CRITICAL_DF5
+    rare_expected = SAMPLES * weights[-1] / sum(weights)
+    assert abs(counts[-1] - rare_expected) / rare_expected < RARE_TIER_TOLERANCE
+
+
+def test_table_encodes_exact_probabilities():
+    weights = [0.7, 0.2, 0.05, 0.05]
+    table = AliasTable(weights)
+    mass = [0.0] * table.n
+    for i in range(table.n):
+        mass[i] += table.prob[i] / table.n
+        mass[table.alias[i]] += (1 - table.prob[i]) / table.n
+    for expected, actual in zip(weights, mass):
+        assert abs(expected - actual) < 1e-12
+
+
+def test_zero_weight_is_never_drawn():
+    table = AliasTable([1, 0, 3])
+    rng = random.Random(7).random
+    assert all(table.sample(rng) != 1 for _ in range(50_000))
+
+
+def test_rejects_empty_or_zero_weights():
+    for weights in ([], [0, 0]):
+        try:
+            AliasTable(weights)
+        except ValueError:
+            continue
+        raise AssertionError(f'{weights} accepted')
+
+
+def test_sampler_draws_requested_count():
+    items = [{'item_name': 'a', 'probability': 1}, {'item_name': 'b', 'probability': 3}]
+    assert len(LootboxSampler(items, 1).draw(10)) == 10
@@ -0,0 +1,134 @@
+'''
+Бенчмарк компакции истории цен на синтетических данных (по умолчанию 10M точек).
+Заполняет price_history через generate_series, меряет размер таблиц и латентность
+графиков по сырым строкам, затем гоняет compact() до конца и меряет то же самое
+по rollup-таблицам.
+
+Только для одноразовой базы: price_history и rollup-таблицы очищаются.
+    BENCH_DATABASE_URL=postgres://... python bench_rollup.py --truncate --points 10000000
+'''
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List
+
+import psycopg2
+
+from rollup import SCHEMA, compact, fetch_buckets, get_watermarks
+
+TABLES = ('price_history', 'price_history_daily', 'price_history_weekly')
+
+
+def table_sizes(cur: Any) -> Dict[str, int]:
+    sizes = {}
+    for table in TABLES:
+        cur.execute('SELECT pg_total_relation_size(%s)', (f'{SCHEMA}.{table}',))
+        sizes[table] = cur.fetchone()[0]
+    return sizes
+
+
+def median_ms(run: Callable[[], Any], repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(timings), 2)
+
+
+def chart_latencies(cur: Any, game_ids: List[int], now: datetime,
+                    watermarks: Dict[str, datetime], repeats: int) -> Dict[str, float]:
+    ranges = {
+        'year_by_week': (now - timedelta(days=365), 'week'),
+        'quarter_by_day': (now - timedelta(days=90), 'day'),
+        'two_years_by_week': (now - timedelta(days=730), 'week'),
+    }
+    return {
+        name: median_ms(lambda: fetch_buckets(cur, game_ids, start, now, bucket, watermarks), repeats)
+        for name, (start, bucket) in ranges.items()
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--points', type=int, default=10_000_000)
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--retention-days', type=int, default=365)
+    parser.add_argument('--query-games', type=int, default=20)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--truncate', action='store_true', help='подтверждение очистки таблиц')
+    args = parser.parse_args()
+
+    dsn = os.environ.get('BENCH_DATABASE_URL')
+    if not dsn or not args.truncate:
+        print('Нужны BENCH_DATABASE_URL одноразовой базы и флаг --truncate', file=sys.stderr)
+        return 2
+
+    conn = psycopg2.connect(dsn)
+    result: Dict[str, Any] = {'points': args.points, 'games': args.games, 'days': args.days}
+    with conn.cursor() as cur:
+        cur.execute(f'TRUNCATE {", ".join(f"{SCHEMA}.{t}" for t in TABLES)}')
+        cur.execute("SELECT date_trunc('hour', CURRENT_TIMESTAMP)::timestamp")
+        now = cur.fetchone()[0]
+        first_day = (now - timedelta(days=args.days)).replace(hour=0)
+
+        started = time.perf_counter()
+        cur.execute(f'''
+            INSERT INTO {SCHEMA}.price_history (game_id, price, discount_percent, recorded_at)
+            SELECT 1 + g % %(games)s,
+                   round((1000 + 300 * sin(g / 7919.0) + random() * 50)::numeric, 2),
+                   CASE WHEN random() < 0.1 THEN (random() * 70)::int ELSE 0 END,
+                   %(first_day)s::timestamp
+                       + (g::float8 / %(points)s) * (%(days)s * INTERVAL '1 day')
+            FROM generate_series(1, %(points)s) g
+        ''', {'games': args.games, 'points': args.points, 'days': args.days, 'first_day': first_day})
+        cur.execute(f'''
+            UPDATE {SCHEMA}.price_history_rollup_state
+            SET rolled_until = CASE level WHEN 'week' THEN date_trunc('week', %(d)s::timestamp) ELSE %(d)s END
+        ''', {'d': first_day})
+        conn.commit()
+        cur.execute(f'ANALYZE {SCHEMA}.price_history')
+        conn.commit()
+        result['load_s'] = round(time.perf_counter() - started, 1)
+
+        game_ids = list(range(1, args.query_games + 1))
+        result['before'] = {
+            'table_bytes': table_sizes(cur),
+            'chart_ms': chart_latencies(cur, game_ids, now, get_watermarks(cur), args.repeats)
+        }
+        conn.commit()
+
+        runs = 0
+        started = time.perf_counter()
+        while True:
+            runs += 1
+            run = compact(conn, args.retention_days, 31, 50000)
+            if run['done']:
+                break
+        result['compact'] = {'calls': runs, 'total_s': round(time.perf_counter() - started, 1)}
+
+        # VACUUM FULL возвращает место удалённых сырых строк, иначе размер файла не изменится
+        conn.autocommit = True
+        for table in TABLES:
+            cur.execute(f'VACUUM FULL ANALYZE {SCHEMA}.{table}')
+        conn.autocommit = False
+
+        result['after'] = {
+            'table_bytes': table_sizes(cur),
+            'chart_ms': chart_latencies(cur, game_ids, now, get_watermarks(cur), args.repeats)
+        }
+        conn.commit()
+    conn.close()
+
+    print(json.dumps(result, indent=2, default=str))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
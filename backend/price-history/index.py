@@ -1,13 +1,220 @@
+import calendar
+import hmac
 import json
 import os
-import psycopg2
-from typing import Dict, Any
+import time
+import db
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, Tuple
+from lttb import lttb_indices
+from rollup import SCHEMA, compact, fetch_buckets, get_watermarks
+
+BUCKETS = ('hour', 'day', 'week')
+DEFAULT_RANGE_DAYS = 30
+RAW_RANGE_MAX_DAYS = int(os.environ.get('PRICE_HISTORY_RAW_RANGE_MAX_DAYS', 90))
+RAW_RETENTION_DAYS = int(os.environ.get('PRICE_HISTORY_RAW_RETENTION_DAYS', 365))
+ROLLUP_MAX_DAYS = int(os.environ.get('PRICE_ROLLUP_MAX_DAYS', 31))
+ROLLUP_PRUNE_BATCH = int(os.environ.get('PRICE_ROLLUP_PRUNE_BATCH', 50000))
+ROLLUP_TIME_BUDGET = float(os.environ.get('PRICE_ROLLUP_TIME_BUDGET', 25))
+MIN_POINTS = 3
+MAX_POINTS = 2000
+MAX_BATCH_GAME_IDS = 50
+SERVICE_TOKEN = os.environ.get('SERVICE_TOKEN', '')
+RAW_COLUMNS = ('price', 'discount')
+BUCKET_COLUMNS = ('open', 'high', 'low', 'close', 'avg', 'discount', 'samples')
+
+RAW_SERIES_SQL = f'''
+    SELECT game_id, recorded_at, price, discount_percent,
+           MIN(price) OVER w, MAX(price) OVER w, AVG(price) OVER w, COUNT(*) OVER w
+    FROM {SCHEMA}.price_history
+    WHERE game_id = ANY(%s) AND recorded_at >= %s AND recorded_at < %s
+    WINDOW w AS (PARTITION BY game_id)
+    ORDER BY game_id, recorded_at ASC
+'''
+
+ALL_TIME_STATS_SQL = f'''
+    WITH mark AS (
+        SELECT COALESCE(
+            (SELECT rolled_until FROM {SCHEMA}.price_history_rollup_state WHERE level = 'day'),
+            '-infinity'::timestamp
+        ) AS rolled_until
+    )
+    SELECT MIN(low), MAX(high), SUM(price_sum) / NULLIF(SUM(samples), 0)
+    FROM (
+        SELECT d.low, d.high, d.price_sum, d.samples
+        FROM {SCHEMA}.price_history_daily d, mark
+        WHERE d.game_id = %s AND d.bucket_start < mark.rolled_until
+        UNION ALL
+        SELECT p.price, p.price, p.price, 1
+        FROM {SCHEMA}.price_history p, mark
+        WHERE p.game_id = %s AND p.recorded_at >= mark.rolled_until
+    ) s
+'''
+
+
+def is_service_call(event: Dict[str, Any]) -> bool:
+    '''
+    Служебный вызов (планировщик компакции): X-Service-Token совпадает с SERVICE_TOKEN.
+    Без настроенного токена служебные действия закрыты.
+    '''
+    headers = event.get('headers') or {}
+    token = headers.get('X-Service-Token') or headers.get('x-service-token') or ''
+    return bool(SERVICE_TOKEN) and hmac.compare_digest(token, SERVICE_TOKEN)
+
+
+def parse_timestamp(value: str) -> datetime:
+    '''
+    ISO-дата или дата-время; aware-значения приводятся к наивному UTC, как recorded_at.
+    '''
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_range(params: Dict[str, Any]) -> Tuple[datetime, datetime, Optional[str], Optional[int]]:
+    '''
+    Разбирает from/to/bucket/points. Без bucket длинные диапазоны и диапазоны старше срока
+    хранения сырых точек читаются из дневных бакетов; bucket=hour старше этого срока - ошибка.
+    Бросает ValueError на неверных параметрах.
+    '''
+    end = parse_timestamp(params['to']) if params.get('to') else datetime.utcnow()
+    start = parse_timestamp(params['from']) if params.get('from') else end - timedelta(days=DEFAULT_RANGE_DAYS)
+    if start >= end:
+        raise ValueError('from must be earlier than to')
+
+    bucket = params.get('bucket')
+    if bucket is not None and bucket not in BUCKETS:
+        raise ValueError(f'bucket must be one of {", ".join(BUCKETS)}')
+    before_retention = start < datetime.utcnow() - timedelta(days=RAW_RETENTION_DAYS)
+    if bucket == 'hour' and before_retention:
+        # Часовые бакеты строятся по сырым точкам, а старше срока хранения их уже нет
+        raise ValueError(f'bucket=hour is only available for the last {RAW_RETENTION_DAYS} days; use day or week')
+    if bucket is None and (end - start > timedelta(days=RAW_RANGE_MAX_DAYS) or before_retention):
+        bucket = 'day'
+
+    points = None
+    if params.get('points'):
+        points = int(params['points'])
+        if not MIN_POINTS <= points <= MAX_POINTS:
+            raise ValueError(f'points must be between {MIN_POINTS} and {MAX_POINTS}')
+    return start, end, bucket, points
+
+
+def bucket_point(bucket_start: datetime, open_price: Any, high: Any, low: Any, close: Any,
+                 price_sum: Any, samples: int, max_discount: Optional[int]) -> Dict[str, Any]:
+    return {
+        'date': bucket_start.isoformat(),
+        'open': float(open_price),
+        'high': float(high),
+        'low': float(low),
+        'close': float(close),
+        'avg': round(float(price_sum) / samples, 2),
+        'discount': max_discount or 0,
+        'samples': samples,
+        '_sum': float(price_sum)
+    }
+
+
+def fetch_series(cursor: Any, game_ids: List[int], start: datetime, end: datetime,
+                 bucket: Optional[str]) -> Dict[int, Tuple[List[Dict[str, Any]], Dict[str, Any]]]:
+    '''
+    Для каждой игры - ряд и MIN/MAX/AVG по диапазону. Сырые точки {date, price, discount}
+    вместе со статистикой приходят одним запросом (оконные функции по game_id);
+    OHLC-бакеты {date, open, high, low, close, avg, discount, samples} читаются из rollup-таблиц,
+    хвост после компакции - из сырых строк. В бакетах discount - максимальная скидка за период.
+    '''
+    if bucket is None:
+        result: Dict[int, Tuple[List[Dict[str, Any]], Dict[str, Any]]] = {
+            game_id: ([], empty_stats()) for game_id in game_ids
+        }
+        cursor.execute(RAW_SERIES_SQL, (game_ids, start, end))
+        for game_id, recorded_at, price, discount, min_price, max_price, avg_price, samples in cursor.fetchall():
+            series, stats = result[game_id]
+            if not series:
+                stats.update({
+                    'min_price': float(min_price),
+                    'max_price': float(max_price),
+                    'avg_price': round(float(avg_price), 2),
+                    'samples': samples
+                })
+            series.append({
+                'date': recorded_at.isoformat(),
+                'price': float(price),
+                'discount': discount or 0
+            })
+        return result
+
+    watermarks = get_watermarks(cursor) if bucket in ('day', 'week') else {}
+    result = {}
+    for game_id, rows in fetch_buckets(cursor, game_ids, start, end, bucket, watermarks).items():
+        series = [bucket_point(*row) for row in rows]
+        result[game_id] = (series, bucket_stats(series))
+    return result
+
+
+def empty_stats() -> Dict[str, Any]:
+    return {'min_price': 0, 'max_price': 0, 'avg_price': 0, 'samples': 0}
+
+
+def bucket_stats(series: List[Dict[str, Any]]) -> Dict[str, Any]:
+    '''
+    MIN/MAX/AVG по диапазону считаются из уже выбранных бакетов - без второго запроса.
+    '''
+    if not series:
+        return empty_stats()
+    samples = sum(point['samples'] for point in series)
+    return {
+        'min_price': min(point['low'] for point in series),
+        'max_price': max(point['high'] for point in series),
+        'avg_price': round(sum(point['_sum'] for point in series) / samples, 2),
+        'samples': samples
+    }
+
+
+def downsample(series: List[Dict[str, Any]], points: int) -> List[Dict[str, Any]]:
+    if len(series) <= points:
+        return series
+    xs = [datetime.fromisoformat(point['date']).timestamp() for point in series]
+    ys = [point.get('close', point.get('price')) for point in series]
+    return [series[i] for i in lttb_indices(xs, ys, points)]
+
+
+def trim_series(series: List[Dict[str, Any]], points: Optional[int]) -> List[Dict[str, Any]]:
+    if points:
+        series = downsample(series, points)
+    return [{key: value for key, value in point.items() if key != '_sum'} for point in series]
+
+
+def to_columns(series: List[Dict[str, Any]], bucket: Optional[str]) -> Dict[str, List[Any]]:
+    '''
+    Колоночный вид ряда: параллельные массивы вместо списка объектов,
+    время - unix-секунды (UTC) в массиве t.
+    '''
+    keys = BUCKET_COLUMNS if bucket else RAW_COLUMNS
+    columns: Dict[str, List[Any]] = {key: [] for key in ('t',) + keys}
+    for point in series:
+        columns['t'].append(calendar.timegm(datetime.fromisoformat(point['date']).timetuple()))
+        for key in keys:
+            columns[key].append(point[key])
+    return columns
+
+
+def parse_game_ids(value: str) -> List[int]:
+    game_ids = list(dict.fromkeys(int(g) for g in value.split(',') if g.strip()))
+    if not 1 <= len(game_ids) <= MAX_BATCH_GAME_IDS:
+        raise ValueError(f'game_ids must list 1 to {MAX_BATCH_GAME_IDS} numeric ids')
+    return game_ids
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Получить историю цен игры для графика
-    Args: event с httpMethod (GET), queryStringParameters (game_id)
-    Returns: HTTP response с историей цен за последние 30 дней
+    Args: event с httpMethod (GET), queryStringParameters (game_id или game_ids=1,2,3;
+          опционально from, to, bucket=hour|day|week, points) или POST с action=compact и X-Service-Token - порция компакции в дневные/недельные rollup-таблицы
+    Returns: HTTP response с историей цен за последние 30 дней или за диапазон from..to
+             (сырые точки либо OHLC-бакеты, прореженные LTTB до points);
+             для game_ids - колоночные ряды и статистика по каждой игре
     '''
     method: str = event.get('httpMethod', 'GET')
     
@@ -16,13 +223,55 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
                 'Access-Control-Allow-Headers': 'Content-Type',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
         }
     
+    params = event.get('queryStringParameters') or {}
+    
+    if method == 'POST' and params.get('action') == 'compact':
+        if not is_service_call(event):
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Forbidden'})
+            }
+        
+        started = time.monotonic()
+        conn = db.getconn()
+        try:
+            runs = []
+            while True:
+                run = compact(conn, RAW_RETENTION_DAYS, ROLLUP_MAX_DAYS, ROLLUP_PRUNE_BATCH)
+                runs.append(run)
+                if run['done'] or time.monotonic() - started >= ROLLUP_TIME_BUDGET:
+                    break
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': json.dumps({
+                    'runs': len(runs),
+                    'pruned_raw_rows': sum(run['pruned_raw_rows'] for run in runs),
+                    'daily_rolled_until': runs[-1]['daily']['to'],
+                    'weekly_rolled_until': runs[-1]['weekly']['to'],
+                    'done': runs[-1]['done']
+                })
+            }
+        except Exception as e:
+            return {
+                'statusCode': 500,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': str(e)})
+            }
+        finally:
+            db.putconn(conn)
+    
     if method != 'GET':
         return {
             'statusCode': 405,
@@ -30,26 +279,75 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Method not allowed'})
         }
     
-    params = event.get('queryStringParameters') or {}
     game_id = params.get('game_id')
+    batch_mode = bool(params.get('game_ids'))
     
-    if not game_id:
+    if not game_id and not batch_mode:
         return {
             'statusCode': 400,
             'headers': {'Access-Control-Allow-Origin': '*'},
             'body': json.dumps({'error': 'game_id required'})
         }
     
-    dsn = os.environ.get('DATABASE_URL', '')
-    conn = psycopg2.connect(dsn)
-    conn.autocommit = True
+    range_mode = batch_mode or any(params.get(key) for key in ('from', 'to', 'bucket', 'points'))
+    if range_mode:
+        try:
+            game_ids = parse_game_ids(params['game_ids']) if batch_mode else [int(game_id)]
+            start, end, bucket, points = parse_range(params)
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': str(e)})
+            }
+    
+    conn = db.getconn(autocommit=True)
     cursor = conn.cursor()
     
     try:
+        if range_mode:
+            results = fetch_series(cursor, game_ids, start, end, bucket)
+            
+            cursor.close()
+            db.putconn(conn)
+            
+            body = {
+                'from': start.isoformat(),
+                'to': end.isoformat(),
+                'bucket': bucket or 'raw'
+            }
+            if batch_mode:
+                body['games'] = {
+                    str(gid): {
+                        **to_columns(trim_series(series, points), bucket),
+                        'stats': stats,
+                        'total_points': len(series)
+                    }
+                    for gid, (series, stats) in results.items()
+                }
+            else:
+                series, stats = results[game_ids[0]]
+                body.update({
+                    'game_id': game_ids[0],
+                    'series': trim_series(series, points),
+                    'stats': stats,
+                    'total_points': len(series)
+                })
+            
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'isBase64Encoded': False,
+                'body': json.dumps(body, separators=(',', ':'))
+            }
+        
         cursor.execute('''
             SELECT price, discount_percent, recorded_at
             FROM t_p1573360_game_store_platform.price_history
-            WHERE game_id = %s 
+            WHERE game_id = %s
             AND recorded_at >= CURRENT_DATE - INTERVAL '30 days'
             ORDER BY recorded_at ASC
         ''', (game_id,))
@@ -62,11 +360,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'date': row[2].isoformat() if row[2] else None
             })
         
-        cursor.execute('''
-            SELECT MIN(price) as min_price, MAX(price) as max_price, AVG(price) as avg_price
-            FROM t_p1573360_game_store_platform.price_history
-            WHERE game_id = %s
-        ''', (game_id,))
+        cursor.execute(ALL_TIME_STATS_SQL, (game_id, game_id))
         
         stats_row = cursor.fetchone()
         stats = {
@@ -76,7 +370,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
         
         cursor.close()
-        conn.close()
+        db.putconn(conn)
         
         return {
             'statusCode': 200,
@@ -95,7 +389,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if cursor:
             cursor.close()
         if conn:
-            conn.close()
+            db.putconn(conn)
         return {
             'statusCode': 500,
             'headers': {'Access-Control-Allow-Origin': '*'},
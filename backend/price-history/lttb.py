@@ -0,0 +1,41 @@
+'''
+Прореживание временного ряда алгоритмом Largest-Triangle-Three-Buckets (LTTB):
+из n точек оставляет threshold, сохраняя форму графика (пики и провалы цены).
+'''
+
+from typing import List, Sequence
+
+
+def lttb_indices(xs: Sequence[float], ys: Sequence[float], threshold: int) -> List[int]:
+    '''
+    Индексы точек, которые нужно оставить. Первая и последняя точки сохраняются всегда,
+    xs должны быть отсортированы по возрастанию. При threshold < 3 ряд не прореживается.
+    '''
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    kept = [0]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        span = avg_end - avg_start
+        avg_x = sum(xs[avg_start:avg_end]) / span
+        avg_y = sum(ys[avg_start:avg_end]) / span
+
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        ax, ay = xs[a], ys[a]
+        best_area = -1.0
+        best = range_start
+        for j in range(range_start, range_end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = j
+        kept.append(best)
+        a = best
+    kept.append(n - 1)
+    return kept
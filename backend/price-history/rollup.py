@@ -0,0 +1,195 @@
+'''
+Компакция истории цен: сырые точки сворачиваются в дневные OHLC-бакеты,
+дневные - в недельные, сырые строки старше срока хранения удаляются.
+Прогресс хранится в price_history_rollup_state (rolled_until по уровням),
+поэтому джоб можно вызывать по расписанию маленькими порциями.
+'''
+
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+SCHEMA = 't_p1573360_game_store_platform'
+
+ROLLUP_DAILY_SQL = f'''
+    INSERT INTO {SCHEMA}.price_history_daily
+        (game_id, bucket_start, open, high, low, close, price_sum, samples, max_discount)
+    SELECT game_id,
+           date_trunc('day', recorded_at),
+           (array_agg(price ORDER BY recorded_at ASC))[1],
+           MAX(price),
+           MIN(price),
+           (array_agg(price ORDER BY recorded_at DESC))[1],
+           SUM(price),
+           COUNT(*),
+           COALESCE(MAX(discount_percent), 0)
+    FROM {SCHEMA}.price_history
+    WHERE recorded_at >= %s AND recorded_at < %s
+    GROUP BY 1, 2
+    ON CONFLICT (game_id, bucket_start) DO UPDATE
+    SET open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low, close = EXCLUDED.close,
+        price_sum = EXCLUDED.price_sum, samples = EXCLUDED.samples, max_discount = EXCLUDED.max_discount
+'''
+
+ROLLUP_WEEKLY_SQL = f'''
+    INSERT INTO {SCHEMA}.price_history_weekly
+        (game_id, bucket_start, open, high, low, close, price_sum, samples, max_discount)
+    SELECT game_id,
+           date_trunc('week', bucket_start),
+           (array_agg(open ORDER BY bucket_start ASC))[1],
+           MAX(high),
+           MIN(low),
+           (array_agg(close ORDER BY bucket_start DESC))[1],
+           SUM(price_sum),
+           SUM(samples),
+           MAX(max_discount)
+    FROM {SCHEMA}.price_history_daily
+    WHERE bucket_start >= %s AND bucket_start < %s
+    GROUP BY 1, 2
+    ON CONFLICT (game_id, bucket_start) DO UPDATE
+    SET open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low, close = EXCLUDED.close,
+        price_sum = EXCLUDED.price_sum, samples = EXCLUDED.samples, max_discount = EXCLUDED.max_discount
+'''
+
+PRUNE_RAW_SQL = f'''
+    WITH doomed AS (
+        SELECT id FROM {SCHEMA}.price_history
+        WHERE recorded_at < %s
+        LIMIT %s
+    )
+    DELETE FROM {SCHEMA}.price_history p
+    USING doomed
+    WHERE p.id = doomed.id
+'''
+
+ROLLED_COLUMNS = 'open, high, low, close, price_sum, samples, max_discount'
+
+
+def get_watermarks(cur: Any) -> Dict[str, datetime]:
+    cur.execute(f'SELECT level, rolled_until FROM {SCHEMA}.price_history_rollup_state')
+    return {level: rolled_until for level, rolled_until in cur.fetchall()}
+
+
+def _advance(cur: Any, level: str, sql: str, target: datetime, max_days: int) -> Tuple[datetime, datetime]:
+    '''
+    Сдвигает водяной знак уровня на целое число бакетов (дней или недель): ON CONFLICT
+    в rollup-запросе заменяет бакет целиком, поэтому порция не может кончаться посреди
+    бакета. Начало тоже округляется вниз - так пересчитывается целиком и бакет,
+    оставшийся разрезанным от прежних прогонов.
+    '''
+    cur.execute(f'''
+        SELECT date_trunc(%(level)s, rolled_until),
+               date_trunc(%(level)s, LEAST(%(target)s, rolled_until + make_interval(days => %(max_days)s)))
+        FROM {SCHEMA}.price_history_rollup_state
+        WHERE level = %(level)s
+        FOR UPDATE
+    ''', {'level': level, 'target': target, 'max_days': max(max_days, 7 if level == 'week' else 1)})
+    start, end = cur.fetchone()
+    if end > start:
+        cur.execute(sql, (start, end))
+        cur.execute(
+            f'UPDATE {SCHEMA}.price_history_rollup_state SET rolled_until = %s WHERE level = %s',
+            (end, level)
+        )
+    return start, end
+
+
+def compact(conn: Any, retention_days: int, max_days: int, prune_batch: int) -> Dict[str, Any]:
+    '''
+    Одна порция компакции; каждый шаг - отдельная транзакция.
+    Дневной уровень доходит только до начала текущих суток, недельный - до начала недели,
+    в которой заканчивается дневной. Удаляются лишь уже свёрнутые сырые строки.
+    '''
+    result: Dict[str, Any] = {}
+    with conn.cursor() as cur:
+        cur.execute("SELECT date_trunc('day', CURRENT_TIMESTAMP)::timestamp")
+        today = cur.fetchone()[0]
+        daily_from, daily_to = _advance(cur, 'day', ROLLUP_DAILY_SQL, today, max_days)
+        conn.commit()
+
+        cur.execute("SELECT date_trunc('week', %s::timestamp)", (daily_to,))
+        week_target = cur.fetchone()[0]
+        weekly_from, weekly_to = _advance(cur, 'week', ROLLUP_WEEKLY_SQL, week_target, max_days)
+        conn.commit()
+
+        cur.execute(
+            'SELECT LEAST(%s::timestamp, CURRENT_TIMESTAMP::timestamp - make_interval(days => %s))',
+            (daily_to, retention_days)
+        )
+        prune_before = cur.fetchone()[0]
+        cur.execute(PRUNE_RAW_SQL, (prune_before, prune_batch))
+        pruned = cur.rowcount
+        conn.commit()
+
+    result['daily'] = {'from': daily_from.isoformat(), 'to': daily_to.isoformat()}
+    result['weekly'] = {'from': weekly_from.isoformat(), 'to': weekly_to.isoformat()}
+    result['pruned_raw_rows'] = pruned
+    result['done'] = daily_to >= today and pruned < prune_batch
+    return result
+
+
+def fetch_buckets(cur: Any, game_ids: List[int], start: datetime, end: datetime,
+                  bucket: str, watermarks: Dict[str, datetime]) -> Dict[int, List[Tuple]]:
+    '''
+    OHLC-бакеты из самой грубой подходящей таблицы: недели - из недельной, дни - из дневной,
+    часы - только из сырых строк. Хвост, ещё не свёрнутый джобом, добирается уровнем ниже;
+    бакет на стыке уровней склеивает merge_buckets. Начало диапазона округляется до бакета.
+    Число запросов не зависит от количества игр: каждый уровень читается одним = ANY(%s).
+    '''
+    segments = []
+    rolled_until = watermarks.get(bucket, start)
+    lower = start
+    if bucket == 'week':
+        segments.append((f'''
+            SELECT game_id, bucket_start, {ROLLED_COLUMNS}
+            FROM {SCHEMA}.price_history_weekly
+            WHERE game_id = ANY(%s) AND bucket_start >= date_trunc('week', %s::timestamp)
+              AND bucket_start < LEAST(%s, %s)
+        ''', (game_ids, start, end, rolled_until)))
+        lower = max(start, rolled_until)
+        rolled_until = watermarks.get('day', lower)
+
+    if bucket in ('day', 'week'):
+        segments.append((f'''
+            SELECT game_id, date_trunc(%s, bucket_start),
+                   (array_agg(open ORDER BY bucket_start ASC))[1], MAX(high), MIN(low),
+                   (array_agg(close ORDER BY bucket_start DESC))[1],
+                   SUM(price_sum), SUM(samples), MAX(max_discount)
+            FROM {SCHEMA}.price_history_daily
+            WHERE game_id = ANY(%s) AND bucket_start >= date_trunc('day', %s::timestamp)
+              AND bucket_start < LEAST(%s, %s)
+            GROUP BY 1, 2
+        ''', (bucket, game_ids, lower, end, rolled_until)))
+        lower = max(lower, rolled_until)
+
+    segments.append((f'''
+        SELECT game_id, date_trunc(%s, recorded_at),
+               (array_agg(price ORDER BY recorded_at ASC))[1], MAX(price), MIN(price),
+               (array_agg(price ORDER BY recorded_at DESC))[1],
+               SUM(price), COUNT(*), COALESCE(MAX(discount_percent), 0)
+        FROM {SCHEMA}.price_history
+        WHERE game_id = ANY(%s) AND recorded_at >= %s AND recorded_at < %s
+        GROUP BY 1, 2
+    ''', (bucket, game_ids, lower, end)))
+
+    rows: Dict[int, List[Tuple]] = {game_id: [] for game_id in game_ids}
+    for sql, args in segments:
+        cur.execute(sql + ' ORDER BY 1, 2', args)
+        for row in cur.fetchall():
+            rows[row[0]].append(row[1:])
+    return {game_id: merge_buckets(game_rows) for game_id, game_rows in rows.items()}
+
+
+def merge_buckets(rows: List[Tuple]) -> List[Tuple]:
+    merged: List[list] = []
+    for bucket_start, open_price, high, low, close, price_sum, samples, max_discount in rows:
+        last = merged[-1] if merged else None
+        if last is not None and last[0] == bucket_start:
+            last[2] = max(last[2], high)
+            last[3] = min(last[3], low)
+            last[4] = close
+            last[5] += price_sum
+            last[6] += samples
+            last[7] = max(last[7], max_discount)
+        else:
+            merged.append([bucket_start, open_price, high, low, close, price_sum, samples, max_discount])
+    return [tuple(row) for row in merged]
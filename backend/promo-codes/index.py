@@ -1,9 +1,40 @@
 import json
 import os
+import time
 from typing import Dict, Any, Optional
 from datetime import datetime
-import psycopg2
 from psycopg2.extras import RealDictCursor
+import db
+
+PROMO_CACHE_TTL = float(os.environ.get('PROMO_CACHE_TTL', 60))
+PROMO_PUBLIC_FIELDS = ('code', 'discount_percent', 'description', 'valid_until', 'max_uses', 'current_uses', 'is_active')
+
+_active_promos: Dict[str, Any] = {'loaded_at': 0.0, 'by_code': None}
+
+
+def get_active_promos(cursor: Any) -> Dict[str, Dict[str, Any]]:
+    '''
+    Активные промокоды, закешированные в памяти процесса на PROMO_CACHE_TTL секунд.
+    Ключ - код в верхнем регистре, порядок - по убыванию скидки.
+    '''
+    if _active_promos['by_code'] is None or time.monotonic() - _active_promos['loaded_at'] > PROMO_CACHE_TTL:
+        cursor.execute('''
+            SELECT id, code, discount_percent, max_uses, current_uses,
+                   valid_from, valid_until, is_active, min_purchase_amount, description
+            FROM promo_codes
+            WHERE is_active = true
+              AND (valid_until IS NULL OR valid_until > CURRENT_TIMESTAMP)
+              AND (max_uses IS NULL OR current_uses < max_uses)
+            ORDER BY discount_percent DESC
+        ''')
+        _active_promos['by_code'] = {p['code'].upper(): dict(p) for p in cursor.fetchall()}
+        _active_promos['loaded_at'] = time.monotonic()
+    return _active_promos['by_code']
+
+
+def invalidate_active_promos() -> None:
+    _active_promos['by_code'] = None
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -34,7 +65,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Database not configured'})
         }
     
-    conn = psycopg2.connect(dsn)
+    conn = db.getconn()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
@@ -51,14 +82,17 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({'error': 'Промокод не указан'})
                 }
             
-            cursor.execute('''
-                SELECT id, code, discount_percent, max_uses, current_uses, 
-                       valid_from, valid_until, is_active, min_purchase_amount, description
-                FROM promo_codes
-                WHERE UPPER(code) = %s
-            ''', (code,))
+            promo = get_active_promos(cursor).get(code)
             
-            promo = cursor.fetchone()
+            if not promo:
+                cursor.execute('''
+                    SELECT id, code, discount_percent, max_uses, current_uses, 
+                           valid_from, valid_until, is_active, min_purchase_amount, description
+                    FROM promo_codes
+                    WHERE UPPER(code) = %s
+                ''', (code,))
+                
+                promo = cursor.fetchone()
             
             if not promo:
                 return {
@@ -106,32 +140,50 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 }
             
             cursor.execute('''
-                SELECT COUNT(*) as count
-                FROM promo_code_usage
-                WHERE promo_code_id = %s AND user_identifier = %s
+                WITH used AS (
+                    INSERT INTO promo_code_usage (promo_code_id, user_identifier)
+                    VALUES (%s, %s)
+                    ON CONFLICT (promo_code_id, user_identifier) DO NOTHING
+                    RETURNING promo_code_id
+                ), claimed AS (
+                    UPDATE promo_codes p
+                    SET current_uses = p.current_uses + 1
+                    FROM used
+                    WHERE p.id = used.promo_code_id
+                      AND p.is_active = true
+                      AND (p.valid_from IS NULL OR p.valid_from <= CURRENT_TIMESTAMP)
+                      AND (p.valid_until IS NULL OR p.valid_until > CURRENT_TIMESTAMP)
+                      AND (p.max_uses IS NULL OR p.current_uses < p.max_uses)
+                    RETURNING p.id
+                )
+                SELECT (SELECT COUNT(*) FROM used) AS used,
+                       (SELECT COUNT(*) FROM claimed) AS claimed
             ''', (promo['id'], user_id))
             
-            usage = cursor.fetchone()
-            if usage and usage['count'] > 0:
+            redeem = cursor.fetchone()
+            if not redeem['used']:
+                conn.rollback()
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                     'body': json.dumps({'error': 'Вы уже использовали этот промокод'})
                 }
             
-            cursor.execute('''
-                UPDATE promo_codes
-                SET current_uses = current_uses + 1
-                WHERE id = %s
-            ''', (promo['id'],))
-            
-            cursor.execute('''
-                INSERT INTO promo_code_usage (promo_code_id, user_identifier)
-                VALUES (%s, %s)
-            ''', (promo['id'], user_id))
+            if not redeem['claimed']:
+                conn.rollback()
+                invalidate_active_promos()
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Промокод исчерпан'})
+                }
             
             conn.commit()
             
+            promo['current_uses'] += 1
+            if promo['max_uses'] is not None and promo['current_uses'] >= promo['max_uses']:
+                invalidate_active_promos()
+            
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -144,23 +196,19 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
         
         if method == 'GET':
-            cursor.execute('''
-                SELECT code, discount_percent, description, 
-                       valid_until, max_uses, current_uses, is_active
-                FROM promo_codes
-                WHERE is_active = true
-                  AND (valid_until IS NULL OR valid_until > CURRENT_TIMESTAMP)
-                  AND (max_uses IS NULL OR current_uses < max_uses)
-                ORDER BY discount_percent DESC
-            ''')
-            
-            promos = cursor.fetchall()
+            now = datetime.now()
+            promos = [
+                {field: p[field] for field in PROMO_PUBLIC_FIELDS}
+                for p in get_active_promos(cursor).values()
+                if (p['valid_until'] is None or p['valid_until'] > now)
+                and (p['max_uses'] is None or p['current_uses'] < p['max_uses'])
+            ]
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                 'body': json.dumps({
-                    'promos': [dict(p) for p in promos]
+                    'promos': promos
                 }, default=str)
             }
         
@@ -172,4 +220,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     finally:
         cursor.close()
-        conn.close()
+        db.putconn(conn)
@@ -0,0 +1,89 @@
+'''
+Нагрузочный тест погашения промокода: тысячи параллельных POST в handler на один
+код с max_uses и проверка, что погашений ровно min(запросов, max_uses), а
+current_uses совпадает с числом строк promo_code_usage.
+
+Запуск против тестовой базы (создаёт и удаляет свой код):
+    DATABASE_URL=postgres://... python load_test.py --requests 5000 --workers 64 --max-uses 100
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=64)
+    parser.add_argument('--max-uses', type=int, default=100)
+    args = parser.parse_args()
+
+    # Пул должен вмещать все потоки, иначе тест мерил бы ожидание соединения
+    os.environ['DB_POOL_MAX_SIZE'] = str(args.workers)
+    os.environ.setdefault('DB_POOL_WAIT_TIMEOUT', '30')
+    import db
+    import index
+
+    code = f'LOADTEST{uuid.uuid4().hex[:12].upper()}'
+    conn = db.getconn(autocommit=True)
+    try:
+        with conn.cursor() as cur:
+            cur.execute('''
+                INSERT INTO promo_codes (code, discount_percent, max_uses, current_uses, is_active, description)
+                VALUES (%s, 10, %s, 0, true, 'load test')
+                RETURNING id
+            ''', (code, args.max_uses))
+            promo_id = cur.fetchone()[0]
+    finally:
+        db.putconn(conn)
+    index.invalidate_active_promos()
+
+    def redeem(n: int) -> int:
+        event = {
+            'httpMethod': 'POST',
+            'body': json.dumps({'code': code, 'userIdentifier': f'load-{n}'})
+        }
+        return index.handler(event, None)['statusCode']
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        statuses = Counter(pool.map(redeem, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    conn = db.getconn(autocommit=True)
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT current_uses FROM promo_codes WHERE id = %s', (promo_id,))
+            current_uses = cur.fetchone()[0]
+            cur.execute('SELECT COUNT(*) FROM promo_code_usage WHERE promo_code_id = %s', (promo_id,))
+            usage_rows = cur.fetchone()[0]
+            cur.execute('DELETE FROM promo_code_usage WHERE promo_code_id = %s', (promo_id,))
+            cur.execute('DELETE FROM promo_codes WHERE id = %s', (promo_id,))
+    finally:
+        db.putconn(conn)
+
+    expected = min(args.requests, args.max_uses)
+    print(json.dumps({
+        'requests': args.requests,
+        'workers': args.workers,
+        'max_uses': args.max_uses,
+        'statuses': dict(statuses),
+        'current_uses': current_uses,
+        'usage_rows': usage_rows,
+        'elapsed_s': round(elapsed, 3),
+        'requests_per_s': round(args.requests / elapsed, 1)
+    }, indent=2))
+
+    ok = statuses.get(200, 0) == expected and current_uses == expected and usage_rows == expected
+    print('OK' if ok else f'FAIL: expected exactly {expected} redemptions')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,8 @@
 import json
-import os
-import psycopg2
 from psycopg2.extras import RealDictCursor
 from typing import Dict, Any
 from datetime import datetime
+import db
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -26,59 +25,59 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': ''
         }
     
-    dsn: str = os.environ.get('DATABASE_URL', '')
-    
     if method == 'GET':
         params = event.get('queryStringParameters', {})
         user_id: int = int(params.get('user_id', 1))
         
-        conn = psycopg2.connect(dsn)
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cur.execute('''
-            SELECT referral_code, loyalty_points
-            FROM users 
-            WHERE id = %s
-        ''', (user_id,))
-        user_data = cur.fetchone()
-        
-        cur.execute('''
-            SELECT 
-                r.id,
-                r.referral_code,
-                r.referred_email,
-                r.status,
-                r.bonus_amount,
-                r.bonus_paid,
-                r.created_at,
-                r.completed_at,
-                u.name as referred_name
-            FROM referrals r
-            LEFT JOIN users u ON r.referred_user_id = u.id
-            WHERE r.referrer_user_id = %s
-            ORDER BY r.created_at DESC
-        ''', (user_id,))
-        referrals = cur.fetchall()
-        
-        cur.execute('''
-            SELECT 
-                bonus_type,
-                amount,
-                description,
-                created_at
-            FROM referral_bonuses
-            WHERE user_id = %s
-            ORDER BY created_at DESC
-        ''', (user_id,))
-        bonuses = cur.fetchall()
-        
-        total_earned: float = sum(float(b['amount']) for b in bonuses)
-        total_referrals: int = len(referrals)
-        completed_referrals: int = len([r for r in referrals if r['status'] == 'completed'])
-        pending_referrals: int = len([r for r in referrals if r['status'] == 'pending'])
-        
-        cur.close()
-        conn.close()
+        conn = db.getconn()
+        try:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            
+            cur.execute('''
+                SELECT referral_code, loyalty_points
+                FROM users 
+                WHERE id = %s
+            ''', (user_id,))
+            user_data = cur.fetchone()
+            
+            cur.execute('''
+                SELECT 
+                    r.id,
+                    r.referral_code,
+                    r.referred_email,
+                    r.status,
+                    r.bonus_amount,
+                    r.bonus_paid,
+                    r.created_at,
+                    r.completed_at,
+                    u.name as referred_name
+                FROM referrals r
+                LEFT JOIN users u ON r.referred_user_id = u.id
+                WHERE r.referrer_user_id = %s
+                ORDER BY r.created_at DESC
+            ''', (user_id,))
+            referrals = cur.fetchall()
+            
+            cur.execute('''
+                SELECT 
+                    bonus_type,
+                    amount,
+                    description,
+                    created_at
+                FROM referral_bonuses
+                WHERE user_id = %s
+                ORDER BY created_at DESC
+            ''', (user_id,))
+            bonuses = cur.fetchall()
+            
+            total_earned: float = sum(float(b['amount']) for b in bonuses)
+            total_referrals: int = len(referrals)
+            completed_referrals: int = len([r for r in referrals if r['status'] == 'completed'])
+            pending_referrals: int = len([r for r in referrals if r['status'] == 'pending'])
+            
+            cur.close()
+        finally:
+            db.putconn(conn)
         
         result = {
             'user': {
@@ -140,28 +139,30 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if action == 'invite':
             email: str = body_data.get('email', '')
             
-            conn = psycopg2.connect(dsn)
-            cur = conn.cursor(cursor_factory=RealDictCursor)
-            
-            cur.execute('SELECT referral_code FROM users WHERE id = %s', (user_id,))
-            user_data = cur.fetchone()
-            referral_code: str = user_data['referral_code']
-            
-            timestamp: str = datetime.now().strftime('%H%M%S')
-            new_code: str = f"R{user_id}{timestamp}"[:20]
-            
-            cur.execute('''
-                INSERT INTO referrals 
-                (referrer_user_id, referral_code, referred_email, status, created_at)
-                VALUES (%s, %s, %s, 'pending', CURRENT_TIMESTAMP)
-                RETURNING id
-            ''', (user_id, new_code, email))
-            
-            new_referral_id = cur.fetchone()['id']
-            
-            conn.commit()
-            cur.close()
-            conn.close()
+            conn = db.getconn()
+            try:
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                
+                cur.execute('SELECT referral_code FROM users WHERE id = %s', (user_id,))
+                user_data = cur.fetchone()
+                referral_code: str = user_data['referral_code']
+                
+                timestamp: str = datetime.now().strftime('%H%M%S')
+                new_code: str = f"R{user_id}{timestamp}"[:20]
+                
+                cur.execute('''
+                    INSERT INTO referrals 
+                    (referrer_user_id, referral_code, referred_email, status, created_at)
+                    VALUES (%s, %s, %s, 'pending', CURRENT_TIMESTAMP)
+                    RETURNING id
+                ''', (user_id, new_code, email))
+                
+                new_referral_id = cur.fetchone()['id']
+                
+                conn.commit()
+                cur.close()
+            finally:
+                db.putconn(conn)
             
             return {
                 'statusCode': 200,
@@ -1,13 +1,134 @@
+import hmac
 import json
 import os
-import psycopg2
-from typing import Dict, Any
+import threading
+import time
+import db
+from typing import Dict, Any, Optional
+
+FLUSH_INTERVAL = float(os.environ.get('HELPFUL_FLUSH_INTERVAL', 10))
+FLUSH_BATCH_SIZE = int(os.environ.get('HELPFUL_FLUSH_BATCH_SIZE', 50000))
+SERVICE_TOKEN = os.environ.get('SERVICE_TOKEN', '')
+
+VOTE_SQL = '''
+    WITH ins AS (
+        INSERT INTO t_p1573360_game_store_platform.review_votes (review_id, voter, helpful)
+        SELECT id, %(voter)s, %(helpful)s FROM t_p1573360_game_store_platform.reviews WHERE id = %(review_id)s
+        ON CONFLICT (review_id, voter) DO NOTHING
+        RETURNING helpful
+    ), pending AS (
+        SELECT helpful FROM t_p1573360_game_store_platform.review_votes
+        WHERE review_id = %(review_id)s AND flushed_at IS NULL
+        UNION ALL
+        SELECT helpful FROM ins
+    )
+    SELECT r.helpful_count + (SELECT COUNT(*) FROM pending WHERE helpful),
+           r.not_helpful_count + (SELECT COUNT(*) FROM pending WHERE NOT helpful),
+           (SELECT COUNT(*) FROM ins) > 0
+    FROM t_p1573360_game_store_platform.reviews r
+    WHERE r.id = %(review_id)s
+'''
+
+FLUSH_SQL = '''
+    WITH claimed AS (
+        UPDATE t_p1573360_game_store_platform.review_votes v
+        SET flushed_at = CURRENT_TIMESTAMP
+        FROM (
+            SELECT review_id, voter
+            FROM t_p1573360_game_store_platform.review_votes
+            WHERE flushed_at IS NULL
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        ) pending
+        WHERE v.review_id = pending.review_id AND v.voter = pending.voter
+        RETURNING v.review_id, v.helpful
+    ), deltas AS (
+        SELECT review_id,
+               COUNT(*) FILTER (WHERE helpful) AS votes,
+               COUNT(*) FILTER (WHERE NOT helpful) AS down_votes
+        FROM claimed GROUP BY review_id
+    ), updated AS (
+        UPDATE t_p1573360_game_store_platform.reviews r
+        SET helpful_count = r.helpful_count + d.votes,
+            not_helpful_count = r.not_helpful_count + d.down_votes
+        FROM deltas d
+        WHERE r.id = d.review_id
+        RETURNING r.game_id, d.votes, d.down_votes
+    ), stats AS (
+        UPDATE t_p1573360_game_store_platform.review_stats s
+        SET helpful_total = s.helpful_total + g.votes,
+            updated_at = CURRENT_TIMESTAMP
+        FROM (SELECT game_id, SUM(votes) AS votes FROM updated GROUP BY game_id) g
+        WHERE s.game_id = g.game_id
+    )
+    SELECT COUNT(*), COALESCE(SUM(votes), 0), COALESCE(SUM(down_votes), 0) FROM updated
+'''
+
+_flush_lock = threading.Lock()
+_last_flush = 0.0
+
+
+def is_service_call(event: Dict[str, Any]) -> bool:
+    '''
+    Служебный вызов (планировщик сброса голосов): X-Service-Token совпадает с SERVICE_TOKEN.
+    Без настроенного токена служебные действия закрыты.
+    '''
+    headers = event.get('headers') or {}
+    token = headers.get('X-Service-Token') or headers.get('x-service-token') or ''
+    return bool(SERVICE_TOKEN) and hmac.compare_digest(token, SERVICE_TOKEN)
+
+
+def flush_votes(batch_size: int) -> Dict[str, int]:
+    '''
+    Переносит накопленные голоса в reviews.helpful_count/not_helpful_count и review_stats.helpful_total
+    одним запросом: по одному UPDATE на отзыв за порцию вместо записи на каждый клик.
+    Триггер пересчитывает wilson_score в той же строке. SKIP LOCKED позволяет
+    нескольким инстансам сбрасывать параллельно.
+    '''
+    conn = db.getconn(autocommit=True)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(FLUSH_SQL, (batch_size,))
+            reviews, votes, down_votes = cur.fetchone()
+    finally:
+        db.putconn(conn)
+    return {'reviews': reviews, 'votes': int(votes), 'not_helpful_votes': int(down_votes)}
+
+
+def maybe_flush_in_background() -> None:
+    global _last_flush
+    with _flush_lock:
+        if time.monotonic() - _last_flush < FLUSH_INTERVAL:
+            return
+        _last_flush = time.monotonic()
+
+    def run() -> None:
+        try:
+            flush_votes(FLUSH_BATCH_SIZE)
+        except Exception:
+            pass
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def get_voter(event: Dict[str, Any]) -> Optional[str]:
+    '''
+    Голосующий для дедупликации: X-User-Id, иначе IP клиента из requestContext.
+    '''
+    headers = event.get('headers') or {}
+    user_id = headers.get('x-user-id') or headers.get('X-User-Id')
+    if user_id:
+        return f'user:{user_id}'
+    source_ip = ((event.get('requestContext') or {}).get('identity') or {}).get('sourceIp')
+    return f'ip:{source_ip}' if source_ip else None
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
-    Business: Отметить отзыв как полезный
-    Args: event с httpMethod (POST), body (review_id)
-    Returns: HTTP response с обновлённым количеством
+    Business: Отметить отзыв как полезный или бесполезный (один голос на пользователя)
+    Args: event с httpMethod (POST), headers (X-User-Id), body (review_id, helpful=true|false);
+          POST с action=flush в query и X-Service-Token - сброс накопленных голосов в счётчики
+    Returns: HTTP response с количеством с учётом ещё не сброшенных голосов
     '''
     method: str = event.get('httpMethod', 'POST')
     
@@ -17,7 +138,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
@@ -30,8 +151,36 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Method not allowed'})
         }
     
+    params = event.get('queryStringParameters') or {}
+    if params.get('action') == 'flush':
+        if not is_service_call(event):
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Forbidden'})
+            }
+        
+        try:
+            result = flush_votes(FLUSH_BATCH_SIZE)
+        except Exception as e:
+            return {
+                'statusCode': 500,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': str(e)})
+            }
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'isBase64Encoded': False,
+            'body': json.dumps(result)
+        }
+    
     body_data = json.loads(event.get('body', '{}'))
     review_id = body_data.get('review_id')
+    helpful = body_data.get('helpful', True) is not False
     
     if not review_id:
         return {
@@ -40,32 +189,34 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'review_id required'})
         }
     
-    dsn = os.environ.get('DATABASE_URL', '')
-    conn = psycopg2.connect(dsn)
-    conn.autocommit = True
+    voter = get_voter(event)
+    if not voter:
+        return {
+            'statusCode': 400,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'X-User-Id header required'})
+        }
+    
+    conn = db.getconn(autocommit=True)
     cursor = conn.cursor()
     
     try:
-        cursor.execute('''
-            UPDATE t_p1573360_game_store_platform.reviews
-            SET helpful_count = COALESCE(helpful_count, 0) + 1
-            WHERE id = %s
-            RETURNING helpful_count
-        ''', (review_id,))
+        cursor.execute(VOTE_SQL, {'review_id': review_id, 'voter': voter, 'helpful': helpful})
         
         row = cursor.fetchone()
         if not row:
             cursor.close()
-            conn.close()
+            db.putconn(conn)
             return {
                 'statusCode': 404,
                 'headers': {'Access-Control-Allow-Origin': '*'},
                 'body': json.dumps({'error': 'Review not found'})
             }
         
-        helpful_count = row[0]
+        helpful_count, not_helpful_count, counted = row
         cursor.close()
-        conn.close()
+        db.putconn(conn)
+        maybe_flush_in_background()
         
         return {
             'statusCode': 200,
@@ -74,14 +225,18 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'Access-Control-Allow-Origin': '*'
             },
             'isBase64Encoded': False,
-            'body': json.dumps({'helpful_count': helpful_count})
+            'body': json.dumps({
+                'helpful_count': helpful_count,
+                'not_helpful_count': not_helpful_count,
+                'counted': counted
+            })
         }
     
     except Exception as e:
         if cursor:
             cursor.close()
         if conn:
-            conn.close()
+            db.putconn(conn)
         return {
             'statusCode': 500,
             'headers': {'Access-Control-Allow-Origin': '*'},
@@ -1,13 +1,154 @@
+import base64
 import json
 import os
-from typing import Dict, Any
-import psycopg2
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
 from psycopg2.extras import RealDictCursor
+import db
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 1000
+NAMED_CURSOR_THRESHOLD = 200
+MAX_STATS_GAME_IDS = 100
+REVIEW_COLUMNS = ('id, game_id, user_name, rating, comment, created_at, is_verified, helpful_count, '
+                  'not_helpful_count, wilson_score, verified_purchase')
+
+# Ключ keyset-пагинации для каждого режима: все столбцы по убыванию, id замыкает порядок.
+# "-rating" даёт "сначала низкие" с тем же направлением, что и у created_at, поэтому
+# продолжение страницы - одно сравнение строк по составному индексу игры (V0036).
+SORT_KEYS: Dict[str, Tuple[str, ...]] = {
+    'newest': ('created_at', 'id'),
+    'helpful': ('helpful_count', 'id'),
+    'rating_desc': ('rating', 'created_at', 'id'),
+    'rating_asc': ('-rating', 'created_at', 'id'),
+    'verified': ('created_at', 'id'),
+    'best': ('wilson_score', 'id'),
+}
+SORT_FILTERS = {'verified': 'verified_purchase'}
+KEY_PARSERS = {'created_at': datetime.fromisoformat, 'wilson_score': float}
+
+
+def sort_key_values(review: Dict[str, Any], sort: str) -> List[Any]:
+    return [-review[key[1:]] if key.startswith('-') else review[key] for key in SORT_KEYS[sort]]
+
+
+def encode_cursor(sort: str, values: List[Any]) -> str:
+    raw = '|'.join([sort] + [v.isoformat() if isinstance(v, datetime) else repr(v) for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str, sort: str) -> List[Any]:
+    cursor_sort, *values = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    keys = SORT_KEYS[sort]
+    if cursor_sort != sort or len(values) != len(keys):
+        raise ValueError('cursor does not match sort')
+    return [KEY_PARSERS.get(key, int)(value) for key, value in zip(keys, values)]
+
+
+def fetch_reviews_page(conn: Any, game_id: Optional[int], limit: int,
+                       after: Optional[List[Any]], sort: str = 'newest') -> Dict[str, Any]:
+    '''
+    Keyset-страница отзывов в порядке SORT_KEYS[sort]; стоимость зависит только от limit.
+    Большие страницы читаются серверным именованным курсором порциями,
+    чтобы не вытягивать весь результат в память одним fetchall.
+    '''
+    keys = SORT_KEYS[sort]
+    conditions: List[str] = []
+    args: List[Any] = []
+    if game_id is not None:
+        conditions.append('game_id = %s')
+        args.append(game_id)
+    if sort in SORT_FILTERS:
+        conditions.append(SORT_FILTERS[sort])
+    if after is not None:
+        conditions.append(f"({', '.join(keys)}) < ({', '.join(['%s'] * len(keys))})")
+        args.extend(after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    query = f"""
+        SELECT {REVIEW_COLUMNS}
+        FROM t_p1573360_game_store_platform.reviews
+        {where}
+        ORDER BY {', '.join(f'{key} DESC' for key in keys)}
+        LIMIT %s
+    """
+    args.append(limit + 1)
+    
+    if limit >= NAMED_CURSOR_THRESHOLD:
+        cur = conn.cursor(name='reviews_page', cursor_factory=RealDictCursor)
+        cur.itersize = NAMED_CURSOR_THRESHOLD
+    else:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+    
+    reviews: List[Dict[str, Any]] = []
+    next_cursor = None
+    try:
+        cur.execute(query, args)
+        for review in cur:
+            if len(reviews) == limit:
+                next_cursor = encode_cursor(sort, last_key)
+                break
+            last_key = sort_key_values(review, sort)
+            review['created_at'] = review['created_at'].isoformat()
+            reviews.append(review)
+    finally:
+        cur.close()
+    
+    return {'reviews': reviews, 'next_cursor': next_cursor}
+
+
+def apply_stats_delta(cur: Any, game_id: int, rating: int, verified: bool,
+                      helpful_count: int, sign: int) -> None:
+    '''
+    Инкрементально обновляет review_stats при добавлении (sign=1)
+    или удалении (sign=-1) отзыва в той же транзакции.
+    '''
+    histogram = [sign if rating == star else 0 for star in range(1, 6)]
+    cur.execute("""
+        INSERT INTO t_p1573360_game_store_platform.review_stats
+        (game_id, review_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5,
+         verified_count, helpful_total)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (game_id) DO UPDATE SET
+            review_count = review_stats.review_count + EXCLUDED.review_count,
+            rating_sum = review_stats.rating_sum + EXCLUDED.rating_sum,
+            rating_1 = review_stats.rating_1 + EXCLUDED.rating_1,
+            rating_2 = review_stats.rating_2 + EXCLUDED.rating_2,
+            rating_3 = review_stats.rating_3 + EXCLUDED.rating_3,
+            rating_4 = review_stats.rating_4 + EXCLUDED.rating_4,
+            rating_5 = review_stats.rating_5 + EXCLUDED.rating_5,
+            verified_count = review_stats.verified_count + EXCLUDED.verified_count,
+            helpful_total = review_stats.helpful_total + EXCLUDED.helpful_total,
+            updated_at = CURRENT_TIMESTAMP
+    """, (game_id, sign, sign * rating, *histogram, sign if verified else 0, sign * helpful_count))
+
+
+def fetch_review_stats(cur: Any, game_ids: List[int]) -> Dict[str, Any]:
+    cur.execute("""
+        SELECT game_id, review_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5,
+               verified_count, helpful_total
+        FROM t_p1573360_game_store_platform.review_stats
+        WHERE game_id = ANY(%s)
+    """, (game_ids,))
+    rows = {row['game_id']: row for row in cur.fetchall()}
+    
+    stats: Dict[str, Any] = {}
+    for game_id in game_ids:
+        row = rows.get(game_id)
+        count = row['review_count'] if row else 0
+        stats[str(game_id)] = {
+            'review_count': count,
+            'average_rating': round(row['rating_sum'] / count, 2) if count else 0,
+            'histogram': {str(star): row[f'rating_{star}'] if row else 0 for star in range(1, 6)},
+            'verified_count': row['verified_count'] if row else 0,
+            'helpful_total': row['helpful_total'] if row else 0
+        }
+    return stats
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Управление отзывами игр (получение, добавление, модерация)
-    Args: event - dict с httpMethod, body, queryStringParameters
+    Args: event - dict с httpMethod, body, queryStringParameters (game_id, limit, cursor, sort=newest|helpful|rating_desc|rating_asc|verified|best | action=stats, game_ids)
           context - объект с request_id
     Returns: HTTP response с отзывами или результатом операции
     '''
@@ -36,22 +177,86 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Database not configured'})
         }
     
+    conn = None
     try:
-        conn = psycopg2.connect(database_url)
+        conn = db.getconn()
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
         if method == 'GET':
             params = event.get('queryStringParameters') or {}
             game_id = params.get('game_id')
             
+            if params.get('action') == 'stats':
+                try:
+                    game_ids = [int(g) for g in (params.get('game_ids') or '').split(',') if g.strip()]
+                except ValueError:
+                    game_ids = []
+                
+                if not game_ids or len(game_ids) > MAX_STATS_GAME_IDS:
+                    cur.close()
+                    db.putconn(conn)
+                    return {
+                        'statusCode': 400,
+                        'headers': {
+                            'Content-Type': 'application/json',
+                            'Access-Control-Allow-Origin': '*'
+                        },
+                        'body': json.dumps({'error': f'game_ids must list 1 to {MAX_STATS_GAME_IDS} numeric ids'})
+                    }
+                
+                stats = fetch_review_stats(cur, game_ids)
+                cur.close()
+                db.putconn(conn)
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'stats': stats})
+                }
+            
+            if params.get('limit') or params.get('cursor') or params.get('sort'):
+                sort = params.get('sort') or 'newest'
+                try:
+                    if sort not in SORT_KEYS or (sort != 'newest' and not game_id):
+                        raise ValueError(sort)
+                    limit = min(max(int(params.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+                    after = decode_cursor(params['cursor'], sort) if params.get('cursor') else None
+                except (ValueError, TypeError):
+                    cur.close()
+                    db.putconn(conn)
+                    return {
+                        'statusCode': 400,
+                        'headers': {
+                            'Content-Type': 'application/json',
+                            'Access-Control-Allow-Origin': '*'
+                        },
+                        'body': json.dumps({'error': 'Invalid limit, cursor or sort'})
+                    }
+                
+                page = fetch_reviews_page(conn, int(game_id) if game_id else None, limit, after, sort)
+                cur.close()
+                db.putconn(conn)
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps(page, ensure_ascii=False)
+                }
+            
             if game_id:
                 cur.execute(
-                    "SELECT id, game_id, user_name, rating, comment, created_at, is_verified, helpful_count, verified_purchase FROM t_p1573360_game_store_platform.reviews WHERE game_id = %s ORDER BY created_at DESC",
+                    "SELECT id, game_id, user_name, rating, comment, created_at, is_verified, helpful_count, verified_purchase FROM t_p1573360_game_store_platform.reviews WHERE game_id = %s ORDER BY created_at DESC, id DESC",
                     (int(game_id),)
                 )
             else:
                 cur.execute(
-                    "SELECT id, game_id, user_name, rating, comment, created_at, is_verified, helpful_count, verified_purchase FROM t_p1573360_game_store_platform.reviews ORDER BY created_at DESC LIMIT 100"
+                    "SELECT id, game_id, user_name, rating, comment, created_at, is_verified, helpful_count, verified_purchase FROM t_p1573360_game_store_platform.reviews ORDER BY created_at DESC, id DESC LIMIT 100"
                 )
             
             reviews = cur.fetchall()
@@ -61,7 +266,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     review['created_at'] = review['created_at'].isoformat()
             
             cur.close()
-            conn.close()
+            db.putconn(conn)
             
             return {
                 'statusCode': 200,
@@ -82,7 +287,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             if not game_id or not rating:
                 cur.close()
-                conn.close()
+                db.putconn(conn)
                 return {
                     'statusCode': 400,
                     'headers': {
@@ -94,7 +299,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             if rating < 1 or rating > 5:
                 cur.close()
-                conn.close()
+                db.putconn(conn)
                 return {
                     'statusCode': 400,
                     'headers': {
@@ -112,9 +317,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             )
             
             review_id = cur.fetchone()['id']
+            apply_stats_delta(cur, int(game_id), int(rating), bool(verified_purchase), 0, 1)
             conn.commit()
             cur.close()
-            conn.close()
+            db.putconn(conn)
             
             return {
                 'statusCode': 201,
@@ -134,7 +340,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             if not review_id:
                 cur.close()
-                conn.close()
+                db.putconn(conn)
                 return {
                     'statusCode': 400,
                     'headers': {
@@ -144,10 +350,17 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({'error': 'Review id is required'})
                 }
             
-            cur.execute("DELETE FROM reviews WHERE id = %s", (review_id,))
+            cur.execute(
+                "DELETE FROM t_p1573360_game_store_platform.reviews WHERE id = %s RETURNING game_id, rating, verified_purchase, helpful_count",
+                (review_id,)
+            )
+            deleted = cur.fetchone()
+            if deleted:
+                apply_stats_delta(cur, deleted['game_id'], deleted['rating'],
+                                  bool(deleted['verified_purchase']), deleted['helpful_count'] or 0, -1)
             conn.commit()
             cur.close()
-            conn.close()
+            db.putconn(conn)
             
             return {
                 'statusCode': 200,
@@ -160,7 +373,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         else:
             cur.close()
-            conn.close()
+            db.putconn(conn)
             return {
                 'statusCode': 405,
                 'headers': {
@@ -171,6 +384,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
     
     except Exception as e:
+        if conn:
+            db.putconn(conn)
         return {
             'statusCode': 500,
             'headers': {
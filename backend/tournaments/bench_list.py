@@ -0,0 +1,109 @@
+'''
+Замер латентности list_tournaments: прежний коррелированный COUNT(*) по
+tournament_participants на каждую строку против хранимого participants_count.
+Создаёт --tournaments турниров в далёком будущем (они и попадают в первые 20 списка)
+со 100k участниками суммарно, меряет оба запроса и удаляет свои строки.
+
+Запуск против тестовой базы:
+    DATABASE_URL=postgres://... python bench_list.py --participants 100000 --repeats 20
+'''
+
+import argparse
+import json
+import statistics
+import sys
+import time
+import uuid
+from typing import Any, List
+
+OLD_LIST_SQL = '''
+    SELECT t.*, g.title as game_title,
+           (SELECT COUNT(*) FROM tournament_participants WHERE tournament_id = t.id) as participants_count
+    FROM tournaments t
+    LEFT JOIN games g ON t.game_id = g.id
+    ORDER BY t.start_date DESC
+    LIMIT 20
+'''
+
+NEW_LIST_SQL = '''
+    SELECT t.*, g.title as game_title
+    FROM tournaments t
+    LEFT JOIN games g ON t.game_id = g.id
+    ORDER BY t.start_date DESC
+    LIMIT 20
+'''
+
+
+def timings_ms(cur: Any, sql: str, repeats: int) -> List[float]:
+    cur.execute(sql)
+    cur.fetchall()
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        cur.execute(sql)
+        cur.fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def summary(timings: List[float]) -> dict:
+    ordered = sorted(timings)
+    return {
+        'median_ms': round(statistics.median(ordered), 2),
+        'p95_ms': round(ordered[int(len(ordered) * 0.95) - 1], 2),
+        'max_ms': round(ordered[-1], 2)
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--participants', type=int, default=100_000)
+    parser.add_argument('--tournaments', type=int, default=20)
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    import db
+
+    marker = f'BENCH {uuid.uuid4().hex[:12]}'
+    per_tournament = args.participants // args.tournaments
+    conn = db.getconn(autocommit=True)
+    try:
+        with conn.cursor() as cur:
+            cur.execute('''
+                INSERT INTO tournaments (name, start_date, end_date, max_participants, participants_count)
+                SELECT %s, TIMESTAMP '2100-01-01' + n * INTERVAL '1 day',
+                       TIMESTAMP '2100-01-02' + n * INTERVAL '1 day', %s, %s
+                FROM generate_series(1, %s) n
+                RETURNING id
+            ''', (marker, per_tournament, per_tournament, args.tournaments))
+            tournament_ids = [row[0] for row in cur.fetchall()]
+            cur.execute('''
+                INSERT INTO tournament_participants (tournament_id, user_id)
+                SELECT t.id, u
+                FROM unnest(%s::int[]) AS t(id)
+                CROSS JOIN generate_series(1, %s) u
+            ''', (tournament_ids, per_tournament))
+            cur.execute('ANALYZE tournaments')
+            cur.execute('ANALYZE tournament_participants')
+
+            try:
+                before = timings_ms(cur, OLD_LIST_SQL, args.repeats)
+                after = timings_ms(cur, NEW_LIST_SQL, args.repeats)
+            finally:
+                cur.execute('DELETE FROM tournament_participants WHERE tournament_id = ANY(%s)', (tournament_ids,))
+                cur.execute('DELETE FROM tournaments WHERE id = ANY(%s)', (tournament_ids,))
+    finally:
+        db.putconn(conn)
+
+    print(json.dumps({
+        'participants': per_tournament * args.tournaments,
+        'tournaments': args.tournaments,
+        'repeats': args.repeats,
+        'correlated_count': summary(before),
+        'participants_count_column': summary(after)
+    }, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,12 +4,46 @@ Args: event с httpMethod, queryStringParameters, body; context с request_id
 Returns: HTTP response с турнирами, лидербордом или результатом операции
 """
 
+import hmac
 import json
 import os
-from typing import Dict, Any
-import psycopg2
+from typing import Dict, Any, List
 from psycopg2.extras import RealDictCursor
 from datetime import datetime
+import db
+from leaderboard import get_board, add_score
+
+LEADERBOARD_TTL = float(os.environ.get('LEADERBOARD_TTL', 30))
+LEADERBOARD_CATEGORIES = frozenset(
+    c.strip() for c in os.environ.get('LEADERBOARD_CATEGORIES', 'total_spent,tournament_points').split(',') if c.strip()
+)
+SERVICE_TOKEN = os.environ.get('SERVICE_TOKEN', '')
+LEADERBOARD_TOP = 100
+MAX_NEIGHBORS_RADIUS = 50
+
+
+def with_user_names(cur: Any, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    user_ids = [e['user_id'] for e in entries]
+    if not user_ids:
+        return entries
+    cur.execute('SELECT id, name, email FROM users WHERE id = ANY(%s)', (user_ids,))
+    users = {row[0]: row for row in cur.fetchall()}
+    for e in entries:
+        user = users.get(e['user_id'])
+        e['name'] = user[1] if user else None
+        e['email'] = user[2] if user else None
+    return entries
+
+
+def is_service_call(event: Dict[str, Any]) -> bool:
+    '''
+    Служебный вызов из другой функции (оформление заказа): X-Service-Token совпадает с SERVICE_TOKEN.
+    Без настроенного токена служебные действия закрыты.
+    '''
+    headers = event.get('headers') or {}
+    token = headers.get('X-Service-Token') or headers.get('x-service-token') or ''
+    return bool(SERVICE_TOKEN) and hmac.compare_digest(token, SERVICE_TOKEN)
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -26,19 +60,25 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': ''
         }
     
-    dsn = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(dsn)
+    conn = db.getconn()
     
     try:
         if method == 'GET':
             params = event.get('queryStringParameters') or {}
             action = params.get('action', 'list_tournaments')
             
+            if action in ('leaderboard', 'my_rank', 'neighbors') \
+                    and params.get('category', 'total_spent') not in LEADERBOARD_CATEGORIES:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': f"category должна быть одной из: {', '.join(sorted(LEADERBOARD_CATEGORIES))}"})
+                }
+            
             if action == 'list_tournaments':
                 with conn.cursor(cursor_factory=RealDictCursor) as cur:
                     cur.execute("""
-                        SELECT t.*, g.title as game_title,
-                               (SELECT COUNT(*) FROM tournament_participants WHERE tournament_id = t.id) as participants_count
+                        SELECT t.*, g.title as game_title
                         FROM tournaments t
                         LEFT JOIN games g ON t.game_id = g.id
                         ORDER BY t.start_date DESC
@@ -62,25 +102,36 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             elif action == 'leaderboard':
                 category = params.get('category', 'total_spent')
-                with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                    cur.execute("""
-                        SELECT l.*, u.name, u.email
-                        FROM leaderboard l
-                        JOIN users u ON l.user_id = u.id
-                        WHERE l.category = %s
-                        ORDER BY l.rank ASC
-                        LIMIT 100
-                    """, (category,))
-                    leaders = cur.fetchall()
+                with conn.cursor() as cur:
+                    board = get_board(cur, category, LEADERBOARD_TTL)
+                    leaders = with_user_names(cur, board.top(LEADERBOARD_TOP))
                     
-                    for l in leaders:
-                        if l.get('updated_at'):
-                            l['updated_at'] = l['updated_at'].isoformat()
+                    return {
+                        'statusCode': 200,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'leaderboard': leaders, 'category': category, 'total': len(board.keys)})
+                    }
+            
+            elif action in ('my_rank', 'neighbors'):
+                category = params.get('category', 'total_spent')
+                user_id = int(event.get('headers', {}).get('X-User-Id', 1))
+                with conn.cursor() as cur:
+                    board = get_board(cur, category, LEADERBOARD_TTL)
+                    result = {
+                        'category': category,
+                        'user_id': user_id,
+                        'rank': board.rank(user_id),
+                        'score': board.scores.get(user_id),
+                        'total': len(board.keys)
+                    }
+                    if action == 'neighbors':
+                        radius = min(int(params.get('radius', 5)), MAX_NEIGHBORS_RADIUS)
+                        result['neighbors'] = with_user_names(cur, board.around(user_id, radius))
                     
                     return {
                         'statusCode': 200,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'leaderboard': leaders, 'category': category})
+                        'body': json.dumps(result)
                     }
             
             elif action == 'tournament_details':
@@ -134,12 +185,32 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 tournament_id = body_data['tournament_id']
                 with conn.cursor() as cur:
                     cur.execute("""
-                        INSERT INTO tournament_participants (tournament_id, user_id, score)
-                        VALUES (%s, %s, 0)
-                        ON CONFLICT (tournament_id, user_id) DO NOTHING
-                        RETURNING id
+                        WITH joined AS (
+                            INSERT INTO tournament_participants (tournament_id, user_id, score)
+                            VALUES (%s, %s, 0)
+                            ON CONFLICT (tournament_id, user_id) DO NOTHING
+                            RETURNING tournament_id
+                        ), seat AS (
+                            UPDATE tournaments t
+                            SET participants_count = t.participants_count + 1
+                            FROM joined
+                            WHERE t.id = joined.tournament_id
+                              AND (t.max_participants IS NULL OR t.participants_count < t.max_participants)
+                            RETURNING t.participants_count
+                        )
+                        SELECT (SELECT COUNT(*) FROM joined) AS joined,
+                               (SELECT participants_count FROM seat) AS participants_count
                     """, (tournament_id, user_id))
-                    result = cur.fetchone()
+                    joined, participants_count = cur.fetchone()
+                    
+                    if joined and participants_count is None:
+                        conn.rollback()
+                        return {
+                            'statusCode': 400,
+                            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                            'body': json.dumps({'error': 'Турнир не найден или все места заняты'})
+                        }
+                    
                     conn.commit()
                     
                     return {
@@ -162,6 +233,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         RETURNING score
                     """, (score, tournament_id, user_id))
                     new_score = cur.fetchone()
+                    if new_score:
+                        add_score(cur, 'tournament_points', user_id, int(score))
                     conn.commit()
                     
                     return {
@@ -172,6 +245,53 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                             'new_score': new_score[0] if new_score else 0
                         })
                     }
+            
+            elif action == 'record_purchase':
+                if not is_service_call(event):
+                    return {
+                        'statusCode': 403,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Forbidden'})
+                    }
+                
+                amount = int(round(float(body_data['amount'])))
+                with conn.cursor() as cur:
+                    total_spent = add_score(cur, 'total_spent', int(body_data['user_id']), amount)
+                    conn.commit()
+                    
+                    return {
+                        'statusCode': 200,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'success': True, 'total_spent': total_spent})
+                    }
+            
+            elif action == 'snapshot_ranks':
+                category = body_data.get('category', 'total_spent')
+                if category not in LEADERBOARD_CATEGORIES:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': f"category должна быть одной из: {', '.join(sorted(LEADERBOARD_CATEGORIES))}"})
+                    }
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        UPDATE leaderboard l
+                        SET rank = r.rank
+                        FROM (
+                            SELECT id, ROW_NUMBER() OVER (ORDER BY score DESC, user_id ASC) AS rank
+                            FROM leaderboard
+                            WHERE category = %s
+                        ) r
+                        WHERE l.id = r.id AND l.rank IS DISTINCT FROM r.rank
+                    """, (category,))
+                    updated = cur.rowcount
+                    conn.commit()
+                    
+                    return {
+                        'statusCode': 200,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'success': True, 'category': category, 'updated': updated})
+                    }
         
         return {
             'statusCode': 405,
@@ -180,4 +300,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     finally:
-        conn.close()
+        db.putconn(conn)
@@ -0,0 +1,184 @@
+'''
+In-memory лидерборд: порядковая статистика по очкам в отсортированном
+списке бакетов (как в sortedcontainers), снапшот грузится из таблицы leaderboard.
+Ранг - порядковый номер по (score DESC, user_id ASC), как в snapshot_ranks.
+'''
+
+import time
+from datetime import datetime, timedelta
+from bisect import bisect_left, insort
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+Key = Tuple[int, int]
+
+
+class SortedKeyList:
+    def __init__(self, load: int = 1000):
+        self._load = load
+        self._lists: List[List[Key]] = []
+        self._maxes: List[Key] = []
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def load(self, keys: List[Key]) -> None:
+        keys = sorted(keys)
+        self._lists = [keys[i:i + self._load] for i in range(0, len(keys), self._load)]
+        self._maxes = [lst[-1] for lst in self._lists]
+        self._len = len(keys)
+
+    def add(self, key: Key) -> None:
+        if not self._lists:
+            self._lists.append([key])
+            self._maxes.append(key)
+        else:
+            i = min(bisect_left(self._maxes, key), len(self._maxes) - 1)
+            lst = self._lists[i]
+            insort(lst, key)
+            self._maxes[i] = lst[-1]
+            if len(lst) > 2 * self._load:
+                self._lists.insert(i + 1, lst[self._load:])
+                del lst[self._load:]
+                self._maxes[i] = lst[-1]
+                self._maxes.insert(i + 1, self._lists[i + 1][-1])
+        self._len += 1
+
+    def remove(self, key: Key) -> None:
+        i = bisect_left(self._maxes, key)
+        lst = self._lists[i]
+        del lst[bisect_left(lst, key)]
+        if lst:
+            self._maxes[i] = lst[-1]
+        else:
+            del self._lists[i]
+            del self._maxes[i]
+        self._len -= 1
+
+    def index(self, key: Key) -> int:
+        i = bisect_left(self._maxes, key)
+        return sum(len(lst) for lst in self._lists[:i]) + bisect_left(self._lists[i], key)
+
+    def islice(self, start: int, stop: int) -> Iterator[Key]:
+        start = max(start, 0)
+        for lst in self._lists:
+            if stop <= 0:
+                return
+            if start < len(lst):
+                yield from lst[start:stop]
+            start = max(start - len(lst), 0)
+            stop -= len(lst)
+
+
+class Leaderboard:
+    def __init__(self, category: str, rows: List[Tuple[int, int]], synced_until: Optional[datetime]):
+        self.category = category
+        self.loaded_at = time.monotonic()
+        self.synced_until = synced_until
+        self.scores: Dict[int, int] = {user_id: score for user_id, score in rows}
+        self.keys = SortedKeyList()
+        self.keys.load([(-score, user_id) for user_id, score in self.scores.items()])
+
+    def set_score(self, user_id: int, score: int) -> None:
+        old = self.scores.get(user_id)
+        if old == score:
+            return
+        if old is not None:
+            self.keys.remove((-old, user_id))
+        self.scores[user_id] = score
+        self.keys.add((-score, user_id))
+
+    def rank(self, user_id: int) -> Optional[int]:
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return self.keys.index((-score, user_id)) + 1
+
+    def _entries(self, start: int, stop: int) -> List[Dict[str, Any]]:
+        return [
+            {'rank': start + offset + 1, 'user_id': user_id, 'score': -neg_score}
+            for offset, (neg_score, user_id) in enumerate(self.keys.islice(start, stop))
+        ]
+
+    def top(self, limit: int) -> List[Dict[str, Any]]:
+        return self._entries(0, limit)
+
+    def around(self, user_id: int, radius: int) -> List[Dict[str, Any]]:
+        rank = self.rank(user_id)
+        if rank is None:
+            return []
+        start = max(rank - 1 - radius, 0)
+        return self._entries(start, rank + radius)
+
+
+# Строки, закоммиченные позже, но с более ранним updated_at (длинная транзакция),
+# подхватываются перекрытием окна; повторное применение очков идемпотентно
+SYNC_OVERLAP = timedelta(seconds=60)
+
+_boards: Dict[str, Leaderboard] = {}
+
+
+def get_board(cur: Any, category: str, ttl: float) -> Leaderboard:
+    '''
+    Возвращает лидерборд категории. Полный снапшот читается один раз на процесс,
+    дальше раз в ttl секунд догружаются только строки с updated_at после
+    последней синхронизации (очки пишут и другие инстансы функции).
+    '''
+    board = _boards.get(category)
+    if board is None:
+        cur.execute(
+            'SELECT user_id, score, updated_at FROM leaderboard WHERE category = %s AND user_id IS NOT NULL',
+            (category,)
+        )
+        rows = cur.fetchall()
+        board = Leaderboard(
+            category,
+            [(row[0], row[1] or 0) for row in rows],
+            max((row[2] for row in rows if row[2] is not None), default=None)
+        )
+        _boards[category] = board
+    elif time.monotonic() - board.loaded_at > ttl:
+        sync_board(cur, board)
+    return board
+
+
+def sync_board(cur: Any, board: Leaderboard) -> int:
+    if board.synced_until is None:
+        cur.execute(
+            'SELECT user_id, score, updated_at FROM leaderboard '
+            'WHERE category = %s AND user_id IS NOT NULL AND updated_at IS NOT NULL',
+            (board.category,)
+        )
+    else:
+        cur.execute(
+            'SELECT user_id, score, updated_at FROM leaderboard '
+            'WHERE category = %s AND user_id IS NOT NULL AND updated_at > %s',
+            (board.category, board.synced_until - SYNC_OVERLAP)
+        )
+    rows = cur.fetchall()
+    for user_id, score, updated_at in rows:
+        board.set_score(user_id, score or 0)
+        if board.synced_until is None or updated_at > board.synced_until:
+            board.synced_until = updated_at
+    board.loaded_at = time.monotonic()
+    return len(rows)
+
+
+def add_score(cur: Any, category: str, user_id: int, delta: int) -> int:
+    '''
+    Инкремент очков: пишет в Postgres и применяет итоговое значение к уже
+    загруженному лидерборду; незагруженный подтянет его при первом чтении.
+    '''
+    cur.execute('''
+        INSERT INTO leaderboard (user_id, category, score, updated_at)
+        VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (user_id, category) DO UPDATE
+        SET score = leaderboard.score + EXCLUDED.score,
+            updated_at = CURRENT_TIMESTAMP
+        RETURNING score
+    ''', (user_id, category, delta))
+    score = cur.fetchone()[0]
+    board = _boards.get(category)
+    if board is not None:
+        board.set_score(user_id, score)
+    return score
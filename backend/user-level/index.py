@@ -1,6 +1,5 @@
 import json
-import os
-import psycopg2
+import db
 from typing import Dict, Any
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
@@ -33,9 +32,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'X-User-Id header required'})
         }
     
-    dsn = os.environ.get('DATABASE_URL', '')
-    conn = psycopg2.connect(dsn)
-    conn.autocommit = True
+    conn = db.getconn(autocommit=True)
     cursor = conn.cursor()
     
     try:
@@ -86,7 +83,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             })
         
         cursor.close()
-        conn.close()
+        db.putconn(conn)
         
         result = {
             **level_data,
@@ -108,7 +105,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if cursor:
             cursor.close()
         if conn:
-            conn.close()
+            db.putconn(conn)
         return {
             'statusCode': 500,
             'headers': {'Access-Control-Allow-Origin': '*'},
@@ -0,0 +1,100 @@
+'''
+Замер нагрузки записи last_login: прежний UPDATE на каждое чтение профиля против
+LastLoginBuffer, который сбрасывает накопленное одним UPDATE ... FROM (VALUES ...).
+Чтения имитируются перекошенным потоком входов (часть пользователей заходит часто),
+сброс - раз в --touches-per-flush входов, как если бы столько приходило за flush_interval.
+
+Запуск против тестовой базы (меняет last_login у первых --users пользователей):
+    DATABASE_URL=postgres://... python bench_last_login.py --touches 20000 --users 2000
+'''
+
+import argparse
+import json
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+
+def wal_lsn(cur: Any) -> str:
+    cur.execute('SELECT pg_current_wal_lsn()')
+    return cur.fetchone()[0]
+
+
+def measure(db: Any, run: Callable[[Any], int], touches: int) -> Dict[str, Any]:
+    conn = db.getconn(autocommit=True)
+    try:
+        with conn.cursor() as cur:
+            lsn_before = wal_lsn(cur)
+            started = time.perf_counter()
+            statements = run(cur)
+            elapsed = time.perf_counter() - started
+            cur.execute('SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), %s)', (lsn_before,))
+            wal_bytes = int(cur.fetchone()[0])
+    finally:
+        db.putconn(conn)
+    return {
+        'update_statements': statements,
+        'elapsed_s': round(elapsed, 3),
+        'touches_per_s': round(touches / elapsed, 1),
+        'wal_bytes': wal_bytes
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--touches', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--touches-per-flush', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    import db
+    from last_login import LastLoginBuffer
+
+    conn = db.getconn(autocommit=True)
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT id FROM users ORDER BY id LIMIT %s', (args.users,))
+            user_ids = [row[0] for row in cur.fetchall()]
+    finally:
+        db.putconn(conn)
+    if not user_ids:
+        print('В users нет строк', file=sys.stderr)
+        return 2
+
+    rng = random.Random(args.seed)
+    weights = [1 / (rank + 1) for rank in range(len(user_ids))]
+    stream: List[int] = rng.choices(user_ids, weights=weights, k=args.touches)
+
+    def per_touch(cur: Any) -> int:
+        for user_id in stream:
+            cur.execute('UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = %s', (user_id,))
+        return len(stream)
+
+    # Фоновый поток буфера не должен успеть сработать: сбросы вызываются вручную
+    buffer = LastLoginBuffer(flush_interval=3600)
+
+    def buffered(cur: Any) -> int:
+        for n, user_id in enumerate(stream, 1):
+            buffer.touch(user_id)
+            if n % args.touches_per_flush == 0:
+                buffer.flush()
+        buffer.flush()
+        return buffer.counters['flushes']
+
+    before = measure(db, per_touch, args.touches)
+    after = measure(db, buffered, args.touches)
+    print(json.dumps({
+        'touches': args.touches,
+        'distinct_users': len(set(stream)),
+        'touches_per_flush': args.touches_per_flush,
+        'per_touch_update': before,
+        'buffered_flush': {**after, 'rows_written': buffer.counters['flushed_rows']},
+        'flush_errors': buffer.counters['flush_errors']
+    }, indent=2))
+    return 0 if buffer.counters['flush_errors'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,74 @@
 import json
 import os
+import time
 from typing import Dict, Any
 from datetime import datetime
-import psycopg2
 from psycopg2.extras import RealDictCursor
+import db
+from last_login import LastLoginBuffer
+
+last_logins = LastLoginBuffer(flush_interval=float(os.environ.get('LAST_LOGIN_FLUSH_INTERVAL', 5)))
+
+PROFILE_SQL = '''
+    WITH u AS (
+        SELECT id, email, name, phone, created_at, last_login,
+               is_verified, avatar_url, total_spent, loyalty_points
+        FROM users
+        WHERE email = %s
+    )
+    SELECT u.id, json_build_object(
+        'user', row_to_json(u),
+        'orders', o.items,
+        'subscriptions', s.items,
+        'library', l.items,
+        'stats', json_build_object(
+            'total_orders', o.total,
+            'active_subscriptions', s.active,
+            'games_owned', l.total
+        )
+    )::text AS document
+    FROM u
+    CROSS JOIN LATERAL (
+        SELECT COALESCE(json_agg(x ORDER BY x.created_at DESC), '[]'::json) AS items, COUNT(*) AS total
+        FROM (
+            SELECT o.id, o.order_number, o.status, o.total_amount,
+                   o.discount_amount, o.promo_code, o.payment_method,
+                   o.created_at, o.completed_at,
+                   COALESCE((
+                       SELECT json_agg(json_build_object(
+                           'item_type', oi.item_type,
+                           'item_name', oi.item_name,
+                           'quantity', oi.quantity,
+                           'price', oi.price
+                       ))
+                       FROM order_items oi
+                       WHERE oi.order_id = o.id
+                   ), '[]'::json) AS items
+            FROM orders o
+            WHERE o.user_id = u.id
+        ) x
+    ) o
+    CROSS JOIN LATERAL (
+        SELECT COALESCE(json_agg(x ORDER BY x.is_active DESC, x.end_date DESC), '[]'::json) AS items,
+               COUNT(*) FILTER (WHERE x.is_active) AS active
+        FROM (
+            SELECT id, subscription_name, platform, start_date,
+                   end_date, is_active, auto_renew
+            FROM user_subscriptions
+            WHERE user_id = u.id
+        ) x
+    ) s
+    CROSS JOIN LATERAL (
+        SELECT COALESCE(json_agg(x ORDER BY x.purchase_date DESC), '[]'::json) AS items, COUNT(*) AS total
+        FROM (
+            SELECT id, game_id, game_title, platform,
+                   purchase_date, activation_status, account_email
+            FROM user_library
+            WHERE user_id = u.id
+        ) x
+    ) l
+'''
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -11,6 +76,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     Args: event with httpMethod, queryStringParameters (email)
           context with request_id
     Returns: HTTP response with user profile, orders, subscriptions, library
+             (built by a single query; last_login is written asynchronously)
     '''
     method: str = event.get('httpMethod', 'GET')
     
@@ -34,7 +100,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Database not configured'})
         }
     
-    conn = psycopg2.connect(dsn)
+    conn = db.getconn()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
@@ -42,84 +108,29 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             params = event.get('queryStringParameters') or {}
             email = params.get('email', 'demo@godstore.game')
             
-            cursor.execute('''
-                SELECT id, email, name, phone, created_at, last_login, 
-                       is_verified, avatar_url, total_spent, loyalty_points
-                FROM users
-                WHERE email = %s
-            ''', (email,))
-            
-            user = cursor.fetchone()
+            started = time.perf_counter()
+            cursor.execute(PROFILE_SQL, (email,))
+            row = cursor.fetchone()
+            db_ms = (time.perf_counter() - started) * 1000
             
-            if not user:
+            if not row:
                 return {
                     'statusCode': 404,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                     'body': json.dumps({'error': 'User not found'})
                 }
             
-            user_id = user['id']
-            
-            cursor.execute('''
-                SELECT o.id, o.order_number, o.status, o.total_amount, 
-                       o.discount_amount, o.promo_code, o.payment_method, 
-                       o.created_at, o.completed_at,
-                       json_agg(json_build_object(
-                           'item_type', oi.item_type,
-                           'item_name', oi.item_name,
-                           'quantity', oi.quantity,
-                           'price', oi.price
-                       )) as items
-                FROM orders o
-                LEFT JOIN order_items oi ON o.id = oi.order_id
-                WHERE o.user_id = %s
-                GROUP BY o.id
-                ORDER BY o.created_at DESC
-            ''', (user_id,))
-            
-            orders = cursor.fetchall()
-            
-            cursor.execute('''
-                SELECT id, subscription_name, platform, start_date, 
-                       end_date, is_active, auto_renew
-                FROM user_subscriptions
-                WHERE user_id = %s
-                ORDER BY is_active DESC, end_date DESC
-            ''', (user_id,))
-            
-            subscriptions = cursor.fetchall()
-            
-            cursor.execute('''
-                SELECT id, game_id, game_title, platform, 
-                       purchase_date, activation_status, account_email
-                FROM user_library
-                WHERE user_id = %s
-                ORDER BY purchase_date DESC
-            ''', (user_id,))
-            
-            library = cursor.fetchall()
-            
-            cursor.execute('''
-                UPDATE users
-                SET last_login = CURRENT_TIMESTAMP
-                WHERE id = %s
-            ''', (user_id,))
-            conn.commit()
+            last_logins.touch(row['id'])
             
             return {
                 'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'user': dict(user),
-                    'orders': [dict(o) for o in orders],
-                    'subscriptions': [dict(s) for s in subscriptions],
-                    'library': [dict(l) for l in library],
-                    'stats': {
-                        'total_orders': len(orders),
-                        'active_subscriptions': len([s for s in subscriptions if s['is_active']]),
-                        'games_owned': len(library)
-                    }
-                }, default=str)
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Expose-Headers': 'Server-Timing',
+                    'Server-Timing': f'db;dur={db_ms:.1f}'
+                },
+                'body': row['document']
             }
         
         if method == 'POST':
@@ -175,4 +186,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     finally:
         cursor.close()
-        conn.close()
+        db.putconn(conn)
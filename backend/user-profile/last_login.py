@@ -0,0 +1,79 @@
+'''
+Отложенная запись users.last_login: чтение профиля только отмечает вход в памяти,
+фоновый поток раз в flush_interval секунд пишет накопленное одним UPDATE.
+Повторные заходы пользователя между сбросами схлопываются в одну строку.
+'''
+
+import threading
+import time
+from typing import Any, Dict, Optional
+from psycopg2.extras import execute_values
+import db
+
+FLUSH_SQL = '''
+    UPDATE users u
+    SET last_login = to_timestamp(v.ts)
+    FROM (VALUES %s) AS v(id, ts)
+    WHERE u.id = v.id AND (u.last_login IS NULL OR u.last_login < to_timestamp(v.ts))
+'''
+
+FLUSH_TEMPLATE = '(%s::int, %s::float8)'
+
+
+class LastLoginBuffer:
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._pending: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.counters: Dict[str, int] = {'touches': 0, 'flushed_rows': 0, 'flushes': 0, 'flush_errors': 0}
+
+    def touch(self, user_id: int) -> None:
+        with self._lock:
+            self._pending[user_id] = time.time()
+            self.counters['touches'] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+
+    def flush(self) -> int:
+        '''
+        Пишет накопленные входы; при ошибке возвращает их в буфер (более свежие не затираются).
+        '''
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        conn = None
+        try:
+            conn = db.getconn(autocommit=True)
+            with conn.cursor() as cur:
+                # page_size на весь буфер: весь сброс уходит одним UPDATE за один round trip
+                execute_values(cur, FLUSH_SQL, list(pending.items()),
+                               template=FLUSH_TEMPLATE, page_size=len(pending))
+        except Exception:
+            with self._lock:
+                for user_id, ts in pending.items():
+                    self._pending.setdefault(user_id, ts)
+                self.counters['flush_errors'] += 1
+            return len(pending)
+        finally:
+            if conn is not None:
+                db.putconn(conn)
+        with self._lock:
+            self.counters['flushes'] += 1
+            self.counters['flushed_rows'] += len(pending)
+        return len(pending)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.counters, 'pending': len(self._pending)}
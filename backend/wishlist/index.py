@@ -1,13 +1,50 @@
+import hmac
 import json
 import os
-import psycopg2
+import db
 from typing import Dict, Any
+from sale_notifier import fan_out
+from version_sync import sync_versions
+
+FANOUT_BATCH_SIZE = int(os.environ.get('WISHLIST_FANOUT_BATCH_SIZE', 5000))
+FANOUT_TIME_BUDGET = float(os.environ.get('WISHLIST_FANOUT_TIME_BUDGET', 25))
+VERSION_SYNC_BATCH_SIZE = int(os.environ.get('WISHLIST_VERSION_SYNC_BATCH_SIZE', 100))
+VERSION_SYNC_TIME_BUDGET = float(os.environ.get('WISHLIST_VERSION_SYNC_TIME_BUDGET', 25))
+SERVICE_TOKEN = os.environ.get('SERVICE_TOKEN', '')
+
+
+def wishlist_etag(user_id: str, version: int) -> str:
+    return f'"wl-{user_id}-{version}"'
+
+
+def is_service_call(event: Dict[str, Any]) -> bool:
+    '''
+    Служебный вызов (планировщик рассылки и синхронизации версий): X-Service-Token совпадает с SERVICE_TOKEN.
+    Без настроенного токена служебные действия закрыты.
+    '''
+    headers = event.get('headers') or {}
+    token = headers.get('X-Service-Token') or headers.get('x-service-token') or ''
+    return bool(SERVICE_TOKEN) and hmac.compare_digest(token, SERVICE_TOKEN)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    '''
+    If-None-Match может содержать список тегов через запятую, слабые W/-теги или *.
+    '''
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*' or candidate.removeprefix('W/') == etag:
+            return True
+    return False
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Управление списком желаний пользователя
-    Args: event с httpMethod (GET/POST/DELETE), headers (X-User-Id), body
-    Returns: HTTP response со списком желаний
+    Args: event с httpMethod (GET/POST/DELETE), headers (X-User-Id, If-None-Match), body;
+          POST с action=notify_sales - джоб рассылки уведомлений о скидках (X-Service-Token вместо X-User-Id),
+          POST с action=sync_versions - подъём версий вишлистов по изменённым играм (X-Service-Token)
+    Returns: HTTP response со списком желаний и ETag версии списка (304, если версия не менялась)
     '''
     method: str = event.get('httpMethod', 'GET')
     
@@ -17,12 +54,74 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
         }
     
+    params = event.get('queryStringParameters') or {}
+    
+    if method == 'POST' and params.get('action') == 'sync_versions':
+        if not is_service_call(event):
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Forbidden'})
+            }
+        
+        conn = db.getconn()
+        try:
+            result = sync_versions(conn, VERSION_SYNC_BATCH_SIZE, VERSION_SYNC_TIME_BUDGET)
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'isBase64Encoded': False,
+                'body': json.dumps(result)
+            }
+        except Exception as e:
+            return {
+                'statusCode': 500,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': str(e)})
+            }
+        finally:
+            db.putconn(conn)
+    
+    if method == 'POST' and params.get('action') == 'notify_sales':
+        if not is_service_call(event):
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Forbidden'})
+            }
+        
+        reader = db.getconn()
+        writer = db.getconn(autocommit=True)
+        try:
+            result = fan_out(reader, writer, FANOUT_BATCH_SIZE, FANOUT_TIME_BUDGET)
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'isBase64Encoded': False,
+                'body': json.dumps(result)
+            }
+        except Exception as e:
+            return {
+                'statusCode': 500,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': str(e)})
+            }
+        finally:
+            db.putconn(reader)
+            db.putconn(writer)
+    
     headers = event.get('headers', {})
     user_id = headers.get('x-user-id') or headers.get('X-User-Id')
     
@@ -33,13 +132,35 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'X-User-Id header required'})
         }
     
-    dsn = os.environ.get('DATABASE_URL', '')
-    conn = psycopg2.connect(dsn)
-    conn.autocommit = True
+    conn = db.getconn(autocommit=True)
     cursor = conn.cursor()
     
     try:
         if method == 'GET':
+            # Версию поднимают правки списка сразу, а изменения игр - джоб sync_versions
+            cursor.execute('''
+                SELECT version FROM t_p1573360_game_store_platform.wishlist_versions
+                WHERE user_id = %s
+            ''', (user_id,))
+            version_row = cursor.fetchone()
+            etag = wishlist_etag(user_id, version_row[0] if version_row else 0)
+            cache_headers = {
+                'ETag': etag,
+                'Cache-Control': 'private, no-cache',
+                'Vary': 'X-User-Id',
+                'Access-Control-Expose-Headers': 'ETag'
+            }
+            
+            if_none_match = headers.get('if-none-match') or headers.get('If-None-Match')
+            if if_none_match and etag_matches(if_none_match, etag):
+                cursor.close()
+                db.putconn(conn)
+                return {
+                    'statusCode': 304,
+                    'headers': {'Access-Control-Allow-Origin': '*', **cache_headers},
+                    'body': ''
+                }
+            
             cursor.execute('''
                 SELECT w.id, w.game_id, w.notify_on_sale, w.added_at,
                        g.title, g.price, g.discount, g.platform
@@ -66,13 +187,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 })
             
             cursor.close()
-            conn.close()
+            db.putconn(conn)
             
             return {
                 'statusCode': 200,
                 'headers': {
                     'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
+                    'Access-Control-Allow-Origin': '*',
+                    **cache_headers
                 },
                 'isBase64Encoded': False,
                 'body': json.dumps({'wishlist': wishlist})
@@ -85,7 +207,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             if not game_id:
                 cursor.close()
-                conn.close()
+                db.putconn(conn)
                 return {
                     'statusCode': 400,
                     'headers': {'Access-Control-Allow-Origin': '*'},
@@ -103,7 +225,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             wishlist_id = cursor.fetchone()[0]
             cursor.close()
-            conn.close()
+            db.putconn(conn)
             
             return {
                 'statusCode': 200,
@@ -116,12 +238,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
         
         if method == 'DELETE':
-            params = event.get('queryStringParameters') or {}
             game_id = params.get('game_id')
             
             if not game_id:
                 cursor.close()
-                conn.close()
+                db.putconn(conn)
                 return {
                     'statusCode': 400,
                     'headers': {'Access-Control-Allow-Origin': '*'},
@@ -134,7 +255,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             ''', (user_id, game_id))
             
             cursor.close()
-            conn.close()
+            db.putconn(conn)
             
             return {
                 'statusCode': 200,
@@ -147,7 +268,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
         
         cursor.close()
-        conn.close()
+        db.putconn(conn)
         return {
             'statusCode': 405,
             'headers': {'Access-Control-Allow-Origin': '*'},
@@ -158,7 +279,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if cursor:
             cursor.close()
         if conn:
-            conn.close()
+            db.putconn(conn)
         return {
             'statusCode': 500,
             'headers': {'Access-Control-Allow-Origin': '*'},
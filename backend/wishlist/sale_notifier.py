@@ -0,0 +1,140 @@
+'''
+Рассылка уведомлений о скидках по спискам желаний.
+Текущие price/discount игр сравниваются со снимком в wishlist_sale_state; для игр,
+ставших дешевле, подписчики (notify_on_sale) читаются серверным курсором порциями
+и получают уведомления пакетной вставкой. Дубликаты отсекает уникальный
+(user_id, dedup_key) с ключом sale:<game_id>:<дата> - не больше одного на игру в день.
+Дата фиксируется при старте прогона в wishlist_sale_run и сохраняется до полной рассылки.
+'''
+
+import time
+from decimal import Decimal
+from typing import Any, Dict, List, Tuple
+from psycopg2.extras import execute_values
+
+SCHEMA = 't_p1573360_game_store_platform'
+NOTIFICATION_TYPE = 'game_discount'
+JOB_NAME = 'notify_sales'
+
+# Пустой DO UPDATE нужен для RETURNING: продолжение прогона получает уже сохранённый день
+RUN_DAY_SQL = f'''
+    INSERT INTO {SCHEMA}.wishlist_sale_run (job_name, day)
+    VALUES (%s, CURRENT_DATE)
+    ON CONFLICT (job_name) DO UPDATE SET job_name = EXCLUDED.job_name
+    RETURNING day::text
+'''
+
+CHANGED_GAMES_SQL = f'''
+    SELECT g.id, g.title, g.price, COALESCE(g.discount, 0), s.price, s.discount
+    FROM {SCHEMA}.games g
+    LEFT JOIN {SCHEMA}.wishlist_sale_state s ON s.game_id = g.id
+    WHERE s.game_id IS NULL
+       OR s.price IS DISTINCT FROM g.price
+       OR s.discount IS DISTINCT FROM COALESCE(g.discount, 0)
+'''
+
+SUBSCRIBERS_SQL = f'''
+    SELECT w.user_id, w.game_id
+    FROM {SCHEMA}.wishlist w
+    WHERE w.game_id = ANY(%(game_ids)s)
+      AND w.notify_on_sale
+      AND NOT EXISTS (
+          SELECT 1 FROM {SCHEMA}.notifications n
+          WHERE n.user_id = w.user_id
+            AND n.dedup_key = 'sale:' || w.game_id || ':' || %(day)s
+      )
+    ORDER BY w.game_id, w.user_id
+'''
+
+INSERT_NOTIFICATIONS_SQL = f'''
+    INSERT INTO {SCHEMA}.notifications (user_id, type, title, message, dedup_key)
+    VALUES %s
+    ON CONFLICT (user_id, dedup_key) WHERE dedup_key IS NOT NULL DO NOTHING
+'''
+
+SAVE_STATE_SQL = f'''
+    INSERT INTO {SCHEMA}.wishlist_sale_state (game_id, price, discount, checked_at)
+    VALUES %s
+    ON CONFLICT (game_id) DO UPDATE
+    SET price = EXCLUDED.price, discount = EXCLUDED.discount, checked_at = EXCLUDED.checked_at
+'''
+
+
+def effective_price(price: Any, discount: int) -> Decimal:
+    return (Decimal(price) * (100 - discount) / 100).quantize(Decimal('0.01'))
+
+
+def detect_sales(cur: Any) -> Tuple[Dict[int, Dict[str, Any]], List[Tuple]]:
+    '''
+    Игры, чья цена со скидкой упала с прошлого прогона, и строки для обновления снимка.
+    Игры без снимка (новые) только запоминаются, уведомлений по ним нет.
+    '''
+    sales: Dict[int, Dict[str, Any]] = {}
+    state_rows: List[Tuple] = []
+    cur.execute(CHANGED_GAMES_SQL)
+    for game_id, title, price, discount, old_price, old_discount in cur.fetchall():
+        state_rows.append((game_id, price, discount))
+        if old_price is None:
+            continue
+        old_effective = effective_price(old_price, old_discount)
+        new_effective = effective_price(price, discount)
+        if new_effective < old_effective:
+            sales[game_id] = {
+                'title': f'Скидка на {title}',
+                'message': f'{title}: {new_effective}₽ вместо {old_effective}₽'
+                           + (f' (-{discount}%)' if discount else '')
+            }
+    return sales, state_rows
+
+
+def fan_out(reader: Any, writer: Any, batch_size: int, time_budget: float) -> Dict[str, Any]:
+    '''
+    reader - соединение в транзакции (нужно для именованного курсора), writer - autocommit:
+    каждая порция фиксируется сразу, поэтому прерванный по времени прогон продолжится
+    со следующего вызова с того же места (NOT EXISTS пропускает уже уведомлённых)
+    и с тем же днём в ключах. Снимок цен обновляется только после полной рассылки.
+    '''
+    started = time.monotonic()
+    with writer.cursor() as cur:
+        cur.execute(RUN_DAY_SQL, (JOB_NAME,))
+        day = cur.fetchone()[0]
+        sales, state_rows = detect_sales(cur)
+
+    sent = 0
+    done = True
+    if sales:
+        stream = reader.cursor(name='sale_subscribers')
+        stream.itersize = batch_size
+        try:
+            stream.execute(SUBSCRIBERS_SQL, {'game_ids': list(sales), 'day': day})
+            while True:
+                batch = stream.fetchmany(batch_size)
+                if not batch:
+                    break
+                with writer.cursor() as cur:
+                    execute_values(cur, INSERT_NOTIFICATIONS_SQL, [
+                        (user_id, NOTIFICATION_TYPE, sales[game_id]['title'],
+                         sales[game_id]['message'], f'sale:{game_id}:{day}')
+                        for user_id, game_id in batch
+                    ], page_size=batch_size)
+                    sent += cur.rowcount
+                if time.monotonic() - started > time_budget:
+                    done = False
+                    break
+        finally:
+            stream.close()
+            reader.rollback()
+
+    if done:
+        with writer.cursor() as cur:
+            if state_rows:
+                execute_values(cur, SAVE_STATE_SQL, state_rows,
+                               template='(%s, %s, %s, CURRENT_TIMESTAMP)', page_size=1000)
+            cur.execute(f'DELETE FROM {SCHEMA}.wishlist_sale_run WHERE job_name = %s', (JOB_NAME,))
+
+    return {
+        'changed_games': len(state_rows),
+        'sale_games': len(sales),
+        'notifications_sent': sent,
+        'done': done
+    }
@@ -0,0 +1,56 @@
+'''
+Отложенная инвалидация ETag вишлистов: триггер на games кладёт изменённую игру
+в wishlist_game_changes, а этот джоб порциями поднимает версии всех, у кого игра
+в списке. Каждая порция - своя транзакция; игры берутся FOR UPDATE SKIP LOCKED,
+поэтому параллельные прогоны не пересекаются.
+'''
+
+import time
+from typing import Any, Dict
+
+SCHEMA = 't_p1573360_game_store_platform'
+
+# Повторное изменение игры, пока порция не закоммичена, ждёт её блокировки
+# и после удаления строки снова ставит игру в очередь
+BUMP_BATCH_SQL = f'''
+    WITH batch AS (
+        DELETE FROM {SCHEMA}.wishlist_game_changes
+        WHERE game_id IN (
+            SELECT game_id FROM {SCHEMA}.wishlist_game_changes
+            ORDER BY changed_at
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING game_id
+    ), bumped AS (
+        INSERT INTO {SCHEMA}.wishlist_versions (user_id, version)
+        SELECT DISTINCT w.user_id, 1
+        FROM {SCHEMA}.wishlist w
+        JOIN batch b ON b.game_id = w.game_id
+        ON CONFLICT (user_id) DO UPDATE SET version = wishlist_versions.version + 1
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM batch), (SELECT COUNT(*) FROM bumped)
+'''
+
+
+def sync_versions(conn: Any, batch_size: int, time_budget: float) -> Dict[str, Any]:
+    '''
+    Разбирает очередь изменённых игр порциями по batch_size игр, пока она не опустеет
+    или не кончится time_budget. conn - соединение не в autocommit.
+    '''
+    started = time.monotonic()
+    totals = {'games': 0, 'users_bumped': 0, 'batches': 0}
+    done = False
+    with conn.cursor() as cur:
+        while time.monotonic() - started < time_budget:
+            cur.execute(BUMP_BATCH_SQL, (batch_size,))
+            games, users = cur.fetchone()
+            conn.commit()
+            if not games:
+                done = True
+                break
+            totals['batches'] += 1
+            totals['games'] += games
+            totals['users_bumped'] += users
+    return {**totals, 'done': done, 'elapsed_ms': round((time.monotonic() - started) * 1000, 1)}
@@ -0,0 +1,17 @@
+-- Keyset-пагинация отзывов по (created_at DESC, id DESC)
+UPDATE t_p1573360_game_store_platform.reviews
+SET created_at = CURRENT_TIMESTAMP
+WHERE created_at IS NULL;
+
+ALTER TABLE t_p1573360_game_store_platform.reviews
+ALTER COLUMN created_at SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_reviews_game_created_id
+ON t_p1573360_game_store_platform.reviews(game_id, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_reviews_created_id
+ON t_p1573360_game_store_platform.reviews(created_at DESC, id DESC);
+
+-- Покрываются новыми составными индексами
+DROP INDEX IF EXISTS t_p1573360_game_store_platform.idx_reviews_game_id;
+DROP INDEX IF EXISTS t_p1573360_game_store_platform.idx_reviews_created_at;
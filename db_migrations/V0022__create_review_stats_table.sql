@@ -0,0 +1,31 @@
+-- Предрасчитанные агрегаты отзывов по игре (поддерживаются функциями reviews и review-helpful)
+CREATE TABLE IF NOT EXISTS t_p1573360_game_store_platform.review_stats (
+  game_id INTEGER PRIMARY KEY,
+  review_count INTEGER NOT NULL DEFAULT 0,
+  rating_sum INTEGER NOT NULL DEFAULT 0,
+  rating_1 INTEGER NOT NULL DEFAULT 0,
+  rating_2 INTEGER NOT NULL DEFAULT 0,
+  rating_3 INTEGER NOT NULL DEFAULT 0,
+  rating_4 INTEGER NOT NULL DEFAULT 0,
+  rating_5 INTEGER NOT NULL DEFAULT 0,
+  verified_count INTEGER NOT NULL DEFAULT 0,
+  helpful_total INTEGER NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Заполняем по уже существующим отзывам
+INSERT INTO t_p1573360_game_store_platform.review_stats
+(game_id, review_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5, verified_count, helpful_total)
+SELECT game_id,
+       COUNT(*),
+       SUM(rating),
+       COUNT(*) FILTER (WHERE rating = 1),
+       COUNT(*) FILTER (WHERE rating = 2),
+       COUNT(*) FILTER (WHERE rating = 3),
+       COUNT(*) FILTER (WHERE rating = 4),
+       COUNT(*) FILTER (WHERE rating = 5),
+       COUNT(*) FILTER (WHERE verified_purchase),
+       COALESCE(SUM(helpful_count), 0)
+FROM t_p1573360_game_store_platform.reviews
+GROUP BY game_id
+ON CONFLICT (game_id) DO NOTHING;
@@ -0,0 +1,21 @@
+-- Один пользователь может использовать промокод только один раз:
+-- уникальность нужна для атомарного погашения через INSERT ... ON CONFLICT DO NOTHING
+DELETE FROM promo_code_usage a
+USING promo_code_usage b
+WHERE a.promo_code_id = b.promo_code_id
+  AND a.user_identifier = b.user_identifier
+  AND a.id > b.id;
+
+ALTER TABLE promo_code_usage
+ADD CONSTRAINT uq_promo_usage_code_user UNIQUE (promo_code_id, user_identifier);
+
+-- Приводим счётчик к фактическому числу использований после чистки дублей
+UPDATE promo_codes p
+SET current_uses = u.uses
+FROM (
+    SELECT promo_code_id, COUNT(*) AS uses
+    FROM promo_code_usage
+    GROUP BY promo_code_id
+) u
+WHERE p.id = u.promo_code_id
+  AND p.current_uses <> u.uses;
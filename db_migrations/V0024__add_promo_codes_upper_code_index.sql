@@ -0,0 +1,5 @@
+-- Поиск промокода идёт по UPPER(code): обычный индекс по code для него не используется
+CREATE INDEX IF NOT EXISTS idx_promo_codes_code_upper ON promo_codes (UPPER(code));
+
+-- Точный поиск по code покрывается индексом UNIQUE-ограничения
+DROP INDEX IF EXISTS idx_promo_codes_code;
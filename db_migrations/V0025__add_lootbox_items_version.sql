@@ -0,0 +1,22 @@
+-- Версия состава призов лутбокса: по ней функция lootbox понимает,
+-- что закешированную alias-таблицу нужно перестроить
+ALTER TABLE lootboxes ADD COLUMN IF NOT EXISTS items_version INTEGER NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION bump_lootbox_items_version() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE lootboxes SET items_version = items_version + 1 WHERE id = OLD.lootbox_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND (TG_OP = 'INSERT' OR NEW.lootbox_id IS DISTINCT FROM OLD.lootbox_id) THEN
+        UPDATE lootboxes SET items_version = items_version + 1 WHERE id = NEW.lootbox_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_lootbox_items_version ON lootbox_items;
+CREATE TRIGGER trg_lootbox_items_version
+AFTER INSERT OR UPDATE OR DELETE ON lootbox_items
+FOR EACH ROW EXECUTE FUNCTION bump_lootbox_items_version();
+
+CREATE INDEX IF NOT EXISTS idx_lootbox_items_lootbox ON lootbox_items(lootbox_id);
@@ -0,0 +1,14 @@
+-- Счётчик участников хранится в турнире и обновляется при регистрации,
+-- вместо коррелированного COUNT(*) по tournament_participants на каждую строку списка
+ALTER TABLE tournaments ADD COLUMN IF NOT EXISTS participants_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE tournaments t
+SET participants_count = p.cnt
+FROM (
+    SELECT tournament_id, COUNT(*) AS cnt
+    FROM tournament_participants
+    GROUP BY tournament_id
+) p
+WHERE t.id = p.tournament_id;
+
+CREATE INDEX IF NOT EXISTS idx_tournaments_start_date ON tournaments(start_date DESC);
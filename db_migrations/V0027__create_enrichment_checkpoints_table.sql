@@ -0,0 +1,9 @@
+-- Чекпоинты пакетного обогащения каталога из RAWG: джоб продолжает с last_game_id
+CREATE TABLE IF NOT EXISTS enrichment_checkpoints (
+    job_name VARCHAR(100) PRIMARY KEY,
+    last_game_id INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    enriched INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
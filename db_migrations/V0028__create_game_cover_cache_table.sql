@@ -0,0 +1,7 @@
+-- Кеш ответов RAWG для функции game-covers (второй уровень после LRU в памяти).
+-- payload = NULL означает закешированное "игра не найдена"
+CREATE TABLE IF NOT EXISTS game_cover_cache (
+    title_key VARCHAR(255) PRIMARY KEY,
+    payload JSONB,
+    fetched_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
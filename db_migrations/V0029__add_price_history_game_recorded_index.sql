@@ -0,0 +1,6 @@
+-- Диапазонные запросы графика цен: WHERE game_id = ? AND recorded_at BETWEEN ... ORDER BY recorded_at
+CREATE INDEX IF NOT EXISTS idx_price_history_game_recorded
+  ON t_p1573360_game_store_platform.price_history(game_id, recorded_at);
+
+-- Покрывается составным индексом
+DROP INDEX IF EXISTS t_p1573360_game_store_platform.idx_price_history_game;
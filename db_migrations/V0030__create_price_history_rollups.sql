@@ -0,0 +1,43 @@
+-- Дневные и недельные OHLC-бакеты истории цен; заполняются компакцией price-history (action=compact)
+CREATE TABLE IF NOT EXISTS t_p1573360_game_store_platform.price_history_daily (
+  game_id INTEGER NOT NULL,
+  bucket_start TIMESTAMP NOT NULL,
+  open DECIMAL(10,2) NOT NULL,
+  high DECIMAL(10,2) NOT NULL,
+  low DECIMAL(10,2) NOT NULL,
+  close DECIMAL(10,2) NOT NULL,
+  price_sum DECIMAL(14,2) NOT NULL,
+  samples INTEGER NOT NULL,
+  max_discount INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (game_id, bucket_start)
+);
+
+CREATE TABLE IF NOT EXISTS t_p1573360_game_store_platform.price_history_weekly (
+  game_id INTEGER NOT NULL,
+  bucket_start TIMESTAMP NOT NULL,
+  open DECIMAL(10,2) NOT NULL,
+  high DECIMAL(10,2) NOT NULL,
+  low DECIMAL(10,2) NOT NULL,
+  close DECIMAL(10,2) NOT NULL,
+  price_sum DECIMAL(14,2) NOT NULL,
+  samples INTEGER NOT NULL,
+  max_discount INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (game_id, bucket_start)
+);
+
+-- Докуда свёрнут каждый уровень: всё раньше rolled_until уже лежит в rollup-таблице
+CREATE TABLE IF NOT EXISTS t_p1573360_game_store_platform.price_history_rollup_state (
+  level VARCHAR(10) PRIMARY KEY,
+  rolled_until TIMESTAMP NOT NULL
+);
+
+INSERT INTO t_p1573360_game_store_platform.price_history_rollup_state (level, rolled_until)
+SELECT level, start_at
+FROM (SELECT COALESCE(date_trunc('day', MIN(recorded_at)), date_trunc('day', CURRENT_TIMESTAMP))::timestamp AS day_start
+      FROM t_p1573360_game_store_platform.price_history) m,
+     LATERAL (VALUES ('day', m.day_start), ('week', date_trunc('week', m.day_start))) v(level, start_at)
+ON CONFLICT (level) DO NOTHING;
+
+-- Компакция и удаление по сроку хранения идут по recorded_at без game_id
+CREATE INDEX IF NOT EXISTS idx_price_history_recorded
+  ON t_p1573360_game_store_platform.price_history(recorded_at);
@@ -0,0 +1,25 @@
+-- Снимок цен, с которым джоб wishlist (action=notify_sales) сравнивает текущие цены игр
+CREATE TABLE IF NOT EXISTS t_p1573360_game_store_platform.wishlist_sale_state (
+  game_id INTEGER PRIMARY KEY,
+  price DECIMAL(10,2) NOT NULL,
+  discount INTEGER NOT NULL DEFAULT 0,
+  checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Стартуем с текущих цен, чтобы первый прогон не разослал уведомления по всем играм
+INSERT INTO t_p1573360_game_store_platform.wishlist_sale_state (game_id, price, discount)
+SELECT id, price, COALESCE(discount, 0)
+FROM t_p1573360_game_store_platform.games
+ON CONFLICT (game_id) DO NOTHING;
+
+-- Ключ дедупликации уведомлений: sale:<game_id>:<дата> - одно уведомление на игру в день
+ALTER TABLE t_p1573360_game_store_platform.notifications ADD COLUMN IF NOT EXISTS dedup_key VARCHAR(100);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_notifications_user_dedup
+  ON t_p1573360_game_store_platform.notifications(user_id, dedup_key)
+  WHERE dedup_key IS NOT NULL;
+
+-- Подписчики игры на скидки читаются по game_id в порядке user_id
+CREATE INDEX IF NOT EXISTS idx_wishlist_game_notify
+  ON t_p1573360_game_store_platform.wishlist(game_id, user_id)
+  WHERE notify_on_sale;
@@ -0,0 +1,56 @@
+-- Версия списка желаний пользователя: из неё строится ETag для GET wishlist,
+-- неизменившийся список отдаётся 304 без JOIN с games
+CREATE TABLE IF NOT EXISTS t_p1573360_game_store_platform.wishlist_versions (
+  user_id INTEGER PRIMARY KEY,
+  version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO t_p1573360_game_store_platform.wishlist_versions (user_id, version)
+SELECT DISTINCT user_id, 1
+FROM t_p1573360_game_store_platform.wishlist
+ON CONFLICT (user_id) DO NOTHING;
+
+-- Добавление, удаление и смена notify_on_sale
+CREATE OR REPLACE FUNCTION t_p1573360_game_store_platform.bump_wishlist_version() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO t_p1573360_game_store_platform.wishlist_versions (user_id, version)
+        VALUES (OLD.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = wishlist_versions.version + 1;
+    END IF;
+    IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.user_id IS DISTINCT FROM OLD.user_id) THEN
+        INSERT INTO t_p1573360_game_store_platform.wishlist_versions (user_id, version)
+        VALUES (NEW.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = wishlist_versions.version + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_wishlist_version ON t_p1573360_game_store_platform.wishlist;
+CREATE TRIGGER trg_wishlist_version
+AFTER INSERT OR UPDATE OR DELETE ON t_p1573360_game_store_platform.wishlist
+FOR EACH ROW EXECUTE FUNCTION t_p1573360_game_store_platform.bump_wishlist_version();
+
+-- Изменение отдаваемых полей игры инвалидирует списки всех, у кого она в вишлисте
+CREATE OR REPLACE FUNCTION t_p1573360_game_store_platform.bump_wishlist_versions_for_game() RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE t_p1573360_game_store_platform.wishlist_versions v
+    SET version = v.version + 1
+    FROM t_p1573360_game_store_platform.wishlist w
+    WHERE w.game_id = NEW.id AND v.user_id = w.user_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_games_wishlist_version ON t_p1573360_game_store_platform.games;
+CREATE TRIGGER trg_games_wishlist_version
+AFTER UPDATE OF price, discount, title, platform ON t_p1573360_game_store_platform.games
+FOR EACH ROW
+WHEN (OLD.price IS DISTINCT FROM NEW.price
+   OR OLD.discount IS DISTINCT FROM NEW.discount
+   OR OLD.title IS DISTINCT FROM NEW.title
+   OR OLD.platform IS DISTINCT FROM NEW.platform)
+EXECUTE FUNCTION t_p1573360_game_store_platform.bump_wishlist_versions_for_game();
+
+CREATE INDEX IF NOT EXISTS idx_wishlist_game ON t_p1573360_game_store_platform.wishlist(game_id);
@@ -0,0 +1,30 @@
+-- Журнал начислений кешбэка и бонусов: только INSERT, без горячей строки на пользователя.
+-- user_balance становится снапшотом: в него свёрнуты записи журнала с id <= journal_id
+CREATE TABLE IF NOT EXISTS t_p1573360_game_store_platform.balance_journal (
+  id BIGSERIAL PRIMARY KEY,
+  user_id INTEGER NOT NULL,
+  cashback_delta DECIMAL(10,2) NOT NULL DEFAULT 0,
+  bonus_delta INTEGER NOT NULL DEFAULT 0,
+  source VARCHAR(50) NOT NULL,
+  reference VARCHAR(100),
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_balance_journal_user ON t_p1573360_game_store_platform.balance_journal(user_id, id);
+
+ALTER TABLE t_p1573360_game_store_platform.user_balance ADD COLUMN IF NOT EXISTS journal_id BIGINT NOT NULL DEFAULT 0;
+
+UPDATE t_p1573360_game_store_platform.user_balance SET cashback_balance = 0 WHERE cashback_balance IS NULL;
+UPDATE t_p1573360_game_store_platform.user_balance SET bonus_points = 0 WHERE bonus_points IS NULL;
+ALTER TABLE t_p1573360_game_store_platform.user_balance ALTER COLUMN cashback_balance SET NOT NULL;
+ALTER TABLE t_p1573360_game_store_platform.user_balance ALTER COLUMN bonus_points SET NOT NULL;
+
+-- Докуда журнал свёрнут компактором cashback (action=compact)
+CREATE TABLE IF NOT EXISTS t_p1573360_game_store_platform.balance_journal_state (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  folded_until BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO t_p1573360_game_store_platform.balance_journal_state (id, folded_until)
+VALUES (1, 0)
+ON CONFLICT (id) DO NOTHING;
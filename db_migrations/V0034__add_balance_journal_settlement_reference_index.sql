@@ -0,0 +1,4 @@
+-- Идемпотентность пакетных начислений: один заказ (reference) начисляется в settlement-записях один раз
+CREATE UNIQUE INDEX IF NOT EXISTS uq_balance_journal_settlement_reference
+  ON t_p1573360_game_store_platform.balance_journal(reference)
+  WHERE source = 'settlement' AND reference IS NOT NULL;
@@ -0,0 +1,14 @@
+-- Голоса "полезно": один на пользователя (или IP), копятся здесь и периодически
+-- сбрасываются суммой в reviews.helpful_count вместо UPDATE горячей строки на каждый клик
+CREATE TABLE IF NOT EXISTS t_p1573360_game_store_platform.review_votes (
+  review_id INTEGER NOT NULL REFERENCES t_p1573360_game_store_platform.reviews(id) ON DELETE CASCADE,
+  voter VARCHAR(100) NOT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  flushed_at TIMESTAMP,
+  PRIMARY KEY (review_id, voter)
+);
+
+-- Несброшенные голоса: для счётчика read-your-writes и для сброса
+CREATE INDEX IF NOT EXISTS idx_review_votes_pending
+  ON t_p1573360_game_store_platform.review_votes(review_id)
+  WHERE flushed_at IS NULL;
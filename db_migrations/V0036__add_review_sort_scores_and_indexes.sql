@@ -0,0 +1,57 @@
+-- Голоса "не полезно": нужны для Wilson-оценки сортировки "лучшие"
+ALTER TABLE t_p1573360_game_store_platform.review_votes
+ADD COLUMN IF NOT EXISTS helpful BOOLEAN NOT NULL DEFAULT TRUE;
+
+UPDATE t_p1573360_game_store_platform.reviews
+SET helpful_count = 0
+WHERE helpful_count IS NULL;
+
+ALTER TABLE t_p1573360_game_store_platform.reviews
+ALTER COLUMN helpful_count SET NOT NULL,
+ADD COLUMN IF NOT EXISTS not_helpful_count INTEGER NOT NULL DEFAULT 0,
+ADD COLUMN IF NOT EXISTS wilson_score DOUBLE PRECISION NOT NULL DEFAULT 0;
+
+-- Нижняя граница 95% доверительного интервала Уилсона для доли голосов "полезно"
+CREATE OR REPLACE FUNCTION t_p1573360_game_store_platform.review_wilson_score(up INTEGER, down INTEGER)
+RETURNS DOUBLE PRECISION AS $$
+    SELECT CASE WHEN up + down = 0 THEN 0 ELSE (
+        up::float8 / (up + down) + 1.9208 / (up + down)
+        - 1.96 * sqrt(up::float8 * down / (up + down) + 0.9604) / (up + down)
+    ) / (1 + 3.8416 / (up + down)) END
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Оценка хранится в строке и пересчитывается при сбросе голосов,
+-- поэтому сортировка "лучшие" идёт по индексу, а не по выражению
+CREATE OR REPLACE FUNCTION t_p1573360_game_store_platform.set_review_wilson_score() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.wilson_score := t_p1573360_game_store_platform.review_wilson_score(NEW.helpful_count, NEW.not_helpful_count);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_review_wilson_score ON t_p1573360_game_store_platform.reviews;
+CREATE TRIGGER trg_review_wilson_score
+BEFORE INSERT OR UPDATE OF helpful_count, not_helpful_count ON t_p1573360_game_store_platform.reviews
+FOR EACH ROW EXECUTE FUNCTION t_p1573360_game_store_platform.set_review_wilson_score();
+
+UPDATE t_p1573360_game_store_platform.reviews
+SET wilson_score = t_p1573360_game_store_platform.review_wilson_score(helpful_count, not_helpful_count)
+WHERE helpful_count > 0 OR not_helpful_count > 0;
+
+-- Keyset-пагинация по каждому режиму сортировки внутри игры
+CREATE INDEX IF NOT EXISTS idx_reviews_game_helpful_id
+ON t_p1573360_game_store_platform.reviews(game_id, helpful_count DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_reviews_game_rating_created_id
+ON t_p1573360_game_store_platform.reviews(game_id, rating DESC, created_at DESC, id DESC);
+
+-- "Сначала низкие": -rating DESC сохраняет единое направление ключа для сравнения строк
+CREATE INDEX IF NOT EXISTS idx_reviews_game_neg_rating_created_id
+ON t_p1573360_game_store_platform.reviews(game_id, (-rating) DESC, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_reviews_game_wilson_id
+ON t_p1573360_game_store_platform.reviews(game_id, wilson_score DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_reviews_game_verified_created_id
+ON t_p1573360_game_store_platform.reviews(game_id, created_at DESC, id DESC)
+WHERE verified_purchase;
@@ -0,0 +1,5 @@
+-- Инкрементальная выборка сообщений чата (session_id, id > since_id ORDER BY id)
+CREATE INDEX IF NOT EXISTS idx_chat_messages_session_id_id ON chat_messages(session_id, id);
+
+-- Покрывается новым составным индексом
+DROP INDEX IF EXISTS idx_session_id;
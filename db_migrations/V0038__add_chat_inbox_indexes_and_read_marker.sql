@@ -0,0 +1,26 @@
+-- Последнее прочитанное оператором сообщение: непрочитанные = сообщения клиента с id больше
+ALTER TABLE chat_sessions
+ADD COLUMN IF NOT EXISTS last_read_message_id INTEGER NOT NULL DEFAULT 0;
+
+-- Закрытые сессии считаются прочитанными
+UPDATE chat_sessions s
+SET last_read_message_id = m.max_id
+FROM (SELECT session_id, MAX(id) AS max_id FROM chat_messages GROUP BY session_id) m
+WHERE m.session_id = s.id AND s.status <> 'active';
+
+-- Keyset-пагинация входящих по (updated_at DESC, id DESC)
+UPDATE chat_sessions
+SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)
+WHERE updated_at IS NULL;
+
+ALTER TABLE chat_sessions
+ALTER COLUMN updated_at SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_status_updated_id
+ON chat_sessions(status, updated_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_updated_id
+ON chat_sessions(updated_at DESC, id DESC);
+
+-- Покрывается составным индексом по (status, updated_at, id)
+DROP INDEX IF EXISTS idx_chat_status;
@@ -0,0 +1,21 @@
+-- Архив переписки: сообщения закрытых и неактивных сессий одним gzip-сжатым
+-- JSON-массивом на сессию вместо строк в горячей chat_messages
+CREATE TABLE IF NOT EXISTS chat_archive (
+    session_id INTEGER PRIMARY KEY REFERENCES chat_sessions(id),
+    message_count INTEGER NOT NULL,
+    last_message_id INTEGER NOT NULL,
+    payload BYTEA NOT NULL,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- payload уже сжат: без повторного pglz, хранится в TOAST
+ALTER TABLE chat_archive ALTER COLUMN payload SET STORAGE EXTERNAL;
+
+-- updated_at сессии на момент архивации; более свежий updated_at - в горячей таблице новые сообщения
+ALTER TABLE chat_sessions
+ADD COLUMN IF NOT EXISTS archived_through TIMESTAMP;
+
+-- Кандидаты в архив: старые по updated_at, ещё не заархивированные
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_unarchived_updated
+ON chat_sessions(updated_at)
+WHERE archived_through IS NULL;
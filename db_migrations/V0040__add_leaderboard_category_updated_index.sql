@@ -0,0 +1,3 @@
+-- Инкрементальная догрузка in-memory лидерборда: строки категории, изменённые после последней синхронизации
+CREATE INDEX IF NOT EXISTS idx_leaderboard_category_updated
+ON leaderboard(category, updated_at);
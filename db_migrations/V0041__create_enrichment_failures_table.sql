@@ -0,0 +1,10 @@
+-- Игры, на которых запрос к RAWG упал: чекпоинт уходит дальше, а они повторяются
+-- следующими запусками enrich_all, пока не превысят ENRICH_MAX_ATTEMPTS
+CREATE TABLE IF NOT EXISTS enrichment_failures (
+    job_name VARCHAR(100) NOT NULL,
+    game_id INTEGER NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    last_error TEXT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (job_name, game_id)
+);
@@ -0,0 +1,29 @@
+-- Смена цены игры больше не перебирает всех, у кого она в вишлисте: игра хранит
+-- время изменения отдаваемых полей, а ETag сравнивает его с максимумом по списку
+DROP TRIGGER IF EXISTS trg_games_wishlist_version ON t_p1573360_game_store_platform.games;
+DROP FUNCTION IF EXISTS t_p1573360_game_store_platform.bump_wishlist_versions_for_game();
+
+ALTER TABLE t_p1573360_game_store_platform.games
+ADD COLUMN IF NOT EXISTS listing_changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+-- Обновляется в той же строке BEFORE-триггером: одна запись на игру, без fan-out
+CREATE OR REPLACE FUNCTION t_p1573360_game_store_platform.touch_game_listing() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.listing_changed_at := clock_timestamp();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_games_listing_changed ON t_p1573360_game_store_platform.games;
+CREATE TRIGGER trg_games_listing_changed
+BEFORE UPDATE OF price, discount, title, platform ON t_p1573360_game_store_platform.games
+FOR EACH ROW
+WHEN (OLD.price IS DISTINCT FROM NEW.price
+   OR OLD.discount IS DISTINCT FROM NEW.discount
+   OR OLD.title IS DISTINCT FROM NEW.title
+   OR OLD.platform IS DISTINCT FROM NEW.platform)
+EXECUTE FUNCTION t_p1573360_game_store_platform.touch_game_listing();
+
+-- Максимум по списку пользователя читается index-only сканом по wishlist
+CREATE INDEX IF NOT EXISTS idx_wishlist_user_game
+ON t_p1573360_game_store_platform.wishlist(user_id, game_id);
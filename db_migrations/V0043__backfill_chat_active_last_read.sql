@@ -0,0 +1,11 @@
+-- V0038 оставил активным сессиям last_read_message_id = 0, и вся старая переписка
+-- клиента числилась непрочитанной. Прочитанным считается всё до последнего ответа оператора
+UPDATE chat_sessions s
+SET last_read_message_id = GREATEST(s.last_read_message_id, m.max_id)
+FROM (
+    SELECT session_id, MAX(id) AS max_id
+    FROM chat_messages
+    WHERE sender <> 'user'
+    GROUP BY session_id
+) m
+WHERE m.session_id = s.id AND s.status = 'active' AND s.last_read_message_id < m.max_id;
@@ -0,0 +1,8 @@
+-- Условие частичного индекса из V0039 не следовало из запроса кандидатов
+-- (archived_through IS NULL OR updated_at > archived_through), и планировщик его не брал.
+-- Предикат повторяет условие запроса, включая сессии с новыми сообщениями после архивации
+DROP INDEX IF EXISTS idx_chat_sessions_unarchived_updated;
+
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_unarchived_updated
+ON chat_sessions(updated_at)
+WHERE archived_through IS NULL OR updated_at > archived_through;
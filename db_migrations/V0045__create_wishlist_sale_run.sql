@@ -0,0 +1,8 @@
+-- Незавершённый прогон рассылки о скидках: день, от которого строятся ключи
+-- sale:<game_id>:<дата>. Прогон, продолжившийся после полуночи, берёт день из этой строки
+-- и не рассылает уведомления повторно; строка удаляется после полной рассылки
+CREATE TABLE IF NOT EXISTS t_p1573360_game_store_platform.wishlist_sale_run (
+  job_name VARCHAR(50) PRIMARY KEY,
+  day DATE NOT NULL,
+  started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,35 @@
+-- ETag вишлиста снова строится по одной строке wishlist_versions, без JOIN с games.
+-- Смена цены игры лишь ставит игру в очередь; версии подписчиков поднимает
+-- джоб wishlist (action=sync_versions) порциями, вне транзакции обновления игры
+DROP TRIGGER IF EXISTS trg_games_listing_changed ON t_p1573360_game_store_platform.games;
+DROP FUNCTION IF EXISTS t_p1573360_game_store_platform.touch_game_listing();
+ALTER TABLE t_p1573360_game_store_platform.games DROP COLUMN IF EXISTS listing_changed_at;
+DROP INDEX IF EXISTS t_p1573360_game_store_platform.idx_wishlist_user_game;
+
+-- Одна строка на игру: повторные изменения до прогона джоба схлопываются
+CREATE TABLE IF NOT EXISTS t_p1573360_game_store_platform.wishlist_game_changes (
+  game_id INTEGER PRIMARY KEY,
+  changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_wishlist_game_changes_changed
+ON t_p1573360_game_store_platform.wishlist_game_changes(changed_at);
+
+CREATE OR REPLACE FUNCTION t_p1573360_game_store_platform.queue_wishlist_game_change() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO t_p1573360_game_store_platform.wishlist_game_changes (game_id)
+    VALUES (NEW.id)
+    ON CONFLICT (game_id) DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_games_wishlist_change ON t_p1573360_game_store_platform.games;
+CREATE TRIGGER trg_games_wishlist_change
+AFTER UPDATE OF price, discount, title, platform ON t_p1573360_game_store_platform.games
+FOR EACH ROW
+WHEN (OLD.price IS DISTINCT FROM NEW.price
+   OR OLD.discount IS DISTINCT FROM NEW.discount
+   OR OLD.title IS DISTINCT FROM NEW.title
+   OR OLD.platform IS DISTINCT FROM NEW.platform)
+EXECUTE FUNCTION t_p1573360_game_store_platform.queue_wishlist_game_change();